@@ -29,4 +29,17 @@ def create_app(config_class=Config):
     from app.password import gate_bp
     app.register_blueprint(gate_bp)
 
+    # Comandi CLI (rebuild-rollups, check-rollups)
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Indice in memoria dei giocatori seduti ai tavoli (app/main/seat_index.py)
+    from app.main.seat_index import seat_index
+    with app.app_context():
+        seat_index.rebuild()
+
+    # Stato delle partite in corso in memoria, ricaricato dal DB (app/main/match_engine.py)
+    from app.main.match_engine import match_engine
+    match_engine.init_app(app)
+
     return app
\ No newline at end of file
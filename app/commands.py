@@ -0,0 +1,100 @@
+import click
+from flask.cli import with_appcontext
+
+# ==========================================
+#        COMANDI CLI (flask <comando>)
+# ==========================================
+
+@click.command('rebuild-rollups')
+@click.option('--player-id', type=int, default=None, help="Ricostruisce solo questo giocatore.")
+@with_appcontext
+def rebuild_rollups_command(player_id):
+    """Rigenera le tabelle di aggregazione dalle righe di 'records'."""
+    from app.main.stats_rollup import rebuild_rollups
+    written = rebuild_rollups(player_id)
+    click.echo(f"Rollup ricostruiti: {written} bucket scritti.")
+
+
+@click.command('check-rollups')
+@click.option('--player-id', type=int, default=None, help="Controlla solo questo giocatore.")
+@with_appcontext
+def check_rollups_command(player_id):
+    """Verifica che le tabelle di aggregazione coincidano con 'records'."""
+    from app.main.stats_rollup import check_rollups
+    differences = check_rollups(player_id)
+    if not differences:
+        click.echo("Rollup coerenti con i record.")
+        return
+    for diff in differences:
+        click.echo(diff)
+    click.echo(f"{len(differences)} differenze trovate. Esegui 'flask rebuild-rollups'.")
+    raise SystemExit(1)
+
+
+@click.command('backfill-scores')
+@click.option('--match-id', type=int, default=None, help="Ricalcola solo questa partita.")
+@click.option('--check', is_flag=True, help="Non scrive nulla: controlla solo le differenze.")
+@with_appcontext
+def backfill_scores_command(match_id, check):
+    """Calcola dai record punteggi e tiri per slot salvati sulle partite."""
+    from app.main.scoreboard import backfill_scoreboards, check_scoreboards
+    if check:
+        differences = check_scoreboards()
+        for diff in differences:
+            click.echo(diff)
+        if differences:
+            click.echo(f"{len(differences)} differenze trovate. Esegui 'flask backfill-scores'.")
+            raise SystemExit(1)
+        click.echo("Tabellone coerente con i record.")
+        return
+    updated = backfill_scoreboards(match_id)
+    click.echo(f"Tabellone aggiornato per {updated} partite.")
+
+
+@click.command('check-seats')
+@click.option('--rebuild', is_flag=True, help="Ricostruisce l'indice prima del controllo.")
+@with_appcontext
+def check_seats_command(rebuild):
+    """Verifica che l'indice dei giocatori seduti coincida con le partite attive."""
+    from app.main.seat_index import seat_index
+    if rebuild:
+        seat_index.rebuild()
+    differences = seat_index.check()
+    if not differences:
+        click.echo("Indice dei posti coerente con le partite attive.")
+        return
+    for diff in differences:
+        click.echo(diff)
+    click.echo(f"{len(differences)} differenze trovate.")
+    raise SystemExit(1)
+
+
+@click.command('check-match-events')
+@click.option('--match-id', type=int, default=None, help="Controlla solo questa partita.")
+@with_appcontext
+def check_match_events_command(match_id):
+    """Verifica che il replay del log degli eventi dia lo stato attuale delle partite."""
+    from app.models import ActiveMatch, MatchEvent
+    from app.main.match_engine import match_engine
+    from app.main.match_log import check_match_log
+    query = ActiveMatch.query.filter(ActiveMatch.id.in_(MatchEvent.query.with_entities(MatchEvent.match_id)))
+    if match_id:
+        query = query.filter(ActiveMatch.id == match_id)
+    # Le partite in corso si confrontano con il motore in memoria (la riga può essere indietro)
+    current = {match.id: match_engine.peek(match.id) or match for match in query}
+    differences = check_match_log(current)
+    if not differences:
+        click.echo(f"Log degli eventi coerente con lo stato di {len(current)} partite.")
+        return
+    for diff in differences:
+        click.echo(diff)
+    click.echo(f"{len(differences)} differenze trovate.")
+    raise SystemExit(1)
+
+
+def register_commands(app):
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(check_rollups_command)
+    app.cli.add_command(backfill_scores_command)
+    app.cli.add_command(check_seats_command)
+    app.cli.add_command(check_match_events_command)
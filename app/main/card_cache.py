@@ -0,0 +1,185 @@
+import threading
+from collections import OrderedDict
+from flask import render_template
+from markupsafe import Markup
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import aliased
+from app.models import db, Player, ActiveMatch
+from app.main.scoreboard import MATCH_SLOTS, shots_column
+from app.main.cup_state import cup_count
+from app.main.match_engine import match_engine
+
+# ==========================================
+#     CACHE HTML DELLE CARD DEI TAVOLI (Lobby)
+# ==========================================
+# La lobby (/home) e l'aggiornamento live di home.js mostrano ogni tavolo con
+# includes/single_match_card.html. L'HTML renderizzato viene conservato sotto
+# la chiave (match_id, versione del tavolo, vista): finché il tavolo non
+# cambia, i refresh continui dei telefoni riusano il frammento già pronto.
+# Ogni scrittura che cambia ciò che la card mostra (tiri, slot, stato della
+# partita, gestione manuale, fine partita) chiama invalidate_match_card DOPO
+# il commit. Nomi e icone dei giocatori valgono per tutte le card: chi li
+# modifica svuota la cache con clear_match_cards.
+# La cache vive nel processo, come quella delle statistiche.
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+def card_view_key(match, current_user, busy_players):
+    """
+    Parte della card che dipende da chi guarda: "(Tu)" sul proprio posto e,
+    sui posti liberi, "Siediti" (con il proprio nome) o "Assegna".
+    Un tavolo pieno dove l'utente non è seduto è uguale per tutti: chiave None.
+    """
+    seats = [getattr(match, slot) for slot in MATCH_SLOTS]
+    has_free_seat = any(not seat for seat in seats)
+    if not has_free_seat and current_user not in seats:
+        return None
+    return (current_user, has_free_seat and current_user in busy_players)
+
+
+class MatchCardCache:
+    """LRU dei frammenti HTML, con una versione per tavolo."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._versions = {}
+        self._entries = OrderedDict()   # (match_id, vista) -> (versione, html)
+        self._lock = threading.Lock()
+
+    def version(self, match_id):
+        with self._lock:
+            return self._versions.get(match_id, 0)
+
+    def invalidate(self, *match_ids):
+        """Nuova versione dei tavoli indicati: i frammenti salvati non verranno più usati."""
+        with self._lock:
+            for match_id in set(match_ids):
+                if match_id is None:
+                    continue
+                self._versions[match_id] = self._versions.get(match_id, 0) + 1
+                for key in [k for k in self._entries if k[0] == match_id]:
+                    del self._entries[key]
+
+    def clear(self):
+        """Scarta tutti i frammenti (es. un giocatore ha cambiato nome o icona)."""
+        with self._lock:
+            for match_id, _ in self._entries:
+                self._versions[match_id] = self._versions.get(match_id, 0) + 1
+            self._entries.clear()
+
+    def get(self, match_id, view_key, renderer):
+        """HTML della versione corrente del tavolo, renderizzato con renderer() se manca."""
+        key = (match_id, view_key)
+        with self._lock:
+            version = self._versions.get(match_id, 0)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        # Render fuori dal lock
+        html = renderer()
+        with self._lock:
+            # Se nel frattempo il tavolo è cambiato, non salviamo un frammento già vecchio
+            if self._versions.get(match_id, 0) == version:
+                self._entries[key] = (version, html)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return html
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+match_card_cache = MatchCardCache()
+
+
+def render_match_card(item, players, busy_players, current_user):
+    """
+    Card di un tavolo (item come in matches_data della home: match e punteggi),
+    dalla cache se la versione del tavolo non è cambiata.
+    """
+    match = item['match']
+    view_key = card_view_key(match, current_user, busy_players)
+    return Markup(match_card_cache.get(match.id, view_key, lambda: render_template(
+        'includes/single_match_card.html',
+        m=match,
+        item=item,
+        players=players,
+        busy_players=busy_players,
+        current_user=current_user)))
+
+
+def invalidate_match_card(*match_ids):
+    """Da chiamare DOPO il commit di ogni scrittura che cambia la card dei tavoli indicati."""
+    match_card_cache.invalidate(*match_ids)
+
+
+def clear_match_cards():
+    """Da chiamare DOPO il commit di modifiche a nomi o icone dei giocatori."""
+    match_card_cache.clear()
+
+
+# ==========================================
+#     STATO DI UN SINGOLO TAVOLO (Aggiornamenti live)
+# ==========================================
+
+def load_table(match_id, current_user):
+    """
+    Partita, giocatori seduti e "l'utente è già a un tavolo?" con una sola query
+    (un join per slot + EXISTS sulle partite attive).
+    Restituisce (match, {slot: Player o None}, is_busy) oppure None.
+    """
+    seated = {slot: aliased(Player) for slot in MATCH_SLOTS}
+    busy_match = aliased(ActiveMatch)
+    is_busy = exists().where(busy_match.status != 'finished',
+                             or_(*[getattr(busy_match, slot) == current_user for slot in MATCH_SLOTS]))
+
+    query = db.session.query(ActiveMatch, *seated.values(), is_busy.label('is_busy'))
+    for slot, player in seated.items():
+        query = query.outerjoin(player, player.name == getattr(ActiveMatch, slot))
+    row = query.filter(ActiveMatch.id == match_id).first()
+    if row is None:
+        return None
+    match, *players, busy = row
+    return match, dict(zip(MATCH_SLOTS, players)), bool(current_user) and bool(busy)
+
+
+def render_table_card(match, seated, is_busy, current_user):
+    """Card del tavolo caricato con load_table (stessa cache della home)."""
+    item = {'match': match, 'score_t1': match.score_t1 or 0, 'score_t2': match.score_t2 or 0}
+    # Come nella home: gli account admin non compaiono nella lista giocatori
+    players = [p for p in seated.values() if p is not None and not p.name.lower().startswith('admin')]
+    busy_players = [current_user] if is_busy else []
+    return render_match_card(item, players, busy_players, current_user)
+
+
+def table_state(match, seated):
+    """Stato compatto del tavolo per il JSON di /api/table_state."""
+    # Bicchieri e fase dal motore in memoria (la riga può essere indietro di qualche secondo)
+    state = match_engine.peek(match.id) or match
+    return {
+        'id': match.id,
+        'status': state.status,
+        'mode': state.mode,
+        'score': [match.score_t1 or 0, match.score_t2 or 0],
+        'cups': {
+            't1': cup_count(state.t1_cups),
+            't2': cup_count(state.t2_cups),
+        },
+        'pending': {
+            't1': state.pending_damage_for_t1 or 0,
+            't2': state.pending_damage_for_t2 or 0,
+        },
+        'slots': {
+            slot: {
+                'name': getattr(match, slot),
+                'icon': seated[slot].icon if seated[slot] is not None else None,
+                'shots': getattr(match, shots_column(slot)) or 0,
+            }
+            for slot in MATCH_SLOTS
+        },
+    }
@@ -0,0 +1,198 @@
+import json
+from sqlalchemy import inspect, text
+from app.models import db, ActiveMatch, CUP_DEFINITIONS
+
+# ==========================================
+#     STATO DEI BICCHIERI (Maschere di bit)
+# ==========================================
+# I bicchieri di una squadra sono salvati su ActiveMatch come interi, un bit
+# per bicchiere nell'ordine di CUP_DEFINITIONS[formato della squadra]
+# (format_target_for_t1 / format_target_for_t2): il bit i è il bicchiere i.
+# - t1_cups / t2_cups: bicchieri ancora sul tavolo
+# - t1_pending / t2_pending: bicchieri colpiti in attesa di essere tolti (SCALA)
+# - t1_overkill / t2_overkill: colpi andati a segno senza un bicchiere da
+#   segnare (multihit oltre i bicchieri cliccati): contano come i pendenti
+# Togliere i pendenti è un AND NOT e contare i bicchieri un conteggio di bit:
+# nessun json.loads / json.dumps a ogni tiro. I nomi dei bicchieri servono
+# solo al confine con i client (form del tracker, gestione manuale, JS).
+
+TEAMS = ('t1', 't2')
+
+# Bit di ogni bicchiere, formato per formato
+CUP_BITS = {fmt: {cup: 1 << i for i, cup in enumerate(cups)} for fmt, cups in CUP_DEFINITIONS.items()}
+
+
+def full_mask(format_name):
+    """Tutti i bicchieri del formato."""
+    return (1 << len(CUP_DEFINITIONS.get(format_name, []))) - 1
+
+
+def cup_count(mask):
+    return bin(mask or 0).count('1')
+
+
+def cups_to_mask(format_name, cups):
+    """(maschera, bicchieri non del formato) da una lista di nomi."""
+    bits = CUP_BITS.get(format_name, {})
+    mask = 0
+    unknown = 0
+    for cup in cups:
+        bit = bits.get(cup)
+        if bit is None:
+            unknown += 1
+        else:
+            mask |= bit
+    return mask, unknown
+
+
+def mask_to_cups(format_name, mask):
+    """Nomi dei bicchieri della maschera, nell'ordine del formato."""
+    return [cup for cup, bit in CUP_BITS.get(format_name, {}).items() if mask & bit]
+
+
+# ==========================================
+#     OPERAZIONI SU UNA SQUADRA DELLA PARTITA
+# ==========================================
+
+def team_format(match, team):
+    return getattr(match, f'format_target_for_{team}')
+
+
+def active_cups(match, team):
+    return getattr(match, f'{team}_cups') or 0
+
+
+def pending_cups(match, team):
+    return getattr(match, f'{team}_pending') or 0
+
+
+def overkill_hits(match, team):
+    return getattr(match, f'{team}_overkill') or 0
+
+
+def pending_damage(match, team):
+    """Colpi in attesa contro la squadra: bicchieri pendenti + overkill."""
+    return cup_count(pending_cups(match, team)) + overkill_hits(match, team)
+
+
+def live_cups(match, team):
+    """"Vita reale" della squadra: bicchieri attivi meno i colpi in attesa."""
+    return cup_count(active_cups(match, team)) - pending_damage(match, team)
+
+
+def _set_pending(match, team, mask, overkill):
+    setattr(match, f'{team}_pending', mask)
+    setattr(match, f'{team}_overkill', overkill)
+    setattr(match, f'pending_damage_for_{team}', cup_count(mask) + overkill)
+
+
+def clear_pending(match, team):
+    _set_pending(match, team, 0, 0)
+
+
+def reset_team_cups(match, team, format_name):
+    """Tutti i bicchieri del formato sul tavolo (non tocca i pendenti)."""
+    setattr(match, f'{team}_cups', full_mask(format_name))
+
+
+def clear_team(match, team):
+    """Squadra senza bicchieri né colpi in attesa."""
+    setattr(match, f'{team}_cups', 0)
+    clear_pending(match, team)
+
+
+def set_team_cups(match, team, cups):
+    """Bicchieri attivi da una lista di nomi (gestione manuale), nel formato della squadra."""
+    mask, _ = cups_to_mask(team_format(match, team), cups)
+    setattr(match, f'{team}_cups', mask)
+
+
+def add_hits(match, team, cups, potency):
+    """
+    Segna come pendenti fino a `potency` bicchieri della lista (nell'ordine,
+    saltando quelli già pendenti); i colpi senza bicchiere diventano overkill.
+    """
+    bits = CUP_BITS.get(team_format(match, team), {})
+    pending = pending_cups(match, team)
+    overkill = overkill_hits(match, team)
+    hits = 0
+    for cup in cups:
+        if hits >= potency:
+            break
+        bit = bits.get(cup)
+        if bit is None:
+            # Bicchiere che non è del formato: vale come colpo senza bicchiere
+            overkill += 1
+            hits += 1
+        elif not pending & bit:
+            pending |= bit
+            hits += 1
+    overkill += potency - hits
+    _set_pending(match, team, pending, overkill)
+
+
+def apply_pending(match, team):
+    """Toglie dal tavolo i bicchieri pendenti della squadra. False se non c'era nulla da togliere."""
+    if not pending_cups(match, team) and not overkill_hits(match, team):
+        return False
+    setattr(match, f'{team}_cups', active_cups(match, team) & ~pending_cups(match, team))
+    clear_pending(match, team)
+    return True
+
+
+def team_cups_view(match, team):
+    """Bicchieri della squadra per i client: nomi attivi e pendenti, overkill e formato."""
+    fmt = team_format(match, team)
+    return {
+        'active': mask_to_cups(fmt, active_cups(match, team)),
+        'pending': mask_to_cups(fmt, pending_cups(match, team)),
+        'overkill': overkill_hits(match, team),
+        'format': fmt,
+    }
+
+
+# ==========================================
+#     MIGRAZIONE DALLE VECCHIE COLONNE JSON
+# ==========================================
+# Prima delle maschere lo stato era salvato come testo JSON in t1_cup_state,
+# t2_cup_state, t1_pending_list e t2_pending_list (i colpi senza bicchiere
+# come stringhe "Overkill_<timestamp>_<n>"). Le colonne restano nei DB
+# esistenti ma non vengono più lette né scritte dopo la migrazione.
+
+LEGACY_COLUMNS = ('t1_cup_state', 't2_cup_state', 't1_pending_list', 't2_pending_list')
+
+
+def _json_list(value):
+    try:
+        data = json.loads(value) if value else []
+        return data if isinstance(data, list) else []
+    except (TypeError, ValueError):
+        return []
+
+
+def backfill_cup_masks():
+    """
+    Compila le colonne a maschera dalle vecchie colonne JSON (se il DB le ha).
+    Restituisce il numero di partite convertite.
+    """
+    present = {c['name'] for c in inspect(db.engine).get_columns(ActiveMatch.__tablename__)}
+    if not set(LEGACY_COLUMNS) <= present:
+        return 0
+
+    rows = db.session.execute(text(
+        "SELECT id, format_target_for_t1, format_target_for_t2, "
+        "t1_cup_state, t2_cup_state, t1_pending_list, t2_pending_list FROM active_matches")).all()
+    for row in rows:
+        values = {}
+        for team in TEAMS:
+            fmt = getattr(row, f'format_target_for_{team}')
+            active, dropped = cups_to_mask(fmt, _json_list(getattr(row, f'{team}_cup_state')))
+            if dropped:
+                print(f"Partita {row.id}: {dropped} bicchieri di {team} non appartengono al formato {fmt}, ignorati.")
+            # Pendenti non del formato (compresi i vecchi "Overkill_...") -> overkill
+            pending, overkill = cups_to_mask(fmt, _json_list(getattr(row, f'{team}_pending_list')))
+            values.update({f'{team}_cups': active, f'{team}_pending': pending, f'{team}_overkill': overkill,
+                           f'pending_damage_for_{team}': cup_count(pending) + overkill})
+        db.session.execute(ActiveMatch.__table__.update().where(ActiveMatch.id == row.id).values(**values))
+    db.session.commit()
+    return len(rows)
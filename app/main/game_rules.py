@@ -0,0 +1,191 @@
+from app.main.cup_state import live_cups, add_hits, apply_pending, reset_team_cups, clear_pending, clear_team
+
+# ==========================================
+#     REGOLE DEL GIOCO (Senza effetti collaterali)
+# ==========================================
+# Le transizioni dello stato di una partita: tiri, danni pendenti, cambio
+# formato, redemption, ribaltone, overtime e fine partita. Lavorano solo
+# sugli attributi dello stato (una riga ActiveMatch o una LiveMatch del motore
+# in memoria): niente DB, sessione o SocketIO. Le rotte (routes.py) aggiungono
+# gli effetti (Win/Loss sui tiri, animazioni, commit) e il log degli eventi
+# (match_log.py) le riapplica identiche per ricostruire lo stato.
+
+# Esiti di advance_game che richiedono effetti fuori dallo stato
+FINISHED = 'finished'
+OVERTIME = 'overtime'
+
+
+def other_team(team):
+    return 't2' if team == 't1' else 't1'
+
+
+def apply_pending_damage(match, target_team):
+    """
+    Applica i danni pendenti rimuovendo i bicchieri dalla lista attiva.
+    """
+    if not match: return
+
+    # --- LOGICA CORRETTA ---
+    # Dobbiamo capire se 'target_team' è la squadra che sta cercando di salvarsi (Redemption)
+    # o se è la squadra che sta vincendo.
+
+    # Se siamo in Redemption:
+    if match.status.startswith('redemption'):
+        redeeming_team = 't1' if match.status == 'redemption_t1' else 't2'
+
+        # Se stiamo cercando di applicare danni alla squadra che sta VINCENDO (l'avversario di chi redime),
+        # ALLORA ci fermiamo. Perché quei colpi sono i tiri di salvezza, e non devono sparire visivamente
+        # finché non vediamo se il pareggio riesce.
+        if target_team != redeeming_team:
+            return
+
+        # SE INVECE target_team == redeeming_team (chi sta perdendo),
+        # significa che ci sono ancora dei pending vecchi che devono essere rimossi
+        # (es. l'ultimo colpo che li ha mandati in redemption).
+        # Quindi lasciamo che il codice prosegua e li rimuova.
+
+    # --- FINE LOGICA CORRETTA ---
+
+    # Rimuove i bicchieri pendenti (e azzera gli overkill)
+    apply_pending(match, target_team)
+
+
+def change_format(match, team, format_name, changed_by):
+    """La squadra `changed_by` cambia il formato dei bicchieri di `team` (tutti di nuovo sul tavolo)."""
+    setattr(match, f'format_target_for_{team}', format_name)
+    reset_team_cups(match, team, format_name)
+    setattr(match, f'{changed_by}_format_changed', True)
+
+
+def apply_shot(match, team, result, hits, potency):
+    """
+    Tiro di `team`: prima toglie i bicchieri già colpiti alla squadra che tira,
+    poi (se Centro) segna come pendenti sull'avversario fino a `potency`
+    bicchieri di `hits`, e aggiorna i contatori della redemption.
+    """
+    # Applica eventuali danni precedenti
+    apply_pending_damage(match, team)
+
+    redeeming_team = None
+    if match.status.startswith('redemption'):
+        redeeming_team = 't1' if match.status == 'redemption_t1' else 't2'
+
+    if result == 'Centro':
+        # Bicchieri rossi in attesa sull'avversario (fino alla potenza del tiro);
+        # i colpi che restano senza bicchiere diventano overkill
+        add_hits(match, other_team(team), hits, potency)
+        if team == redeeming_team:
+            match.redemption_hits += potency
+
+    # Decremento tiri in redemption
+    if team == redeeming_team:
+        match.redemption_shots_left -= 1
+
+
+def reset_for_overtime(match):
+    """Stato di inizio Overtime: un Singolo Centrale a testa, nessun colpo in attesa."""
+    match.status = 'running'
+    match.mode = 'overtime'  # Fondamentale
+
+    match.format_target_for_t1 = "Singolo Centrale" # O "Triangolo Piccolo", come preferisci
+    match.format_target_for_t2 = "Singolo Centrale"
+
+    # Reset bicchieri (il Singolo dell'overtime) e colpi in attesa
+    for team in ('t1', 't2'):
+        reset_team_cups(match, team, "Singolo Centrale")
+        clear_pending(match, team)
+    match.redemption_hits = 0
+    match.redemption_shots_left = 0
+    match.t1_format_changed = True
+    match.t2_format_changed = True
+
+
+def finish(match, winner, now):
+    match.status = 'finished'
+    match.end_time = now
+    match.winning_team = winner
+
+
+def advance_game(match, now):
+    """
+    Gestisce le regole di vittoria, sconfitta, overtime e ribaltone.
+    Calcola lo stato includendo i danni pendenti per una reattività immediata.
+    Restituisce FINISHED, OVERTIME o None (now = ora di fine se la partita finisce).
+    """
+    if not match: return None
+    if match.status == 'finished': return None
+
+    try:
+        # --- CALCOLO "VITA REALE" (Attivi - Colpiti in attesa) ---
+        # Questo è il trucco: sottraiamo i pendenti (colpi andati a segno ma non
+        # ancora "tolti") per vedere se la squadra è "morta"
+        t1_live_count = live_cups(match, 't1')
+        t2_live_count = live_cups(match, 't2')
+
+        # Aggiorna contatori interi per query veloci (opzionale, per visualizzazione)
+        match.cups_target_for_t1 = t1_live_count
+        match.cups_target_for_t2 = t2_live_count
+
+        # 1. LOGICA DELLA FASE NORMALE
+        if match.status == 'running':
+            # Se T1 finisce i bicchieri (contando anche quelli appena colpiti)
+            if t1_live_count <= 0:
+                match.status = 'redemption_t1'
+                rimasti_avv = t2_live_count
+                match.redemption_shots_left = 2 if rimasti_avv == 1 else rimasti_avv
+                match.redemption_hits = 0
+
+            elif t2_live_count <= 0:
+                match.status = 'redemption_t2'
+                rimasti_avv = t1_live_count
+                match.redemption_shots_left = 2 if rimasti_avv == 1 else rimasti_avv
+                match.redemption_hits = 0
+
+        # 2. LOGICA DELLA FASE REDEMPTION
+        elif match.status.startswith('redemption'):
+            redeeming_team = 't1' if match.status == 'redemption_t1' else 't2'
+            opponent_team = 't2' if redeeming_team == 't1' else 't1'
+
+            # Recuperiamo i bicchieri della squadra che sta redimendo (quella a 0 o -1)
+            redeeming_team_cups = t1_live_count if redeeming_team == 't1' else t2_live_count
+
+            # Recuperiamo i bicchieri dell'avversario (il target da pareggiare)
+            target_balance = t2_live_count if redeeming_team == 't1' else t1_live_count
+
+            # --- [NUOVO] CHECK VITTORIA IMMEDIATA(Prima era in "running", ma ora "redemption" si attiva subito, quindi
+            # è stato spostato qua
+            if redeeming_team_cups <= -1:
+                finish(match, opponent_team, now)
+                return FINISHED
+
+            # --- A. CONTROLLO VITTORIA SCHIACCIANTE (< -1) ---
+            if target_balance < -1:
+                finish(match, redeeming_team, now)
+                return FINISHED
+
+            # --- B. CONTROLLO TIRI FINITI ---
+            # Solo se ho finito i tiri controllo il risultato
+            if match.redemption_shots_left <= 0:
+
+                # Caso Pareggio -> OVERTIME
+                if target_balance == 0:
+                    reset_for_overtime(match)
+                    return OVERTIME
+
+                # Caso Perso
+                elif target_balance > 0:
+                    finish(match, opponent_team, now)
+                    return FINISHED
+
+                # Caso Ribaltone (-1 esatto)
+                elif target_balance == -1:
+                   match.status = f'redemption_{opponent_team}'
+                   match.redemption_shots_left = 2
+                   match.redemption_hits = 0
+                   # Reset immediato delle liste dell'altra squadra
+                   # Qui puliamo tutto perché inizia un nuovo "turno" di redenzione inversa
+                   clear_team(match, opponent_team)
+
+    except Exception as e:
+        print(f"Errore update_game_state: {e}")
+    return None
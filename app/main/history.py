@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+from app.models import db, ActiveMatch
+from app.main.seat_index import seated_filter
+
+# ==========================================
+#     STORICO PARTITE FINITE (Lobby)
+# ==========================================
+# Le partite finite vengono raggruppate per sfida (ActiveMatch.matchup_key,
+# le rivincite hanno la stessa chiave) e mostrate con il punteggio salvato
+# sulla partita (score_t1 / score_t2): una sola query, già ordinata da SQLite
+# per sfida e ora di fine, qualunque sia il numero di rivincite.
+
+HISTORY_HOURS = 24
+
+# Colonne che servono al pannello dello storico (niente stato dei bicchieri)
+HISTORY_COLUMNS = (
+    ActiveMatch.id, ActiveMatch.matchup_key, ActiveMatch.end_time, ActiveMatch.winning_team,
+    ActiveMatch.score_t1, ActiveMatch.score_t2,
+    ActiveMatch.t1_p1, ActiveMatch.t1_p2, ActiveMatch.t2_p1, ActiveMatch.t2_p2,
+)
+
+
+def history_entry(row):
+    """Riga dello storico come la usa il template (obj = la riga della partita)."""
+    return {
+        'obj': row,
+        't1_score': row.score_t1 or 0,
+        't2_score': row.score_t2 or 0,
+        'winner': row.winning_team if row.winning_team else 'draw',
+        'time_ago': row.end_time.strftime("%H:%M") if row.end_time else "--:--",
+    }
+
+
+def get_recent_history(hours=HISTORY_HOURS, now=None):
+    """
+    Partite finite nelle ultime `hours` ore raggruppate per sfida:
+    {matchup_key: [partite dalla più recente]}, sfide in ordine alfabetico.
+    """
+    since = (now or datetime.now()) - timedelta(hours=hours)
+    rows = db.session.query(*HISTORY_COLUMNS)\
+        .filter(ActiveMatch.status == 'finished', ActiveMatch.end_time >= since)\
+        .order_by(ActiveMatch.matchup_key.asc(), ActiveMatch.end_time.desc(), ActiveMatch.id.asc())\
+        .all()
+    return {key: [history_entry(row) for row in group]
+            for key, group in groupby(rows, key=lambda row: row.matchup_key)}
+
+
+# ==========================================
+#     ARCHIVIO (Paginazione keyset)
+# ==========================================
+# Tutte le partite finite, dalla più recente, a pagine di `limite` righe.
+# Invece di OFFSET (che rilegge tutte le righe delle pagine precedenti) ogni
+# pagina parte dalla chiave (end_time, id) dell'ultima riga della precedente:
+# l'indice su end_time porta SQLite direttamente al punto giusto, quindi il
+# costo di una pagina non cresce con i mesi di storico.
+# Il cursore è la stringa "<end_time ISO>_<id>" restituita come 'next'.
+
+ARCHIVE_PAGE_SIZE = 20
+MAX_ARCHIVE_PAGE_SIZE = 100
+
+
+def encode_cursor(row):
+    return f"{row.end_time.isoformat()}_{row.id}"
+
+
+def decode_cursor(text):
+    """(end_time, id) dal cursore, None se manca o non è valido."""
+    if not text:
+        return None
+    try:
+        end_time, match_id = text.rsplit('_', 1)
+        return datetime.fromisoformat(end_time), int(match_id)
+    except ValueError:
+        return None
+
+
+def get_archive_page(player_name=None, matchup=None, cursor=None, limit=ARCHIVE_PAGE_SIZE):
+    """
+    Una pagina dell'archivio: (righe, cursore della pagina successiva o None).
+    player_name: solo le partite in cui era seduto; matchup: solo quella sfida (matchup_key).
+    cursor: valore restituito da decode_cursor (None = prima pagina).
+    """
+    limit = max(1, min(limit, MAX_ARCHIVE_PAGE_SIZE))
+    query = db.session.query(*HISTORY_COLUMNS)\
+        .filter(ActiveMatch.status == 'finished', ActiveMatch.end_time.isnot(None))
+    if player_name:
+        query = query.filter(seated_filter(player_name))
+    if matchup:
+        query = query.filter(ActiveMatch.matchup_key == matchup)
+    if cursor is not None:
+        end_time, match_id = cursor
+        query = query.filter((ActiveMatch.end_time < end_time) |
+                             ((ActiveMatch.end_time == end_time) & (ActiveMatch.id < match_id)))
+
+    # Una riga in più ci dice se esiste una pagina successiva
+    rows = query.order_by(ActiveMatch.end_time.desc(), ActiveMatch.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def archive_entry(row):
+    """Riga dell'archivio per il template: come lo storico, con la data completa."""
+    entry = history_entry(row)
+    entry['date'] = row.end_time.strftime("%d/%m/%Y %H:%M")
+    return entry
+
+
+def archive_entry_json(row):
+    """Riga dell'archivio per l'API JSON."""
+    return {
+        'id': row.id,
+        'end_time': row.end_time.isoformat(),
+        'matchup': row.matchup_key,
+        't1': [p for p in (row.t1_p1, row.t1_p2) if p],
+        't2': [p for p in (row.t2_p1, row.t2_p2) if p],
+        'score': [row.score_t1 or 0, row.score_t2 or 0],
+        'winner': row.winning_team,
+    }
@@ -0,0 +1,116 @@
+import time
+from flask import session
+from flask_socketio import join_room
+from app import socketio
+from app.main.scoreboard import MATCH_SLOTS, shots_column
+from app.main.card_cache import match_card_cache
+from app.main.cup_state import TEAMS, team_cups_view
+from app.main.match_engine import match_engine
+
+# ==========================================
+#     AGGIORNAMENTI LIVE (SocketIO)
+# ==========================================
+# L'evento 'partita_aggiornata' porta lo stato del tavolo appena cambiato,
+# non solo il suo id: bicchieri attivi, pendenti e overkill delle squadre, stato,
+# redemption, punteggio, tiri per slot e (dopo un tiro) la riga del tiro.
+# Tracker (logic.js) e lobby (home.js) aggiornano la pagina con questi dati
+# senza ricaricarla né richiamare il server.
+# 'version' è la versione del tavolo della cache delle card (cresce a ogni
+# modifica): i client scartano gli eventi più vecchi di quello già applicato.
+# La cache riparte da zero a ogni avvio del processo: la versione ha davanti
+# l'istante dell'avvio, così resta crescente anche dopo un riavvio e un
+# tracker aperto prima non scarta gli eventi nuovi. Alla riconnessione i
+# client ripartono comunque da zero.
+#
+# Ogni evento va solo a chi guarda quel tavolo (stanza "match:<id>", i
+# tracker) e alla lobby (stanza "lobby", home.js): appena connessi i client
+# chiedono di entrare nella loro stanza con 'segui_tavolo' / 'segui_lobby'.
+# Un tiro raggiunge quindi i telefoni di quel tavolo e della lobby, non tutti
+# i tracker aperti nel locale.
+
+LOBBY_ROOM = 'lobby'
+
+# Prefisso delle versioni: secondi dell'avvio x VERSION_STEP (sotto 2^53, intero esatto in JS)
+BOOT_EPOCH = int(time.time())
+VERSION_STEP = 1_000_000
+
+
+def match_room(match_id):
+    return f'match:{match_id}'
+
+
+def shot_row(record, player_name):
+    """Riga di un tiro per i client (stessi campi dello storico del tracker)."""
+    if record.centro == 'Sì':
+        esito = 'Centro'
+    elif record.bordo == 'Sì':
+        esito = 'Bordo'
+    else:
+        esito = 'Miss'
+    return {
+        'id': record.id,
+        'player': player_name,
+        'shot_number': record.shot_number,
+        'esito': esito,
+        'colpiti': record.bicchiere_colpito,
+        'multipli': record.bicchieri_multipli,
+        'salvezza': record.tiro_salvezza == 'Sì',
+        'ora': record.timestamp.strftime("%H:%M") if record.timestamp else None,
+    }
+
+
+def match_delta(match, record=None, player_name=None):
+    """Stato del tavolo da inviare con 'partita_aggiornata' (dopo il commit)."""
+    # Stato di gioco dal motore in memoria (la riga può essere indietro di qualche secondo)
+    state = match_engine.peek(match.id) or match
+    return {
+        'match_id': match.id,
+        'version': match_version(match.id),
+        'status': state.status,
+        'mode': state.mode or 'standard',
+        'redemption_shots_left': state.redemption_shots_left,
+        'cups': {team: team_cups_view(state, team) for team in TEAMS},
+        'score': [match.score_t1 or 0, match.score_t2 or 0],
+        'slots': {slot: getattr(match, slot) for slot in MATCH_SLOTS},
+        'shots': {slot: getattr(match, shots_column(slot)) or 0 for slot in MATCH_SLOTS},
+        'record': shot_row(record, player_name) if record is not None else None,
+    }
+
+
+def match_version(match_id):
+    """Versione corrente del tavolo (quella che il tracker riceve al caricamento)."""
+    return BOOT_EPOCH * VERSION_STEP + match_card_cache.version(match_id)
+
+
+def emit_match_update(match, record=None, player_name=None):
+    """
+    Invia 'partita_aggiornata' con lo stato del tavolo ai tracker di quel tavolo e alla lobby.
+    Da chiamare DOPO commit e invalidazione della card.
+    """
+    socketio.emit('partita_aggiornata', match_delta(match, record, player_name),
+                  to=[match_room(match.id), LOBBY_ROOM])
+
+
+# ==========================================
+#     STANZE (Eventi dei client)
+# ==========================================
+# I client rimandano la richiesta a ogni (ri)connessione: dopo una
+# riconnessione Socket.IO la stanza va scelta di nuovo.
+# Come per le pagine, serve aver superato il gate del sito.
+
+@socketio.on('segui_lobby')
+def on_follow_lobby():
+    if not session.get('site_access_granted'):
+        return
+    join_room(LOBBY_ROOM)
+
+
+@socketio.on('segui_tavolo')
+def on_follow_match(data):
+    if not session.get('site_access_granted'):
+        return
+    try:
+        match_id = int((data or {}).get('match_id'))
+    except (TypeError, ValueError, AttributeError):
+        return
+    join_room(match_room(match_id))
@@ -0,0 +1,327 @@
+import atexit
+import threading
+from sqlalchemy import func, event
+from app import socketio
+from app.models import db, ActiveMatch
+from app.main.scoreboard import MATCH_SLOTS
+
+# ==========================================
+#     STATO DELLE PARTITE IN MEMORIA
+# ==========================================
+# Lo stato di gioco delle partite non finite (fase, bicchieri, pendenti,
+# redemption, formati) vive nel processo come oggetti LiveMatch: il motore
+# ne è la copia autorevole e active_matches quella salvata.
+# Le rotte che giocano (add_record, force_update) prendono una copia privata
+# con checkout(), ci applicano tiri, danni pendenti, redemption e
+# overtime con le regole di game_rules.py (gli attributi hanno gli stessi nomi
+# delle colonne) e la consegnano con save():
+# - se cambia la fase (status o mode: redemption, overtime, fine partita) lo
+#   stato è scritto SUBITO, nella transazione della richiesta;
+# - altrimenti la partita è segnata da salvare e un task in background la
+#   scrive ogni MATCH_STATE_WRITE_BEHIND secondi (0 = sempre subito).
+# Il tiro non riscrive quindi la riga della partita: solo record e tabellone.
+# save() prepara lo stato nella sessione della richiesta: le altre richieste
+# lo vedono solo dopo il commit (se il commit fallisce il motore resta com'era).
+# Ogni scrittura porta la revisione dello stato (state_rev) ed è condizionata
+# a "revisione nel DB più vecchia": l'ordine dei commit non conta.
+# All'avvio (create_app) recover() ricarica le partite dal DB. La riga può
+# essere indietro fino a MATCH_STATE_WRITE_BEHIND secondi, ma ogni modifica
+# dello stato ha il suo evento in match_events, salvato nella stessa
+# transazione (match_log.py): recover() riapplica il log e, se lo stato che ne
+# esce è diverso dalla riga, usa quello e riscrive subito la riga. Dopo un
+# crash non si perde quindi nessun tiro confermato. Chi scrive lo stato sulla
+# riga (gestione manuale) la prende prima con release(); chi elimina un tavolo
+# chiama discard() dopo il commit.
+
+# Colonne dello stato di gioco (status e mode per primi: sono la "fase")
+STATE_FIELDS = (
+    'status', 'mode', 'winning_team', 'end_time',
+    'redemption_shots_left', 'redemption_hits',
+    'format_target_for_t1', 'format_target_for_t2', 't1_format_changed', 't2_format_changed',
+    't1_cups', 't2_cups', 't1_pending', 't2_pending', 't1_overkill', 't2_overkill',
+    'cups_target_for_t1', 'cups_target_for_t2', 'pending_damage_for_t1', 'pending_damage_for_t2',
+)
+PHASE_FIELDS = 2
+
+DEFAULT_WRITE_BEHIND = 2.0
+
+# Chiavi in session.info: stati preparati da save() e partite tolte con release(),
+# in attesa dell'esito della transazione
+STAGED_KEY = 'match_engine_staged'
+RELEASED_KEY = 'match_engine_released'
+
+
+class LiveMatch:
+    """Stato di gioco di una partita (più id e posti, letti dalla riga della partita)."""
+
+    __slots__ = ('id',) + MATCH_SLOTS + STATE_FIELDS + ('rev', 'saved')
+
+    @classmethod
+    def from_row(cls, match):
+        state = cls()
+        state.id = match.id
+        for name in MATCH_SLOTS + STATE_FIELDS:
+            setattr(state, name, getattr(match, name))
+        state.rev = match.state_rev or 0
+        state.saved = state.values()
+        return state
+
+    def values(self):
+        return tuple(getattr(self, name) for name in STATE_FIELDS)
+
+    def copy(self):
+        other = LiveMatch()
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+
+def write_state(session, match_id, rev, values):
+    """UPDATE dello stato di una partita, solo se nel DB c'è una revisione più vecchia."""
+    session.execute(ActiveMatch.__table__.update()
+                    .where(ActiveMatch.id == match_id, func.coalesce(ActiveMatch.state_rev, 0) < rev)
+                    .values(state_rev=rev, **dict(zip(STATE_FIELDS, values))))
+
+
+class MatchStateEngine:
+
+    def __init__(self):
+        self._matches = {}    # match_id -> LiveMatch
+        self._revs = {}       # match_id -> ultima revisione assegnata da save()
+        self._dirty = set()   # partite da scrivere in background
+        self._lock = threading.Lock()
+        self._app = None
+        self._writer = None
+        self.write_behind = DEFAULT_WRITE_BEHIND
+
+    def init_app(self, app):
+        """Configura il motore e ricarica le partite in corso dal DB (ripresa dopo un crash)."""
+        self._app = app
+        self.write_behind = app.config.get('MATCH_STATE_WRITE_BEHIND', DEFAULT_WRITE_BEHIND)
+        with app.app_context():
+            self.recover()
+        atexit.register(self._flush_at_exit)
+
+    def recover(self):
+        """
+        Ricostruisce lo stato di tutte le partite non finite: dalla riga, oppure
+        dal replay del log se la riga è rimasta indietro (scrittura in background
+        non ancora fatta al momento del crash). Le righe indietro sono riscritte subito.
+        """
+        from app.main.match_log import state_at  # match_log importa LiveMatch da qui
+
+        matches = ActiveMatch.query.filter(ActiveMatch.status != 'finished').all()
+        recovered = {}
+        behind = []
+        dirty = set()
+        for match in matches:
+            state = LiveMatch.from_row(match)
+            replayed = state_at(match.id)
+            if replayed is not None and replayed.values() != state.values():
+                for name in STATE_FIELDS:
+                    setattr(state, name, getattr(replayed, name))
+                state.rev += 1
+                state.saved = state.values()
+                behind.append(state)
+            if state.status != 'finished':
+                recovered[match.id] = state
+
+        if behind:
+            try:
+                for state in behind:
+                    write_state(db.session, state.id, state.rev, state.values())
+                db.session.commit()
+                print(f"Ripresa: stato di {len(behind)} partite ricostruito dal log degli eventi.")
+            except Exception as e:
+                db.session.rollback()
+                print(f"Errore salvataggio stato partite: {e}")
+                # Lo stato buono resta in memoria: lo scrive il task in background
+                dirty = {state.id for state in behind if state.id in recovered}
+        with self._lock:
+            self._matches = recovered
+            self._revs = {}
+            self._dirty = dirty
+        if dirty:
+            self._start_writer()
+        return len(matches)
+
+    def checkout(self, match):
+        """Copia privata dello stato della partita (match = riga già caricata dalla rotta)."""
+        with self._lock:
+            live = self._matches.get(match.id)
+            # Partita nuova o scaricata dal motore: lo stato del DB è quello buono
+            # (entra nel motore con il primo save confermato)
+            state = live.copy() if live is not None else LiveMatch.from_row(match)
+        # I posti sono della riga (assegnazioni e cambi nome non passano dal motore)
+        for slot in MATCH_SLOTS:
+            setattr(state, slot, getattr(match, slot))
+        return state
+
+    def peek(self, match_id):
+        """Stato vivo della partita in sola lettura (None se il motore non la tiene)."""
+        with self._lock:
+            return self._matches.get(match_id)
+
+    def save(self, state):
+        """
+        Prepara `state` (preso con checkout) come nuovo stato vivo della partita:
+        diventa visibile al commit della sessione, un rollback lo scarta.
+        Se cambia la fase lo scrive nella sessione della richiesta (il commit è del chiamante),
+        altrimenti lo lascia al salvataggio in background. False se non è cambiato nulla.
+        """
+        values = state.values()
+        if values == state.saved:
+            return False
+
+        with self._lock:
+            live = self._matches.get(state.id)
+            # Revisioni sempre crescenti anche tra richieste non ancora confermate
+            state.rev = max(state.rev, live.rev if live is not None else 0, self._revs.get(state.id, 0)) + 1
+            self._revs[state.id] = state.rev
+        sync = (self.write_behind <= 0 or values[:PHASE_FIELDS] != state.saved[:PHASE_FIELDS]
+                or state.status == 'finished')
+        state.saved = values
+        db.session.info.setdefault(STAGED_KEY, []).append((state.copy(), sync))
+
+        if sync:
+            write_state(db.session, state.id, state.rev, values)
+        return True
+
+    def _publish(self, staged):
+        """Rende vivi gli stati preparati da save() in una transazione confermata."""
+        start_writer = False
+        with self._lock:
+            for state, sync in staged:
+                live = self._matches.get(state.id)
+                if live is not None and live.rev > state.rev:
+                    # Due richieste sulla stessa partita: vale l'ultima, come con le righe del DB
+                    print(f"Partita {state.id}: stato modificato da un'altra richiesta, vale l'ultima modifica.")
+                    continue
+                if state.status == 'finished':
+                    # Le partite finite si leggono dal DB
+                    self._matches.pop(state.id, None)
+                    self._revs.pop(state.id, None)
+                else:
+                    self._matches[state.id] = state
+                if sync:
+                    self._dirty.discard(state.id)
+                elif state.status != 'finished':
+                    self._dirty.add(state.id)
+                    start_writer = True
+        if start_writer:
+            self._start_writer()
+
+    def _restore(self, released):
+        """Transazione annullata: le partite tolte con release() tornano com'erano."""
+        with self._lock:
+            for match_id, live in released:
+                if live is not None and match_id not in self._matches:
+                    self._matches[match_id] = live
+                    self._dirty.add(match_id)
+
+    def apply_to(self, match):
+        """Copia sulla riga `match` lo stato vivo della partita (senza salvarlo)."""
+        live = self.peek(match.id)
+        if live is not None:
+            for name in STATE_FIELDS:
+                setattr(match, name, getattr(live, name))
+        return match
+
+    def release(self, match):
+        """
+        Toglie la partita dal motore prima di una scrittura fatta sulla riga (gestione manuale):
+        la riga riceve lo stato vivo e una revisione più nuova di ogni salvataggio in corso.
+        """
+        with self._lock:
+            live = self._matches.pop(match.id, None)
+            rev = max(live.rev if live is not None else 0, self._revs.pop(match.id, 0))
+            self._dirty.discard(match.id)
+        db.session.info.setdefault(RELEASED_KEY, []).append((match.id, live))
+        if live is not None:
+            for name in STATE_FIELDS:
+                setattr(match, name, getattr(live, name))
+        match.state_rev = max(match.state_rev or 0, rev) + 1
+
+    def discard(self, match_id):
+        """Dimentica una partita (scritta o eliminata fuori dal motore): verrà ricaricata dal DB."""
+        with self._lock:
+            self._matches.pop(match_id, None)
+            self._revs.pop(match_id, None)
+            self._dirty.discard(match_id)
+
+    def pending_writes(self):
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self, *match_ids):
+        """
+        Scrive subito le partite in attesa (tutte, o solo quelle indicate) con un commit.
+        Restituisce il numero di partite scritte.
+        """
+        with self._lock:
+            ids = self._dirty & set(match_ids) if match_ids else set(self._dirty)
+            batch = [(live.id, live.rev, live.values())
+                     for live in (self._matches.get(match_id) for match_id in ids) if live is not None]
+            self._dirty -= ids
+        if not batch:
+            return 0
+
+        try:
+            for match_id, rev, values in batch:
+                write_state(db.session, match_id, rev, values)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Errore salvataggio stato partite: {e}")
+            # Riproviamo al prossimo giro
+            with self._lock:
+                self._dirty.update(match_id for match_id, _, _ in batch if match_id in self._matches)
+            return 0
+        return len(batch)
+
+    # --- Salvataggio in background ---
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is not None or self._app is None:
+                return
+            self._writer = socketio.start_background_task(self._run_writer)
+
+    def _run_writer(self):
+        while True:
+            socketio.sleep(self.write_behind)
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"Errore salvataggio stato partite: {e}")
+
+    def _flush_at_exit(self):
+        if self._app is None or not self.pending_writes():
+            return
+        with self._app.app_context():
+            self.flush()
+
+
+match_engine = MatchStateEngine()
+
+
+# --- Esito delle transazioni (tutte le sessioni di db.session) ---
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_staged(session):
+    session.info.pop(RELEASED_KEY, None)
+    staged = session.info.pop(STAGED_KEY, None)
+    if staged:
+        match_engine._publish(staged)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _drop_staged(session, transaction):
+    # Dopo un commit le liste sono già vuote: qui restano solo quelle di un rollback
+    if transaction.parent is not None:
+        return
+    session.info.pop(STAGED_KEY, None)
+    released = session.info.pop(RELEASED_KEY, None)
+    if released:
+        match_engine._restore(released)
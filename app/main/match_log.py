@@ -0,0 +1,206 @@
+import json
+import threading
+from datetime import datetime
+from sqlalchemy import func
+from app.models import db, MatchEvent, MatchSnapshot
+from app.main.match_engine import LiveMatch, STATE_FIELDS
+from app.main.game_rules import apply_shot, apply_pending_damage, change_format, advance_game
+
+# ==========================================
+#     LOG DEGLI EVENTI DELLE PARTITE
+# ==========================================
+# Ogni cosa che cambia lo stato di gioco di una partita aggiunge una riga a
+# match_events (seq = 1, 2, 3... per partita), nella stessa transazione della
+# modifica. Le righe non vengono mai modificate: un tiro cancellato aggiunge
+# un evento 'undo'. Tipi di evento e dati (payload JSON):
+# - start:    partita creata              {stato completo}
+# - shot:     tiro (record_id = il tiro)  {team, result, hits, potency}
+# - format:   cambio formato              {team, format, by}
+# - force:    danni applicati a mano      {team}
+# - update:   un passo delle regole dopo l'evento prima (transizioni a catena)
+# - overtime: inizio dell'overtime (lo stato lo ha già cambiato l'evento prima)
+# - manual:   gestione manuale            {stato completo}
+# - undo:     annulla un tiro             {seq dell'evento annullato}
+# Ogni SNAPSHOT_EVERY eventi (e dopo start, manual, undo e il primo evento
+# registrato della partita) lo stato risultante è fotografato in
+# match_snapshots. Lo stato dopo qualunque evento si ricostruisce dalla
+# fotografia più vicina riapplicando al più SNAPSHOT_EVERY eventi con le
+# stesse regole del gioco (game_rules.py): annullare l'ultimo tiro, rivedere
+# una partita finita o ricalcolarla senza un tiro non rilegge i record.
+
+SNAPSHOT_EVERY = 20
+
+# Eventi il cui stato non si ricava da quello precedente: sempre fotografati
+SNAPSHOT_KINDS = ('start', 'manual', 'undo')
+
+
+def state_dict(state):
+    """Campi dello stato di gioco (match_engine.STATE_FIELDS) come dizionario JSON."""
+    data = {name: getattr(state, name) for name in STATE_FIELDS}
+    if data['end_time'] is not None:
+        data['end_time'] = data['end_time'].isoformat()
+    return data
+
+
+def load_state(data, state):
+    """Copia su `state` i campi di un dizionario fatto da state_dict."""
+    for name in STATE_FIELDS:
+        value = data.get(name)
+        if name == 'end_time' and value:
+            value = datetime.fromisoformat(value)
+        setattr(state, name, value)
+    return state
+
+
+# --- Ultimo seq e ultima fotografia di ogni partita ---
+# In memoria come le altre cache, letti dal DB alla prima scrittura della partita.
+
+_heads = {}   # match_id -> [ultimo seq, seq dell'ultima fotografia o None]
+_heads_lock = threading.Lock()
+
+
+def _head(match_id):
+    with _heads_lock:
+        head = _heads.get(match_id)
+    if head is None:
+        last_seq = db.session.query(func.max(MatchEvent.seq)).filter(MatchEvent.match_id == match_id).scalar()
+        last_snapshot = db.session.query(func.max(MatchSnapshot.seq))\
+            .filter(MatchSnapshot.match_id == match_id).scalar()
+        with _heads_lock:
+            head = _heads.setdefault(match_id, [last_seq or 0, last_snapshot])
+    return head
+
+
+def log_event(state, kind, payload=None, record=None, timestamp=None):
+    """
+    Aggiunge alla sessione l'evento `kind` della partita `state` (il commit è del chiamante).
+    state è lo stato DOPO l'evento: viene fotografato quando serve.
+    """
+    head = _head(state.id)
+    with _heads_lock:
+        head[0] += 1
+        seq = head[0]
+        snapshot = kind in SNAPSHOT_KINDS or head[1] is None or seq - head[1] >= SNAPSHOT_EVERY
+        if snapshot:
+            head[1] = seq
+
+    event = MatchEvent(match_id=state.id, seq=seq, kind=kind, timestamp=timestamp or datetime.now(),
+                       record=record, payload=json.dumps(payload) if payload is not None else None)
+    db.session.add(event)
+    if snapshot:
+        db.session.add(MatchSnapshot(match_id=state.id, seq=seq, state=json.dumps(state_dict(state))))
+    return event
+
+
+def drop_match_log(match_id):
+    """Cancella eventi e fotografie di una partita eliminata (il commit è del chiamante)."""
+    MatchEvent.query.filter_by(match_id=match_id).delete()
+    MatchSnapshot.query.filter_by(match_id=match_id).delete()
+    with _heads_lock:
+        _heads.pop(match_id, None)
+
+
+# ==========================================
+#     REPLAY
+# ==========================================
+
+def apply_event(state, event):
+    """Riapplica un evento allo stato (le stesse regole usate dalle rotte)."""
+    data = json.loads(event.payload) if event.payload else {}
+    if event.kind == 'shot':
+        apply_shot(state, data['team'], data['result'], data['hits'], data['potency'])
+        advance_game(state, event.timestamp)
+    elif event.kind == 'format':
+        change_format(state, data['team'], data['format'], data['by'])
+    elif event.kind == 'force':
+        apply_pending_damage(state, data['team'])
+        advance_game(state, event.timestamp)
+    elif event.kind == 'update':
+        advance_game(state, event.timestamp)
+    elif event.kind in ('start', 'manual'):
+        load_state(data, state)
+    # 'overtime' non cambia nulla; gli 'undo' li gestisce state_at
+
+
+def state_at(match_id, seq=None, undo=None, from_first=False):
+    """
+    Stato della partita (una LiveMatch) dopo l'evento `seq` (None = l'ultimo),
+    oppure None se il log non arriva fin lì.
+    undo: seq di un evento da considerare annullato (per calcolare un 'undo').
+    from_first: riparte dalla prima fotografia invece che dalla più vicina
+    (controllo: il replay completo deve dare lo stesso stato).
+    """
+    if seq is None:
+        seq = _head(match_id)[0]
+        if not seq:
+            return None
+
+    # Eventi annullati entro seq: {seq dell'undo: seq dell'evento annullato}
+    undos = {event.seq: json.loads(event.payload)['seq'] for event in MatchEvent.query.filter(
+        MatchEvent.match_id == match_id, MatchEvent.kind == 'undo', MatchEvent.seq <= seq)}
+    if undo is not None:
+        undos[seq + 1] = undo
+
+    # Fotografia di partenza: non deve contenere un evento annullato DOPO di essa
+    limit = seq
+    while True:
+        query = MatchSnapshot.query.filter(MatchSnapshot.match_id == match_id, MatchSnapshot.seq <= limit)
+        snapshot = query.order_by(MatchSnapshot.seq.asc() if from_first else MatchSnapshot.seq.desc()).first()
+        if snapshot is None:
+            return None
+        undone_later = [target for undo_seq, target in undos.items() if target <= snapshot.seq < undo_seq]
+        if not undone_later:
+            break
+        limit = min(undone_later) - 1
+
+    undone = set(undos.values())
+    state = load_state(json.loads(snapshot.state), LiveMatch())
+    state.id = match_id
+    events = MatchEvent.query.filter(MatchEvent.match_id == match_id, MatchEvent.seq > snapshot.seq,
+                                     MatchEvent.seq <= seq).order_by(MatchEvent.seq)
+    for event in events:
+        if event.kind != 'undo' and event.seq not in undone:
+            apply_event(state, event)
+    return state
+
+
+def undo_event(event):
+    """
+    Annulla un evento (il tiro di delete_record): registra un 'undo' e restituisce
+    lo stato ricalcolato senza l'evento (gli eventi successivi vengono riapplicati),
+    oppure None se il log non ha lo stato precedente o l'evento è già annullato.
+    Il commit è del chiamante.
+    """
+    already = MatchEvent.query.filter(MatchEvent.match_id == event.match_id, MatchEvent.kind == 'undo',
+                                      MatchEvent.payload == json.dumps({'seq': event.seq})).first()
+    if already is not None:
+        return None
+    state = state_at(event.match_id, undo=event.seq)
+    if state is None:
+        return None
+    log_event(state, 'undo', {'seq': event.seq})
+    return state
+
+
+def replay_match(match_id):
+    """Tutti gli eventi della partita con lo stato dopo ciascuno: [(evento, LiveMatch)]."""
+    events = MatchEvent.query.filter_by(match_id=match_id).order_by(MatchEvent.seq).all()
+    return [(event, state_at(match_id, event.seq)) for event in events]
+
+
+def check_match_log(current_states):
+    """
+    Confronta lo stato delle partite con il replay completo del loro log.
+    current_states: {match_id: stato attuale}. Restituisce le differenze (lista di stringhe).
+    """
+    differences = []
+    for match_id, current in current_states.items():
+        replayed = state_at(match_id, from_first=True)
+        if replayed is None:
+            continue
+        expected = state_dict(current)
+        actual = state_dict(replayed)
+        for name in STATE_FIELDS:
+            if expected[name] != actual[name]:
+                differences.append(f"Partita {match_id}: {name} {expected[name]!r}, replay {actual[name]!r}")
+    return differences
@@ -1,10 +1,18 @@
 from flask import render_template, flash, redirect, url_for, request, session, jsonify
 from app.models import ActiveMatch, db, CUP_DEFINITIONS, Player, PlayerRecord
 from app.main import bp
+from app.main.stats_rollup import RollupChange
+from app.main.scoreboard import ScoreboardChange
+from app.main.stats_cache import bump_stats_version
+from app.main.card_cache import (invalidate_match_card, clear_match_cards,
+                                 load_table, render_table_card, table_state)
+from app.main.seat_index import seat_index, find_player_match, sync_match_seats
+from app.main.cup_state import team_cups_view, set_team_cups, clear_pending
+from app.main.match_engine import match_engine
+from app.main.match_log import log_event, state_dict
 from datetime import datetime
 from sqlalchemy import func
 from werkzeug.security import generate_password_hash
-import json
 from app import socketio
 
 
@@ -16,15 +24,8 @@ def team_mode(player_name):
     current_user_obj = Player.query.get(current_user_id)
     is_super_admin = current_user_obj.is_admin if current_user_obj else False
 
-    match = None
-    team = None
-    
-    all_active = ActiveMatch.query.filter(ActiveMatch.status != 'finished').all()
-    for m in all_active:
-        if player_name in [m.t1_p1, m.t1_p2]:
-            match = m; team = 't1'; break
-        if player_name in [m.t2_p1, m.t2_p2]:
-            match = m; team = 't2'; break
+    # Partita attiva e squadra dall'indice dei posti (nessuna scansione dei tavoli)
+    match, team = find_player_match(player_name)
     
     if not match:
         flash("Nessuna partita attiva trovata.", "warning")
@@ -52,30 +53,41 @@ def team_mode(player_name):
 
     return render_template('team_view.html', p1=p1, p2=p2, match_id=match.id)
 
-# Aggiungi questa rotta nel tuo routes.py
+# --- STATO DI UN TAVOLO PER GLI AGGIORNAMENTI LIVE DELLA HOME ---
+# home.js, a ogni 'partita_aggiornata', chiede solo il tavolo cambiato.
+# Entrambe le rotte leggono partita, giocatori seduti e "sono già in gioco?"
+# con una sola query (load_table).
+
 @bp.route('/api/render_table/<int:match_id>')
 def api_render_table(match_id):
-    # 1. Recupera la partita e i dati necessari
-    match = ActiveMatch.query.get_or_404(match_id)
-    
-    # Recupera gli stessi dati che usi nella home (punteggi, giocatori, ecc.)
-    # Esempio semplificato (adatta al tuo contesto):
-    score_t1 = sum(1 for h in match.hits if h.team == 't1')
-    score_t2 = sum(1 for h in match.hits if h.team == 't2')
-    all_players = Player.query.all()
-    
-    # 2. Renderizza SOLO il pezzetto di HTML relativo a un tavolo.
-    # TRUCCO: Creiamo un template 'parziale' o usiamo una macro/stringa.
-    # La soluzione più pulita è creare un file `_table_card.html` con il codice del tavolo
-    # e usarlo sia nella home che qui.
-    
-    # Per ora, restituiamo un template che contiene SOLO il div .match-card
-    return render_template('includes/single_match_card.html', 
-                           m=match, 
-                           item={'match': match, 'score_t1': score_t1, 'score_t2': score_t2},
-                           players=all_players,
-                           busy_players=get_busy_players_set(), # La tua funzione per chi è occupato
-                           current_user=session.get('player_name'))
+    """Frammento HTML della card del tavolo (204 se la partita è finita)."""
+    if 'player_id' not in session:
+        return jsonify({"error": "Devi effettuare il login."}), 401
+
+    current_user = session.get('player_name')
+    table = load_table(match_id, current_user)
+    if table is None:
+        return jsonify({"error": "Tavolo non trovato."}), 404
+
+    match, seated, is_busy = table
+    # Le partite finite escono dai tavoli attivi: la home toglie la card
+    if match.status == 'finished':
+        return '', 204
+    return render_table_card(match, seated, is_busy, current_user)
+
+
+@bp.route('/api/table_state/<int:match_id>')
+def api_table_state(match_id):
+    """Stato compatto del tavolo in JSON: giocatori, bicchieri, punteggio e tiri per slot."""
+    if 'player_id' not in session:
+        return jsonify({"error": "Devi effettuare il login."}), 401
+
+    table = load_table(match_id, session.get('player_name'))
+    if table is None:
+        return jsonify({"error": "Tavolo non trovato."}), 404
+
+    match, seated, _ = table
+    return jsonify(table_state(match, seated))
 
 # --- ROTTE PER GESTIONE MANUALE ---
 
@@ -83,19 +95,22 @@ def api_render_table(match_id):
 def manual_override(match_id):
     """Mostra la pagina di gestione manuale"""
     match = ActiveMatch.query.get_or_404(match_id)
+    # Stato vivo della partita (il motore in memoria può essere avanti rispetto al DB):
+    # copiato sulla riga staccata dalla sessione, così la pagina non scrive nulla
+    db.session.expunge(match)
+    match_engine.apply_to(match)
     
     # Decodifica lo stato dei bicchieri per il template
-    try: match.active_cups_t1_list = json.loads(match.t1_cup_state)
-    except: match.active_cups_t1_list = []
-    
-    try: match.active_cups_t2_list = json.loads(match.t2_cup_state)
-    except: match.active_cups_t2_list = []
+    match.active_cups_t1_list = team_cups_view(match, 't1')['active']
+    match.active_cups_t2_list = team_cups_view(match, 't2')['active']
     
     return render_template('manuale.html', match=match, cup_definitions=CUP_DEFINITIONS)
 
 @bp.route('/match/<int:match_id>/manual/post', methods=['POST'])
 def manual_override_post(match_id):
     match = ActiveMatch.query.get_or_404(match_id)
+    # La partita esce dal motore in memoria: da qui lo stato si scrive sulla riga
+    match_engine.release(match)
     
     # 1. Recupera i Formati scelti
     new_format_t1 = request.form.get('t1_format')
@@ -108,18 +123,16 @@ def manual_override_post(match_id):
     new_status = request.form.get('match_status')
     redemption_shots = int(request.form.get('redemption_shots', 0))
 
-    # 3. Aggiorna Database
-    match.t1_cup_state = json.dumps(selected_cups_t1)
-    match.t2_cup_state = json.dumps(selected_cups_t2)
-    
+    # 3. Aggiorna Database (prima i formati: i bicchieri sono bit del formato della squadra)
     if new_format_t1: match.format_target_for_t1 = new_format_t1
     if new_format_t2: match.format_target_for_t2 = new_format_t2
+
+    set_team_cups(match, 't1', selected_cups_t1)
+    set_team_cups(match, 't2', selected_cups_t2)
     
     # Reset Pending per evitare conflitti
-    match.t1_pending_list = '[]'
-    match.t2_pending_list = '[]'
-    match.pending_damage_for_t1 = 0
-    match.pending_damage_for_t2 = 0
+    clear_pending(match, 't1')
+    clear_pending(match, 't2')
 
     # Gestione Stato
     if new_status == 'overtime':
@@ -139,7 +152,23 @@ def manual_override_post(match_id):
     if 'redemption' in str(new_status) or 'overtime' in str(new_status):
         match.redemption_shots_left = redemption_shots
 
+    # Nel log della partita lo stato impostato a mano (il replay riparte da qui)
+    log_event(match, 'manual', state_dict(match))
+    # Le regole (redemption, fine partita, overtime) partono da qui, non dalla vista del tracker:
+    # la partita torna nel motore con lo stato appena impostato
+    state = None
+    if match.status != 'finished':
+        from app.main.routes import settle_game_state
+        state = match_engine.checkout(match)
+        settle_game_state(state, datetime.now())
+        match_engine.save(state)
     db.session.commit()
+    invalidate_match_card(match.id)
+    sync_match_seats(match)
+    if state is not None and state.status == 'finished':
+        # Finita dalle regole: i tiri hanno ora Win/Loss
+        from app.main.routes import after_game_commit
+        after_game_commit(state)
     flash("Configurazione salvata con successo!", "success")
     
     # CORREZIONE IMPORTANTE: Reindirizza a 'home', non 'select_player'
@@ -176,6 +205,12 @@ def edit_record(player_name, id):
     record = PlayerRecord.query.get_or_404(id)
     
     if request.method == 'POST':
+        # Togliamo i valori vecchi dai bucket aggregati e dal tabellone (riaggiunti dopo la modifica)
+        rollup = RollupChange()
+        rollup.remove(record)
+        scoreboard = ScoreboardChange()
+        scoreboard.remove(record)
+
         # 1. Aggiorna Risultato (Miss, Bordo, Centro)
         res = request.form.get('risultato_tiro')
         record.miss = 'Sì' if res == 'Miss' else 'No'
@@ -206,7 +241,13 @@ def edit_record(player_name, id):
             # Se è centro ma l'utente ha deselezionato tutto, lascia com'era o metti vuoto (a tua scelta)
             # Qui lasciamo vuoto se deselezionato
         
+        rollup.add(record)
+        rollup.apply()
+        scoreboard.add(record)
+        scoreboard.apply()
         db.session.commit()
+        bump_stats_version(record.player_id)
+        invalidate_match_card(record.match_id)
         flash("Tiro modificato con successo!", "success")
         return redirect(url_for('main.index', player_name=player_name))
         
@@ -297,6 +338,11 @@ def update_icon():
 
     # --- SALVATAGGIO FINALE (FONDAMENTALE) ---
     db.session.commit()
+    # Nome e icona compaiono nelle card dei tavoli
+    clear_match_cards()
+    if player.name != old_name:
+        # Il nome è cambiato in tutte le sue partite: indice dei posti ricostruito (una query)
+        seat_index.rebuild()
     
     # Mostra il messaggio generico solo se non ci sono stati errori 
     # e se non abbiamo già inviato un messaggio specifico (nome o password)
@@ -1,14 +1,25 @@
-from flask import render_template, request, flash, redirect, url_for, session, abort, current_app
+from flask import render_template, request, flash, redirect, url_for, session, abort, current_app, jsonify
 from app.main import bp, modifiche_manuali
-from app.models import db, Player, ActiveMatch, PlayerRecord, CUP_DEFINITIONS
-from datetime import datetime, timedelta
-from itertools import groupby
+from app.models import db, Player, ActiveMatch, PlayerRecord, MatchEvent
+from app.main.stats_rollup import RollupChange, delete_rollups
+from app.main.stats_cache import bump_stats_version
+from app.main.scoreboard import MATCH_SLOTS, ScoreboardChange, refresh_scoreboards, shots_column, player_slot
+from app.main.history import (get_recent_history, get_archive_page, decode_cursor, archive_entry,
+                              archive_entry_json, ARCHIVE_PAGE_SIZE)
+from app.main.card_cache import render_match_card, invalidate_match_card, clear_match_cards
+from app.main.seat_index import (seat_index, find_player_match, last_finished_match,
+                                 sync_match_seats, drop_match_seats)
+from app.main.live_updates import emit_match_update, match_version
+from app.main.match_engine import match_engine, STATE_FIELDS
+from app.main.cup_state import full_mask, cup_count, active_cups, live_cups, pending_damage, team_cups_view
+from app.main.game_rules import (FINISHED, OVERTIME, other_team, apply_pending_damage, apply_shot,
+                                 change_format, advance_game)
+from app.main.match_log import log_event, state_dict, drop_match_log, undo_event
+from datetime import datetime
 from thefuzz import process
-from sqlalchemy import func
-import json
+from sqlalchemy import func, or_
 from app.password import gate_required
 from werkzeug.security import generate_password_hash, check_password_hash
-from app import socketio
 
 
 # PASSWORD UNIVERSALE
@@ -21,15 +32,9 @@ UNIVERSAL_MASTER_PASSWORD = "Teutoburgo9dc"
 def get_match_info(player_name):
     """
     Cerca se il giocatore è in una partita attiva e ritorna (match, team).
-    Team è 't1' o 't2'.
+    Team è 't1' o 't2'. Legge l'indice dei posti in memoria (seat_index.py).
     """
-    matches = ActiveMatch.query.filter(ActiveMatch.status != 'finished').all()
-    for m in matches:
-        if player_name in [m.t1_p1, m.t1_p2]:
-            return m, 't1'
-        if player_name in [m.t2_p1, m.t2_p2]:
-            return m, 't2'
-    return None, None
+    return find_player_match(player_name)
 
 
 def get_clean_drink_fuzzy(input_name):
@@ -42,43 +47,12 @@ def get_clean_drink_fuzzy(input_name):
     return input_name
 
 
-def count_cups(json_str):
-    """Conta i bicchieri attivi da una stringa JSON."""
-    try:
-        if not json_str: return 0
-        data = json.loads(json_str)
-        return len(data) if isinstance(data, list) else 0
-    except:
-        return 0
-
-# Cerca la funzione start_overtime e modificala così:
-
 def start_overtime(match):
-    """Reset e avvio dell'Overtime."""
-    match.status = 'running'
-    match.mode = 'overtime'  # Fondamentale
-    
-    match.format_target_for_t1 = "Singolo Centrale" # O "Triangolo Piccolo", come preferisci
-    match.format_target_for_t2 = "Singolo Centrale"
-    
-    # Reset liste bicchieri
-    match.t1_cup_state = json.dumps(["Singolo"]) # O bicchieri dell'overtime
-    match.t2_cup_state = json.dumps(["Singolo"])
-    
-    match.t1_pending_list = '[]'
-    match.t2_pending_list = '[]'
-    match.pending_damage_for_t1 = 0
-    match.pending_damage_for_t2 = 0
-    match.redemption_hits = 0
-    match.redemption_shots_left = 0
-    match.t1_format_changed = True
-    match.t2_format_changed = True
-    
+    """Effetti dell'avvio dell'Overtime (lo stato lo ha già resettato game_rules.reset_for_overtime)."""
     # --- AGGIUNTA FONDAMENTALE PER ANIMAZIONE ---
     # Questo flag dice al template: "È appena iniziato l'overtime, fai il FLASH!"
     session['animazione_overtime_start'] = True 
-    
-    db.session.commit()
+    # Il cambio di fase va nel DB con il commit dell'azione che lo ha causato (match_engine.save)
 
 # In routes.py
 
@@ -105,9 +79,9 @@ def rematch(match_id):
         mode='squadre',
         start_time=datetime.now(),
         # Reset totale dei bicchieri
-        t1_cup_state=json.dumps(CUP_DEFINITIONS['Piramide']),
-        t2_cup_state=json.dumps(CUP_DEFINITIONS['Piramide']),
-        t1_pending_list='[]', t2_pending_list='[]'
+        t1_cups=full_mask('Piramide'),
+        t2_cups=full_mask('Piramide'),
+        t1_pending=0, t2_pending=0
     )
 
     # 5. Mappatura dei giocatori che vorremmo invitare (dalla vecchia partita)
@@ -119,10 +93,7 @@ def rematch(match_id):
     }
 
     # 6. Controllo: Chi è già impegnato in altre partite attive?
-    active_matches = ActiveMatch.query.filter(ActiveMatch.status != 'finished').all()
-    busy_players = set()
-    for m in active_matches:
-        busy_players.update([m.t1_p1, m.t1_p2, m.t2_p1, m.t2_p2])
+    busy_players = seat_index.seated_names()
 
     # 7. Assegnazione Intelligente
     # Se il giocatore è libero -> Lo siedo.
@@ -136,9 +107,12 @@ def rematch(match_id):
         else:
             setattr(new_match, slot, None) # Lascia il buco "Siediti"
 
-    # 8. Salvataggio nel DB
+    # 8. Salvataggio nel DB (con il primo evento del log della partita)
     db.session.add(new_match)
+    db.session.flush()
+    log_event(new_match, 'start', state_dict(new_match))
     db.session.commit()
+    sync_match_seats(new_match)
     
     # Feedback all'utente
     if assigned_count < 4:
@@ -163,7 +137,11 @@ def delete_match(match_id):
     
     if not has_real_players:
         db.session.delete(match)
+        drop_match_log(match_id)
         db.session.commit()
+        invalidate_match_card(match_id)
+        drop_match_seats(match_id)
+        match_engine.discard(match_id)
         flash(f"Tavolo #{match_id} eliminato.", "success")
     else:
         flash("Impossibile eliminare: ci sono giocatori seduti al tavolo.", "error")
@@ -171,13 +149,13 @@ def delete_match(match_id):
     return redirect(url_for('main.home'))
 
 
-def finish_match(match, winner):
+def finish_match(match):
     """
-    Registra la fine della partita, il vincitore e aggiorna i record dei tiri.
+    Registra la fine della partita (stato, ora e vincitore li ha già messi game_rules.finish)
+    e aggiorna i record dei tiri, compreso quello appena aggiunto alla sessione.
+    Il salvataggio dello stato e il commit sono del chiamante, poi after_game_commit.
     """
-    match.status = 'finished'
-    match.end_time = datetime.now()
-    match.winning_team = winner
+    winner = match.winning_team
     
     # --- NUOVA LOGICA: AGGIORNAMENTO STORICO TIRI (WIN/LOSS) ---
     try:
@@ -191,175 +169,88 @@ def finish_match(match, winner):
         # 2. Recuperiamo tutti i record di questa partita
         records = PlayerRecord.query.filter_by(match_id=match.id).all()
         
-        # 3. Aggiorniamo ogni record
+        # 3. Aggiorniamo ogni record (e i bucket aggregati, che dipendono dal risultato)
+        rollup = RollupChange()
         for record in records:
+            rollup.remove(record)
             # record.player è l'oggetto Player collegato (grazie alla relationship in models.py)
             if record.player.name in winning_names:
                 record.match_result = "Win"
             else:
                 record.match_result = "Loss"
+            rollup.add(record)
+        rollup.apply()
                 
     except Exception as e:
         print(f"Errore aggiornamento Win/Loss records: {e}")
 
-    db.session.commit()
-
 
-def count_shots_in_match(player_name, match_id):
-    if not player_name: return 0
-    player = Player.query.filter_by(name=player_name).first()
-    if not player: return 0
-    return PlayerRecord.query.filter_by(match_id=match_id, player_id=player.id).count()
+def transition_effects(match, transition):
+    """Effetti di una transizione delle regole: fine partita (Win/Loss sui tiri) e inizio overtime."""
+    if transition == FINISHED:
+        finish_match(match)
+    elif transition == OVERTIME:
+        start_overtime(match)
 
-def init_cup_state(match, team, format_name):
-    full_set = CUP_DEFINITIONS.get(format_name, [])
-    if team == 't1':
-        match.t1_cup_state = json.dumps(full_set)
-    else:
-        match.t2_cup_state = json.dumps(full_set)
 
-def update_game_state(match):
+def update_game_state(match, now=None):
     """
-    Gestisce le regole di vittoria, sconfitta, overtime e ribaltone.
-    Calcola lo stato includendo i danni pendenti per una reattività immediata.
+    Applica le regole del gioco (game_rules.advance_game) e gli effetti delle transizioni.
+    Restituisce la transizione (o None). Nessun commit: la fase cambiata va nel DB
+    con il commit dell'azione, insieme al tiro che l'ha causata.
     """
-    if not match: return
-    if match.status == 'finished': return
-
-    try:
-        # Carichiamo gli stati attuali
-        t1_active = json.loads(match.t1_cup_state)
-        t2_active = json.loads(match.t2_cup_state)
-        
-        # Carichiamo i danni pendenti (colpi andati a segno ma non ancora "tolti")
-        t1_pending = json.loads(match.t1_pending_list)
-        t2_pending = json.loads(match.t2_pending_list)
-
-        # --- CALCOLO "VITA REALE" (Attivi - Colpiti in attesa) ---
-        # Questo è il trucco: sottraiamo i pendenti per vedere se la squadra è "morta"
-        t1_live_count = len(t1_active) - len(t1_pending)
-        t2_live_count = len(t2_active) - len(t2_pending)
-        
-        # Aggiorna contatori interi per query veloci (opzionale, per visualizzazione)
-        match.cups_target_for_t1 = t1_live_count
-        match.cups_target_for_t2 = t2_live_count
-
-        # 1. LOGICA DELLA FASE NORMALE
-        if match.status == 'running':
-            # Se T1 finisce i bicchieri (contando anche quelli appena colpiti)
-            if t1_live_count <= 0:
-                match.status = 'redemption_t1'
-                rimasti_avv = t2_live_count
-                match.redemption_shots_left = 2 if rimasti_avv == 1 else rimasti_avv
-                match.redemption_hits = 0 
-            
-            elif t2_live_count <= 0:
-                match.status = 'redemption_t2'
-                rimasti_avv = t1_live_count
-                match.redemption_shots_left = 2 if rimasti_avv == 1 else rimasti_avv
-                match.redemption_hits = 0 
-
-        # 2. LOGICA DELLA FASE REDEMPTION
-        elif match.status.startswith('redemption'):
-            redeeming_team = 't1' if match.status == 'redemption_t1' else 't2'
-            opponent_team = 't2' if redeeming_team == 't1' else 't1'
-            
-            # Recuperiamo i bicchieri della squadra che sta redimendo (quella a 0 o -1)
-            redeeming_team_cups = t1_live_count if redeeming_team == 't1' else t2_live_count
-            
-            # Recuperiamo i bicchieri dell'avversario (il target da pareggiare)
-            target_balance = t2_live_count if redeeming_team == 't1' else t1_live_count
-            
-            # --- [NUOVO] CHECK VITTORIA IMMEDIATA(Prima era in "running", ma ora "redemption" si attiva subito, quindi
-            # è stato spostato qua
-            if redeeming_team_cups <= -1:
-                finish_match(match, winner=opponent_team)
-                return
-            
-            # --- A. CONTROLLO VITTORIA SCHIACCIANTE (< -1) ---
-            if target_balance < -1:
-                finish_match(match, winner=redeeming_team)
-                return
-
-            # --- B. CONTROLLO TIRI FINITI ---
-            # Solo se ho finito i tiri controllo il risultato
-            if match.redemption_shots_left <= 0:
-                
-                # Caso Pareggio -> OVERTIME
-                if target_balance == 0:
-                    start_overtime(match)
-                
-                # Caso Perso
-                elif target_balance > 0:
-                    finish_match(match, winner=opponent_team)
-                
-                # Caso Ribaltone (-1 esatto)
-                elif target_balance == -1: 
-                   match.status = f'redemption_{opponent_team}'
-                   match.redemption_shots_left = 2 
-                   match.redemption_hits = 0
-                   # Reset immediato delle liste dell'altra squadra
-                   # Qui puliamo tutto perché inizia un nuovo "turno" di redenzione inversa
-                   if redeeming_team == 't1': 
-                       match.t2_cup_state = '[]'; match.t2_pending_list = '[]'
-                   else: 
-                       match.t1_cup_state = '[]'; match.t1_pending_list = '[]'
-
-    except Exception as e:
-        print(f"Errore update_game_state: {e}")
-            
+    transition = advance_game(match, now or datetime.now())
+    transition_effects(match, transition)
+    return transition
 
-    except Exception as e:
-        print(f"Errore update_game_state: {e}")
 
-def apply_pending_damage(match, target_team):
+def after_game_commit(state):
     """
-    Applica i danni pendenti rimuovendo i bicchieri dalla lista attiva.
+    Dopo il commit di un'azione di gioco: card del tavolo e, se la partita è finita,
+    posti liberati e statistiche dei giocatori (i loro tiri hanno ora Win/Loss).
     """
-    if not match: return
+    invalidate_match_card(state.id)
+    if state.status == 'finished':
+        player_ids = [pid for (pid,) in db.session.query(PlayerRecord.player_id)
+                      .filter(PlayerRecord.match_id == state.id).distinct()]
+        bump_stats_version(*player_ids)
+        sync_match_seats(state)
 
-    # --- LOGICA CORRETTA ---
-    # Dobbiamo capire se 'target_team' è la squadra che sta cercando di salvarsi (Redemption)
-    # o se è la squadra che sta vincendo.
-    
-    # Se siamo in Redemption:
-    if match.status.startswith('redemption'):
-        redeeming_team = 't1' if match.status == 'redemption_t1' else 't2'
-        
-        # Se stiamo cercando di applicare danni alla squadra che sta VINCENDO (l'avversario di chi redime),
-        # ALLORA ci fermiamo. Perché quei colpi sono i tiri di salvezza, e non devono sparire visivamente
-        # finché non vediamo se il pareggio riesce.
-        if target_team != redeeming_team:
-            return
-
-        # SE INVECE target_team == redeeming_team (chi sta perdendo),
-        # significa che ci sono ancora dei pending vecchi che devono essere rimossi 
-        # (es. l'ultimo colpo che li ha mandati in redemption).
-        # Quindi lasciamo che il codice prosegua e li rimuova.
 
-    # --- FINE LOGICA CORRETTA ---
+# Passi massimi delle regole dopo un'azione (le catene reali sono di 2-3 passi)
+SETTLE_STEPS = 5
 
-    # Selezione dinamica delle colonne
-    target_state_col = 't1_cup_state' if target_team == 't1' else 't2_cup_state'
-    target_pending_col = 't1_pending_list' if target_team == 't1' else 't2_pending_list'
-    target_int_col = 'pending_damage_for_t1' if target_team == 't1' else 'pending_damage_for_t2'
-    
-    try:
-        current_state = json.loads(getattr(match, target_state_col))
-        pending_list = json.loads(getattr(match, target_pending_col))
+def settle_game_state(match, now):
+    """
+    Dopo un'azione che scrive (tiro, cambio formato, danni forzati, gestione manuale)
+    riapplica le regole finché lo stato non cambia più: una transizione può portarne
+    subito un'altra (es. redemption che finisce al primo controllo, ribaltone).
+    Ogni passo è un evento 'update' nel log. Il commit è del chiamante.
+    """
+    for _ in range(SETTLE_STEPS):
+        if match.status == 'finished':
+            return
+        before = state_dict(match)
+        transition = update_game_state(match, now)
+        if state_dict(match) == before:
+            return
+        log_event(match, 'update', timestamp=now)
+        if transition == OVERTIME:
+            log_event(match, 'overtime')
 
-        if not pending_list: return
 
-        # Rimuove i bicchieri
-        new_state = [c for c in current_state if c not in pending_list]
-        
-        setattr(match, target_state_col, json.dumps(new_state))
-        setattr(match, target_pending_col, '[]')
-        setattr(match, target_int_col, 0)
-        
-    except Exception as e:
-        print(f"Errore apply_pending_damage: {e}")
-        print(f"Errore apply_pending_damage: {e}")
+def derived_game_state(state, now):
+    """
+    Stato 'a regime' di una copia privata (checkout) per la sola lettura: le regole
+    applicate in memoria, senza salvare, loggare né fare commit. Di solito coincide con
+    lo stato salvato, perché le rotte che scrivono lo portano già a regime.
+    """
+    for _ in range(SETTLE_STEPS):
+        before = state.values()
+        advance_game(state, now)
+        if state.values() == before:
+            break
+    return state
 
 
 # ==========================================
@@ -368,54 +259,18 @@ def apply_pending_damage(match, target_team):
 
 def get_score_points(match):
     """
-    Calcola i punti totali (Bicchieri affondati) analizzando i tiri.
-    Supporta:
+    Punti totali (Bicchieri affondati) delle due squadre.
+    Sono salvati sulla partita e aggiornati a ogni tiro (vedi scoreboard.py):
     - Multihits (Doppi/Tripli contano 2/3 punti)
     - Overtime e Redemption (vengono contati nel totale)
     - Reset al Rematch (conta solo i tiri dall'ultimo start_time)
     """
-    try:
-        score_t1 = 0
-        score_t2 = 0
-        
-        # 1. Recuperiamo gli ID dei giocatori delle due squadre
-        t1_names = [n for n in [match.t1_p1, match.t1_p2] if n]
-        t2_names = [n for n in [match.t2_p1, match.t2_p2] if n]
-        
-        t1_ids = [p.id for p in Player.query.filter(Player.name.in_(t1_names)).all()]
-        t2_ids = [p.id for p in Player.query.filter(Player.name.in_(t2_names)).all()]
-
-        # 2. Prendiamo TUTTI i tiri andati a segno (Centro) di questa partita
-        # MODIFICA: Aggiunto filtro timestamp >= match.start_time
-        hits = PlayerRecord.query.filter(
-            PlayerRecord.match_id == match.id,
-            PlayerRecord.centro == 'Sì',
-            PlayerRecord.timestamp >= match.start_time 
-        ).all()
-
-        for record in hits:
-            # --- CALCOLO VALORE DEL TIRO ---
-            points = 1 # Default: vale almeno 1
-            
-            if record.bicchiere_colpito:
-                # Esempio stringa: "3 Cen, 2 Dx" -> Dividiamo per virgola
-                # Esempio lista: ["3 Cen", "2 Dx"] -> Lunghezza 2
-                cups_hit_list = [c for c in record.bicchiere_colpito.split(',') if c.strip()]
-                
-                if len(cups_hit_list) > 1:
-                    points = len(cups_hit_list) # Vale 2, 3, ecc.
-            
-            # --- ASSEGNAZIONE PUNTI ---
-            if record.player_id in t1_ids:
-                score_t1 += points
-            elif record.player_id in t2_ids:
-                score_t2 += points
-                
-        return score_t1, score_t2
+    return match.score_t1 or 0, match.score_t2 or 0
 
-    except Exception as e:
-        print(f"Errore calcolo punteggio avanzato: {e}")
-        return 0, 0
+
+def get_shot_counts(match):
+    """Tiri del giocatore seduto in ciascuno slot (salvati sulla partita)."""
+    return {slot: getattr(match, shots_column(slot)) or 0 for slot in MATCH_SLOTS}
 
 
 
@@ -474,75 +329,86 @@ def home():
     
     # 1. PARTITE ATTIVE
     active_matches = ActiveMatch.query.filter(ActiveMatch.status != 'finished').all()
-    
+
     matches_data = []
-    busy_players = []
+    busy_players = seat_index.seated_names()
 
     for m in active_matches:
-        busy_players.extend([m.t1_p1, m.t1_p2, m.t2_p1, m.t2_p2])
-        
-        # CALCOLO PUNTEGGIO
+        # PUNTEGGIO E TIRI (salvati sulla partita)
         s1, s2 = get_score_points(m)
         
-        stats = {
-            't1_p1': count_shots_in_match(m.t1_p1, m.id),
-            't1_p2': count_shots_in_match(m.t1_p2, m.id),
-            't2_p1': count_shots_in_match(m.t2_p1, m.id),
-            't2_p2': count_shots_in_match(m.t2_p2, m.id),
-        }
         matches_data.append({
             'match': m, 
-            'stats': stats, 
+            'stats': get_shot_counts(m), 
             'score_t1': s1, 
             'score_t2': s2
         })
 
-    # 2. STORICO 24H
-    last_24h = datetime.now() - timedelta(hours=24)
-    finished_matches = ActiveMatch.query.filter(
-        ActiveMatch.status == 'finished',
-        ActiveMatch.end_time >= last_24h
-    ).all()
-
-    def get_match_key(m):
-        t1 = sorted([p for p in [m.t1_p1, m.t1_p2] if p])
-        t1_str = " & ".join(t1)
-        t2 = sorted([p for p in [m.t2_p1, m.t2_p2] if p])
-        t2_str = " & ".join(t2)
-        return " VS ".join(sorted([t1_str, t2_str]))
-
-    finished_matches.sort(key=get_match_key)
-    
-    grouped_history = {}
-    
-    for key, group in groupby(finished_matches, key=get_match_key):
-        match_list = list(group)
-        match_list.sort(key=lambda x: x.end_time if x.end_time else datetime.min, reverse=True)
-        
-        processed_matches = []
-        for m in match_list:
-            s1, s2 = get_score_points(m)
-            winner = m.winning_team if m.winning_team else 'draw'
-            
-            processed_matches.append({
-                'obj': m,
-                't1_score': s1,
-                't2_score': s2,
-                'winner': winner,
-                'time_ago': m.end_time.strftime("%H:%M") if m.end_time else "--:--"
-            })
-            
-        grouped_history[key] = processed_matches
+    # 2. STORICO 24H (raggruppato per sfida e con i punteggi salvati: una query)
+    grouped_history = get_recent_history()
 
     players = Player.query.filter(~Player.name.ilike('admin%')).order_by(Player.name).all()
 
+    # CARD DEI TAVOLI (frammenti HTML in cache finché il tavolo non cambia)
+    current_user = session.get('player_name')
+    for item in matches_data:
+        item['card_html'] = render_match_card(item, players, busy_players, current_user)
+
     # RENDERIZZA LA HOME
     return render_template('home.html', 
                            matches_data=matches_data, 
                            grouped_history=grouped_history,
                            players=players,
                            busy_players=busy_players,
-                           current_user=session.get('player_name'))
+                           current_user=current_user)
+
+
+# ==========================================
+#     ARCHIVIO PARTITE (Paginazione keyset)
+# ==========================================
+
+def get_archive_args():
+    """Filtri e pagina dell'archivio dalla query string: (giocatore, sfida, cursore, limite)."""
+    giocatore = request.args.get('giocatore', '').strip() or None
+    sfida = request.args.get('sfida', '').strip() or None
+    limite = request.args.get('limite', ARCHIVE_PAGE_SIZE, type=int)
+    return giocatore, sfida, request.args.get('prima'), limite
+
+
+@bp.route('/storico')
+def storico():
+    """Archivio di tutte le partite finite, a pagine (filtri per giocatore e sfida)."""
+    if 'player_id' not in session:
+        return redirect(url_for('main.login_page'))
+
+    giocatore, sfida, prima, limite = get_archive_args()
+    # Cursore non valido (link vecchio o modificato): ripartiamo dalla prima pagina
+    rows, next_cursor = get_archive_page(giocatore, sfida, decode_cursor(prima), limite)
+    players = Player.query.filter(~Player.name.ilike('admin%')).order_by(Player.name).all()
+
+    return render_template('storico.html',
+                           entries=[archive_entry(row) for row in rows],
+                           next_cursor=next_cursor,
+                           giocatore=giocatore,
+                           sfida=sfida,
+                           limite=limite,
+                           is_first_page=not prima,
+                           players=players)
+
+
+@bp.route('/api/storico')
+def api_storico():
+    """Stessa pagina dell'archivio in JSON: {'matches': [...], 'next': cursore o null}."""
+    if 'player_id' not in session:
+        return jsonify({"error": "Devi effettuare il login."}), 401
+
+    giocatore, sfida, prima, limite = get_archive_args()
+    cursor = decode_cursor(prima)
+    if prima and cursor is None:
+        return jsonify({"error": "Cursore 'prima' non valido."}), 400
+
+    rows, next_cursor = get_archive_page(giocatore, sfida, cursor, limite)
+    return jsonify({'matches': [archive_entry_json(row) for row in rows], 'next': next_cursor})
 
 
 # --- SOSTITUISCI IL BLOCCO setup_match CON QUESTE NUOVE ROTTE ---
@@ -560,11 +426,13 @@ def create_match_quick():
         t1_p1=None, t1_p2=None, 
         t2_p1=None, t2_p2=None,
         # Inizializza bicchieri
-        t1_cup_state=json.dumps(CUP_DEFINITIONS['Piramide']),
-        t2_cup_state=json.dumps(CUP_DEFINITIONS['Piramide']),
-        t1_pending_list='[]', t2_pending_list='[]'
+        t1_cups=full_mask('Piramide'),
+        t2_cups=full_mask('Piramide'),
+        t1_pending=0, t2_pending=0
     )
     db.session.add(new_match)
+    db.session.flush()
+    log_event(new_match, 'start', state_dict(new_match))
     db.session.commit()
     return redirect(url_for('main.home'))
 
@@ -592,7 +460,11 @@ def remove_player_slot(match_id, slot):
             if getattr(match, other_slot) == 'CLOSED':
                 setattr(match, other_slot, None)
 
+        # Cambiano i giocatori seduti: punteggio e tiri ricalcolati dai record
+        refresh_scoreboards([match])
         db.session.commit()
+        invalidate_match_card(match.id)
+        sync_match_seats(match)
         
     return redirect(url_for('main.home'))
 
@@ -611,10 +483,13 @@ def assign_slot():
     if player_name == 'CLOSED':
         if slot in ['t1_p1', 't1_p2', 't2_p1', 't2_p2']:
             setattr(match, slot, 'CLOSED')
+            refresh_scoreboards([match])
             db.session.commit()
+            invalidate_match_card(match.id)
+            sync_match_seats(match)
             
             # === NOVITÀ: AVVISA TUTTI ===
-            socketio.emit('partita_aggiornata', {'match_id': match.id})
+            emit_match_update(match)
             # ============================
             
         return redirect(url_for('main.home'))
@@ -630,10 +505,13 @@ def assign_slot():
     # 3. Assegnazione Giocatore Reale
     if slot in ['t1_p1', 't1_p2', 't2_p1', 't2_p2']:
         setattr(match, slot, player_name)
+        refresh_scoreboards([match])
         db.session.commit()
+        invalidate_match_card(match.id)
+        sync_match_seats(match)
         
         # === NOVITÀ: AVVISA TUTTI ===
-        socketio.emit('partita_aggiornata', {'match_id': match.id})
+        emit_match_update(match)
         # ============================
         
     return redirect(url_for('main.home'))
@@ -694,11 +572,8 @@ def index(player_name):
     
     # --- RECUPERO PARTITA FINITA ---
     if not match:
-        last_match = ActiveMatch.query.filter(
-            ActiveMatch.status == 'finished',
-            (ActiveMatch.t1_p1 == target_player.name) | (ActiveMatch.t1_p2 == target_player.name) |
-            (ActiveMatch.t2_p1 == target_player.name) | (ActiveMatch.t2_p2 == target_player.name)
-        ).order_by(ActiveMatch.id.desc()).first()
+        # Query servita dagli indici (slot, status) di ActiveMatch
+        last_match = last_finished_match(target_player.name)
         
         if last_match:
             match = last_match
@@ -763,67 +638,64 @@ def index(player_name):
     if match:
         defaults['match_id'] = match.id
 
-        update_game_state(match) 
-        db.session.commit()
+        # Partita in corso: stato di gioco dal motore in memoria (le finite si leggono dal DB).
+        # La pagina è in sola lettura (niente scritture né commit: la aprono tutti i
+        # telefoni del tavolo a ogni aggiornamento): le transizioni le applicano le rotte
+        # che scrivono, qui le regole girano solo sulla copia privata.
+        state = match_engine.checkout(match) if match.status != 'finished' else match
+        if state is not match:
+            derived_game_state(state, datetime.now())
+        defaults['team'] = team
+        defaults['version'] = match_version(match.id)
 
-        match_status = match.status
+        match_status = state.status
 
         # --- FIX OVERTIME VISUALIZZAZIONE ---
         # Se la logica è "running" ma siamo in modalità "overtime",
         # diciamo al frontend che è "overtime" così mostra la grafica.
-        if match.status == 'running' and match.mode == 'overtime':
+        if state.status == 'running' and state.mode == 'overtime':
             match_status = 'overtime'
 
 
-        try:
-            if team == 't1':
-                my_active_list = json.loads(match.t1_cup_state)
-                opp_active_list = json.loads(match.t2_cup_state)
-                opp_pending_list = json.loads(match.t2_pending_list)
-                my_pending_list = json.loads(match.t1_pending_list)
-                defaults['my_formato'] = match.format_target_for_t1
-                defaults['formato'] = match.format_target_for_t2
-                format_locked = match.t1_format_changed 
-                pending_damage_for_me = match.pending_damage_for_t1
-                pending_damage_for_them = match.pending_damage_for_t2
-            else:
-                my_active_list = json.loads(match.t2_cup_state)
-                opp_active_list = json.loads(match.t1_cup_state)
-                opp_pending_list = json.loads(match.t1_pending_list)
-                my_pending_list = json.loads(match.t2_pending_list)
-                defaults['my_formato'] = match.format_target_for_t2
-                defaults['formato'] = match.format_target_for_t1
-                format_locked = match.t2_format_changed
-                pending_damage_for_me = match.pending_damage_for_t2
-                pending_damage_for_them = match.pending_damage_for_t1
-        except:
-            my_active_list = []; opp_active_list = []; opp_pending_list = []; my_pending_list = []
+        # Bicchieri delle due squadre (dalle maschere ai nomi per il template)
+        opp_team = 't2' if team == 't1' else 't1'
+        my_cups = team_cups_view(state, team)
+        opp_cups = team_cups_view(state, opp_team)
+        my_active_list = my_cups['active']; my_pending_list = my_cups['pending']
+        opp_active_list = opp_cups['active']; opp_pending_list = opp_cups['pending']
+        defaults['my_formato'] = my_cups['format']
+        defaults['formato'] = opp_cups['format']
+        format_locked = getattr(state, f'{team}_format_changed')
+        pending_damage_for_me = pending_damage(state, team)
+        pending_damage_for_them = pending_damage(state, opp_team)
 
         defaults['my_active_cups'] = my_active_list
         defaults['opp_active_cups'] = opp_active_list
         defaults['my_pending_cups'] = my_pending_list
         defaults['opp_pending_cups'] = opp_pending_list
+        defaults['my_overkill'] = my_cups['overkill']
+        defaults['opp_overkill'] = opp_cups['overkill']
 
 
         # === GESTIONE RISULTATO E RETE DI SICUREZZA ===
         
-        opp_real_life = len(opp_active_list) - len(opp_pending_list)
-        my_real_life = len(my_active_list) - len(my_pending_list)
+        opp_real_life = live_cups(state, opp_team)
+        my_real_life = live_cups(state, team)
         diff_real_life = my_real_life - opp_real_life
 
         fe_risultato_partita=""
         
         # 1. Partita ufficialmente finita
-        if match.status == 'finished':
-            if not match.winning_team:
-                match.winning_team = (
+        if state.status == 'finished':
+            if not state.winning_team:
+                state.winning_team = (
                     None if diff_real_life == 0 # Pareggio
                     else team if diff_real_life > 0 # Vittoria
                     else ('t2' if team == 't1' else 't1')) # Sconfitta
 
             game_result = (
                 'draw' if diff_real_life == 0 # Pareggio
-                else 'win' if match.winning_team == team # Vittoria
+                else 'win' if state.winning_team == team # Vittoria
                 else 'loss') # Sconfitta
 
 
@@ -833,7 +705,7 @@ def index(player_name):
              
              # CASO A: SIAMO IN RUNNING
              # Se porto a -1 in running, inizia la redemption, non ho ancora vinto.
-             if match.status == 'running':
+             if state.status == 'running':
                 game_result = 'win'
                 match_status = 'finished'
                 # Front end Visualizzazione Fine Partita
@@ -841,9 +713,9 @@ def index(player_name):
                 
 
              # CASO B: SIAMO IN REDEMPTION
-             elif match.status.startswith('redemption'):
+             elif state.status.startswith('redemption'):
                  # Capiamo chi sta tirando
-                 is_my_team_redeeming = (match.status == f'redemption_{team}')
+                 is_my_team_redeeming = (state.status == f'redemption_{team}')
                  
                  if is_my_team_redeeming:
                      # Sono io che cerco di salvarmi.
@@ -864,26 +736,20 @@ def index(player_name):
                      fe_risultato_partita = "VITTORIA ASSICURATA"
 
         # Calcolo Overkill
-        try:
-             t1_real = len(json.loads(match.t1_cup_state)) - len(json.loads(match.t1_pending_list))
-             t2_real = len(json.loads(match.t2_cup_state)) - len(json.loads(match.t2_pending_list))
-             diff = t1_real - t2_real if team == 't1' else t2_real - t1_real
-             match_score_diff = diff
-        except:
-             match_score_diff = 0
+        match_score_diff = my_real_life - opp_real_life
         
         # ===============================================
 
         display_opp_cups = str(len(opp_active_list))
-        if match.status.startswith('redemption'):
-            is_my_team_redeeming = (match.status == f'redemption_{team}')
+        if state.status.startswith('redemption'):
+            is_my_team_redeeming = (state.status == f'redemption_{team}')
             redemption_info = {
                 'active': True, 
-                'shots_left': match.redemption_shots_left,
+                'shots_left': state.redemption_shots_left,
                 'is_me': is_my_team_redeeming
             }
             if is_my_team_redeeming:
-                display_opp_cups = f"{len(opp_active_list)} - {match.redemption_hits}"
+                display_opp_cups = f"{len(opp_active_list)} - {state.redemption_hits}"
         
         defaults['numero_bicchieri'] = display_opp_cups
 
@@ -907,25 +773,25 @@ def index(player_name):
         display_opp_cups = str(len(opp_active_list))
         
         # --- MODIFICA REDEMPTION INFO ---
-        if match.status.startswith('redemption'):
-            is_my_team_redeeming = (match.status == f'redemption_{team}')
+        if state.status.startswith('redemption'):
+            is_my_team_redeeming = (state.status == f'redemption_{team}')
             
             # Calcoliamo quanti ne mancano per il pareggio (Overtime)
             # Logica: Bicchieri Attivi Avversario - Bicchieri che abbiamo già colpito in questa fase (Pending)
-            cups_needed_to_tie = len(opp_active_list) - len(opp_pending_list)
+            cups_needed_to_tie = live_cups(state, opp_team)
             
             # Se è negativo (es. -1), vuol dire che siamo già in zona vittoria/ribaltone
             if cups_needed_to_tie < 0: cups_needed_to_tie = 0
 
             redemption_info = {
                 'active': True, 
-                'shots_left': match.redemption_shots_left,
+                'shots_left': state.redemption_shots_left,
                 'is_me': is_my_team_redeeming,
                 'cups_to_tie': cups_needed_to_tie  # <--- NUOVO DATO
             }
             
             if is_my_team_redeeming:
-                display_opp_cups = f"{len(opp_active_list)} - {match.redemption_hits}"
+                display_opp_cups = f"{len(opp_active_list)} - {state.redemption_hits}"
         
 
 
@@ -997,7 +863,7 @@ def index(player_name):
     show_ot_flash = session.pop('animazione_overtime_start', False)
 
     # Recuperiamo la modalità per passarla al template (così lo sfondo resta attivo)
-    match_mode = match.mode if match else 'standard'
+    match_mode = state.mode if match else 'standard'
 
 
     return render_template('player_record.html', 
@@ -1025,25 +891,47 @@ def index(player_name):
 def force_update(player_name):
     # Logica per forzare l'applicazione dei danni (il tasto "Conferma" o simili)
     match, team = get_match_info(player_name)
-    if match and match.status == 'running':
-        opponent_team = 't2' if team == 't1' else 't1'
-        apply_pending_damage(match, opponent_team)
-        update_game_state(match)
+    state = match_engine.checkout(match) if match else None
+    if state and state.status == 'running':
+        opponent_team = other_team(team)
+        before = state.values()
+        adesso = datetime.now()
+        apply_pending_damage(state, opponent_team)
+        # Regole solo in memoria: gli effetti della transizione dopo l'evento, tutto in un commit
+        transition = advance_game(state, adesso)
+        if state.values() != before:
+            log_event(state, 'force', {'team': opponent_team}, timestamp=adesso)
+            if transition == OVERTIME:
+                log_event(state, 'overtime')
+            transition_effects(state, transition)
+            settle_game_state(state, adesso)
+        match_engine.save(state)
         db.session.commit()
+        after_game_commit(state)
     return redirect(url_for('main.index', player_name=player_name))
 
 
 @bp.route('/add/<player_name>', methods=['POST'])
 def add_record(player_name):
-    # 1. Recupera il proprietario del tracker (target_player)
-    target_player = Player.query.filter_by(name=player_name).first()
+    # Percorso di un tiro: letture minime e UN solo commit.
+    # 1. Partita del giocatore: indice dei posti in memoria + chiave primaria (1 query)
+    match, team = get_match_info(player_name)
+
+    # 2. In UNA query: proprietario del tracker (target_player), chi sta scrivendo
+    #    (current_user) e gli altri giocatori seduti al tavolo (compagno e avversari)
+    current_user_id = session.get('player_id')
+    names = {player_name}
+    if match:
+        names |= {getattr(match, slot) for slot in MATCH_SLOTS} - {None, ''}
+    players = Player.query.filter(or_(Player.name.in_(names), Player.id == current_user_id)).all()
+    players_by_name = {p.name: p for p in players}
+    target_player = players_by_name.get(player_name)
     
     if not target_player:
         flash("Giocatore non trovato.", "error")
         return redirect(url_for('main.home'))
 
-    # 2. Chi sta scrivendo nel DB? (current_user)
-    current_user_obj = Player.query.get(session.get('player_id'))
+    current_user_obj = next((p for p in players if p.id == current_user_id), None)
     is_super_admin = current_user_obj.is_admin if current_user_obj else False
     
     # 3. Controllo permessi: Se non sono il proprietario e non sono Admin, blocco
@@ -1051,52 +939,43 @@ def add_record(player_name):
         flash("Solo l'Admin o il proprietario possono aggiungere tiri.", "error")
         return redirect(url_for('main.home'))
 
-    # Usa 'target_player' per il resto della funzione (match info, etc.)
-    match, team = get_match_info(player_name)
-
-    # Se non sono io e non sono Admin, non posso aggiungere tiri
-    if session['player_name'] != player_name and not is_super_admin:
-        flash("Solo l'Admin o il proprietario possono aggiungere tiri.", "error")
-        return redirect(url_for('main.home'))
+    # Stato di gioco: copia dal motore in memoria, salvata con match_engine.save
+    state = match_engine.checkout(match) if match else None
 
     submitted_format = request.form.get('formato')
+    adesso = datetime.now()
     
     # --- GESTIONE CAMBIO FORMATO SINCRONIZZATO ---
+    # Il formato inviato è quello dei bicchieri dell'avversario
     format_updated = False 
     
-    if match and submitted_format:
-        if team == 't1':
-            current_target = match.format_target_for_t2
-            if submitted_format != current_target:
-                match.format_target_for_t2 = submitted_format
-                init_cup_state(match, 't2', submitted_format)
-                match.t1_format_changed = True
-                db.session.commit()
-                format_updated = True 
-                session['animazione_pending'] = True 
-
-        else: # team == 't2'
-            current_target = match.format_target_for_t1
-            if submitted_format != current_target:
-                match.format_target_for_t1 = submitted_format
-                init_cup_state(match, 't1', submitted_format)
-                match.t2_format_changed = True
-                db.session.commit()
-                format_updated = True 
-                session['animazione_pending'] = True
+    if state and submitted_format:
+        opponent_team = other_team(team)
+        if submitted_format != getattr(state, f'format_target_for_{opponent_team}'):
+            change_format(state, opponent_team, submitted_format, team)
+            log_event(state, 'format', {'team': opponent_team, 'format': submitted_format, 'by': team},
+                      timestamp=adesso)
+            format_updated = True 
+            session['animazione_pending'] = True 
 
     # --- CONTROLLO: SE ABBIAMO CAMBIATO FORMATO, CI FERMIAMO QUI ---
     if 'risultato_tiro' not in request.form:
+        if format_updated:
+            settle_game_state(state, adesso)
+            match_engine.save(state)
+            db.session.commit()
+            after_game_commit(state)
+            emit_match_update(match)
         return redirect(request.referrer or '/')
 
     # --- LOGICA NORMALE DEL TIRO ---
     res = request.form['risultato_tiro']
     cups_for_stats = [] 
+    only_red = []
+    shots_potency = 1
+    transition = None
 
-    if match:
-        # Applica eventuali danni precedenti
-        apply_pending_damage(match, team)
-
+    if state:
         if res == 'Centro':
             # 1. Recupero dati dal form
             damage_candidates = request.form.getlist('bicchiere_colpito') # Bicchieri Rossi
@@ -1112,46 +991,14 @@ def add_record(player_name):
             all_clicked = rehits_physically_hit + [c for c in damage_candidates if c not in rehits_physically_hit]
             cups_for_stats = all_clicked[:shots_potency]
 
-            # --- LOGICA DANNI ---
-            opponent_team = 't2' if team == 't1' else 't1'
-            opp_pending_list_col = f'{opponent_team}_pending_list'
-            opp_pending_int_col = f'pending_damage_for_{opponent_team}'
-            
-            try:
-                current_pending = json.loads(getattr(match, opp_pending_list_col))
-                initial_count = len(current_pending)
+            # Solo i bicchieri rossi diventano danni (gli azzurri sono già colpiti)
+            only_red = [c for c in damage_candidates if c not in rehits_physically_hit]
 
-                only_red = [c for c in damage_candidates if c not in rehits_physically_hit]
-                
-                for cup in only_red:
-                    if (len(current_pending) - initial_count) < shots_potency:
-                        if cup not in current_pending:
-                            current_pending.append(cup)
-                
-                punti_effettivi = len(current_pending) - initial_count
-                mancanti = shots_potency - punti_effettivi
-                if mancanti > 0:
-                    for i in range(mancanti):
-                        current_pending.append(f"Overkill_{datetime.now().timestamp()}_{i}")
-
-                if match.status.startswith('redemption'):
-                    redeeming_team = 't1' if match.status == 'redemption_t1' else 't2'
-                    if team == redeeming_team:
-                        match.redemption_hits += shots_potency
-                
-                setattr(match, opp_pending_list_col, json.dumps(current_pending))
-                setattr(match, opp_pending_int_col, len(current_pending))
-            except Exception as e:
-                print(f"Errore logica Centro: {e}")
-
-        # Decremento tiri in redemption
-        if match.status.startswith('redemption'):
-            redeeming_team = 't1' if match.status == 'redemption_t1' else 't2'
-            if team == redeeming_team: 
-                match.redemption_shots_left -= 1
-
-        update_game_state(match)
-        db.session.commit()
+        # --- LOGICA DANNI E REDEMPTION (game_rules.py) ---
+        # Solo in memoria: fine partita e overtime hanno effetti sui record,
+        # applicati quando anche questo tiro è nella sessione (vedi sotto)
+        apply_shot(state, team, res, only_red, shots_potency)
+        transition = advance_game(state, adesso)
 
     # Generazione stringa colpi
     hit_str = ", ".join(cups_for_stats) if res == "Centro" and cups_for_stats else "N/A"
@@ -1159,25 +1006,23 @@ def add_record(player_name):
     # Calcolo bicchieri per storico
     curr_my_cups = 0; curr_opp_cups = 0
     if match:
-        try:
-            t1_c = len(json.loads(match.t1_cup_state))
-            t2_c = len(json.loads(match.t2_cup_state))
-            if team == 't1': curr_my_cups = t1_c; curr_opp_cups = t2_c
-            else: curr_my_cups = t2_c; curr_opp_cups = t1_c
-        except: pass
+        opponent_team = 't2' if team == 't1' else 't1'
+        curr_my_cups = cup_count(active_cups(state, team))
+        curr_opp_cups = cup_count(active_cups(state, opponent_team))
 
     # ==========================================
     #      CALCOLO DATI STATISTICI AVANZATI
     # ==========================================
     
     # 1. Calcolo numero tiro progressivo
+    # I tiri del giocatore in questa partita sono già sul tabellone (shots_<slot>)
     shot_number = 1
     if match:
-        tiri_precedenti = PlayerRecord.query.filter_by(match_id=match.id, player_id=target_player.id).count()
-        shot_number = tiri_precedenti + 1
+        slot = player_slot(match, player_name)
+        if slot:
+            shot_number = (getattr(match, shots_column(slot)) or 0) + 1
 
-    # 2. Data e Ora
-    adesso = datetime.now()
+    # 2. Data e Ora (quella del tiro, presa all'inizio)
     match_date_str = adesso.strftime("%Y-%m-%d")
     match_hour_int = adesso.hour
 
@@ -1194,15 +1039,13 @@ def add_record(player_name):
             teammate_name = match.t2_p2 if match.t2_p1 == target_player.name else match.t2_p1
             opp1_name = match.t1_p1; opp2_name = match.t1_p2
         
-        if teammate_name:
-            tm_obj = Player.query.filter_by(name=teammate_name).first()
-            if tm_obj: teammate_id = tm_obj.id   
-        if opp1_name:
-            o1_obj = Player.query.filter_by(name=opp1_name).first()
-            if o1_obj: opp1_id = o1_obj.id  
-        if opp2_name:
-            o2_obj = Player.query.filter_by(name=opp2_name).first()
-            if o2_obj: opp2_id = o2_obj.id
+        # Giocatori già caricati insieme al proprietario del tracker
+        if teammate_name in players_by_name:
+            teammate_id = players_by_name[teammate_name].id
+        if opp1_name in players_by_name:
+            opp1_id = players_by_name[opp1_name].id
+        if opp2_name in players_by_name:
+            opp2_id = players_by_name[opp2_name].id
 
     # ==========================================
     #           CREAZIONE RECORD
@@ -1224,7 +1067,7 @@ def add_record(player_name):
         opponent2_id=opp2_id,
         match_date=match_date_str,
         match_hour=match_hour_int,
-        is_overtime=(True if match and match.mode == 'overtime' else False),
+        is_overtime=(True if state and state.mode == 'overtime' else False),
         match_result=None,
         timestamp=adesso,
 
@@ -1235,7 +1078,7 @@ def add_record(player_name):
         cups_opp=curr_opp_cups,
         bicchiere_colpito=hit_str, 
         formato=submitted_format,
-        tiro_salvezza=('Sì' if match and match.status == f'redemption_{team}' else 'No'),
+        tiro_salvezza=('Sì' if state and state.status == f'redemption_{team}' else 'No'),
         postazione=request.form.get('postazione'),
         
         # USA LA BEVANDA PULITA
@@ -1245,12 +1088,35 @@ def add_record(player_name):
         note=request.form.get('note', '')
     )
     db.session.add(new_rec)
+    if state:
+        # Il tiro nel log della partita (con i dati per riapplicarlo)
+        log_event(state, 'shot', {'team': team, 'result': res, 'hits': only_red, 'potency': shots_potency},
+                  record=new_rec, timestamp=adesso)
+        if transition == OVERTIME:
+            log_event(state, 'overtime')
+
+    # Aggiornamento tabelle aggregate e tabellone nella stessa transazione
+    rollup = RollupChange()
+    rollup.add(new_rec)
+    rollup.apply()
+    scoreboard = ScoreboardChange()
+    scoreboard.add(new_rec)
+    scoreboard.apply()
+    if state:
+        # Effetti della transizione del tiro e transizioni a catena (dopo gli aggregati:
+        # una fine partita scrive Win/Loss anche su questo tiro)
+        transition_effects(state, transition)
+        settle_game_state(state, adesso)
+        # Fase cambiata: stato nello stesso commit del tiro; altrimenti salvato in background
+        match_engine.save(state)
     db.session.commit()
+    bump_stats_version(target_player.id)
 
     # --- Aggiornamento SocketIO ---
     if match:
+        after_game_commit(state)
         print(f"INVIO SEGNALE AGGIORNAMENTO PER MATCH {match.id}") 
-        socketio.emit('partita_aggiornata', {'match_id': match.id})
+        emit_match_update(match, new_rec, target_player.name)
     
     return redirect(url_for('main.index', player_name=player_name))
 
@@ -1328,12 +1194,24 @@ def delete_player(id):
         return redirect(url_for('main.login_page'))
 
     try:
-        # 2. Elimina PRIMA tutti i record associati (Tiri)
+        # 2. Elimina PRIMA tutti i record associati (Tiri) e i loro aggregati
+        touched_match_ids = [mid for (mid,) in db.session.query(PlayerRecord.match_id)
+                             .filter(PlayerRecord.player_id == id, PlayerRecord.match_id.isnot(None))
+                             .distinct()]
         PlayerRecord.query.filter_by(player_id=id).delete()
+        delete_rollups(id)
         
         # 3. Elimina il giocatore
         db.session.delete(player)
+        db.session.flush()
+
+        # 4. Tabellone delle partite in cui aveva tirato
+        if touched_match_ids:
+            refresh_scoreboards(ActiveMatch.query.filter(ActiveMatch.id.in_(touched_match_ids)).all())
         db.session.commit()
+        bump_stats_version(id)
+        # Nome e icona spariscono da tutte le card
+        clear_match_cards()
         
         msg = f"Giocatore {player.name} eliminato correttamente."
         if is_master:
@@ -1358,9 +1236,13 @@ def delete_record(player_name, id):
         match_id = record.match_id
         player_id = record.player_id
         
-        # 1. Cancella il tiro selezionato
+        # 1. Cancella il tiro selezionato (e lo togliamo dai bucket aggregati)
+        rollup = RollupChange()
+        rollup.remove(record)
+        scoreboard = ScoreboardChange()
+        scoreboard.remove(record)
         db.session.delete(record)
-        db.session.commit() # Commit necessario per aggiornare il DB
+        db.session.flush()
         
         # 2. LOGICA DI RIPARAZIONE SEQUENZA (Renumbering)
         # Se il tiro apparteneva a una partita, dobbiamo sistemare i numeri successivi
@@ -1375,10 +1257,38 @@ def delete_record(player_name, id):
             # Riassegniamo i numeri progressivi da 1 a N
             for index, shot in enumerate(remaining_shots):
                 # index parte da 0, quindi shot_number diventa index + 1
+                rollup.remove(shot)
                 shot.shot_number = index + 1
-            
-            # Salviamo le modifiche ai numeri
-            db.session.commit()
+                rollup.add(shot)
+        
+        # 3. Partita in corso: il tiro esce anche dallo stato di gioco.
+        # Il log degli eventi ricalcola lo stato senza quel tiro (undo) e lo restituisce.
+        match = ActiveMatch.query.get(match_id) if match_id else None
+        state = None
+        if match and match.status != 'finished':
+            event = MatchEvent.query.filter_by(match_id=match_id, kind='shot', record_id=id).first()
+            restored = undo_event(event) if event else None
+            if restored is not None:
+                state = match_engine.checkout(match)
+                for name in STATE_FIELDS:
+                    setattr(state, name, getattr(restored, name))
+
+        # Un solo commit: cancellazione, rinumerazione, aggregati, tabellone e stato insieme
+        rollup.apply()
+        scoreboard.apply()
+        if state is not None:
+            if state.status == FINISHED:
+                # Senza quel tiro la partita risulta finita (es. tiri successivi riapplicati)
+                finish_match(state)
+            match_engine.save(state)
+        db.session.commit()
+        bump_stats_version(player_id)
+        if state is not None:
+            after_game_commit(state)
+        else:
+            invalidate_match_card(match_id)
+        if state is not None:
+            emit_match_update(match)
 
     return redirect(url_for('main.index', player_name=player_name))
 
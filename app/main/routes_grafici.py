@@ -1,24 +1,13 @@
-from flask import render_template, session, redirect, url_for, flash
+from flask import render_template, session, redirect, url_for, flash, request, jsonify, current_app
 from app.main import bp
-from app.models import Player, PlayerRecord  # Aggiunto PlayerRecord
-from app.main.stats_extraction import get_player_stats 
-from app.main.stats_calculations import (
-    calculate_historical_percentages, 
-    calculate_daily_percentages, 
-    calculate_special_metrics,
-    calculate_daily_trend,  
-    calculate_hourly_trend,
-    calculate_streak_metrics,
-    calculate_partnership_metrics,
-    calculate_shot_performance_metrics,
-    calculate_insights,
-    calculate_position_by_cups,
-    calculate_format_heatmaps,
-    calculate_success_by_opp_cups,
-    calculate_comeback_and_flops,
-    calculate_overtime_metrics
-)
+from app.models import db, Player, PlayerRecord  # Aggiunto PlayerRecord
+from app.main.stats_cache import get_stats_engine, get_stats_engines, stats_cache
+from app.main.stats_engine import SECTION_COLUMNS, NAME_SECTIONS
+from app.main.stats_extraction import StatsWindow
 import json
+import gzip
+import hashlib
+import uuid
 
 # =============================================
 # HELPER: FILTRO GIOCATORI INVALIDI
@@ -29,6 +18,12 @@ def get_valid_players():
     return [p for p in all_players if p.name not in ['None', 'Nessuno', 'CLOSED'] 
             and 'admin' not in p.name.lower()]
 
+def get_name_map():
+    """Mappa 'id' -> nome di tutti i giocatori (con i segnaposto per i vuoti)."""
+    all_players_dict = {str(p.id): p.name for p in Player.query.all()}
+    all_players_dict.update({'0': '-', 'None': '-', 'None': 'Nessuno'})
+    return all_players_dict
+
 # =============================================
 # 1. GRAFICI PRINCIPALI (HOME)
 # =============================================
@@ -45,25 +40,24 @@ def grafici_home():
         return redirect(url_for('main.home'))
         
     real_name = player.name
-    dati_grezzi = get_player_stats(current_id)
+    window = StatsWindow.from_args(request.args)
+    engine = get_stats_engine(current_id, page="home", window=window)
+    dati_grezzi = engine.dati_grezzi
     players = get_valid_players()
 
-    historical_metrics = calculate_historical_percentages(dati_grezzi)
-    daily_metrics = calculate_daily_percentages(dati_grezzi)
-    special_metrics = calculate_special_metrics(dati_grezzi)
-    trend_daily = calculate_daily_trend(dati_grezzi)
-    trend_hourly = calculate_hourly_trend(dati_grezzi)
+    sezioni = engine.page("home")
 
     return render_template('grafici/grafici_home.html', 
                            player_name=real_name, 
                            players=players,
-                           stats_data=dati_grezzi["liste"],
+                           player_id=current_id,
+                           window=window,
                            counts=dati_grezzi["conteggi"],
-                           historical=historical_metrics,
-                           daily=daily_metrics,
-                           special=special_metrics,
-                           trend_daily=trend_daily,
-                           trend_hourly=trend_hourly)
+                           historical=sezioni["historical"],
+                           daily=sezioni["daily"],
+                           special=sezioni["special"],
+                           trend_daily=sezioni["trend_daily"],
+                           trend_hourly=sezioni["trend_hourly"])
 
 # =============================================
 # 2. GRAFICI EXTRA (Curiosità e Analisi)
@@ -74,53 +68,30 @@ def grafici_extra():
     if not current_id:
         return redirect(url_for('main.home'))
         
-    dati_grezzi = get_player_stats(current_id) 
     players_list = get_valid_players()
-    
-    all_players_full = Player.query.all()
-    all_players_dict = {str(p.id): p.name for p in all_players_full}
-    all_players_dict.update({'0': '-', 'None': '-', 'None': 'Nessuno'})
-
-    streaks = calculate_streak_metrics(dati_grezzi)
-    partnerships = calculate_partnership_metrics(dati_grezzi, all_players_dict)
-    
-    keys_to_remove = ['None', 'Nessuno', '-', 'CLOSED']
-    for key in keys_to_remove:
-        if key in partnerships:
-            del partnerships[key]
-
-    shot_metrics = calculate_shot_performance_metrics(dati_grezzi)
-    insights = calculate_insights(dati_grezzi, partnerships, shot_metrics)
-    pos_by_cups = calculate_position_by_cups(dati_grezzi)
-    comeback_flop_data = calculate_comeback_and_flops(dati_grezzi, all_players_dict)
-    ot_metrics = calculate_overtime_metrics(dati_grezzi)
-
-    hist = calculate_historical_percentages(dati_grezzi)
-    daily = calculate_daily_percentages(dati_grezzi)
+    all_players_dict = get_name_map()
 
-    delta_success = daily["daily_success_rate"] - hist["historical_success_rate"] if daily["matches"] > 0 else 0
-    delta_rim = daily["daily_rim_rate"] - hist["historical_rim_rate"] if daily["matches"] > 0 else 0
-
-    comparison = {
-        "delta_success": round(delta_success, 1),
-        "delta_rim": round(delta_rim, 1),
-        "played_today": daily["matches"] > 0
-    }
+    # Tutte le sezioni dalla stessa estrazione (storico e giornaliero calcolati una volta)
+    window = StatsWindow.from_args(request.args)
+    engine = get_stats_engine(current_id, all_players_dict, page="extra", window=window)
+    dati_grezzi = engine.dati_grezzi
+    sezioni = engine.page("extra")
 
     return render_template('grafici/grafici_extra.html', 
                            player_name=session.get('player_name'),
                            players=players_list, 
-                           stats_data=dati_grezzi["liste"],
+                           player_id=current_id,
+                           window=window,
                            counts=dati_grezzi["conteggi"],
-                           streaks=streaks,
-                           comebacks=comeback_flop_data["comebacks"],
-                           flops=comeback_flop_data["flops"],
-                           partnerships=partnerships,
-                           ot_metrics=ot_metrics,
-                           shot_metrics=shot_metrics,
-                           pos_by_cups=pos_by_cups,
-                           insights=insights,
-                           comparison=comparison)
+                           streaks=sezioni["streaks"],
+                           comebacks=sezioni["comebacks"]["comebacks"],
+                           flops=sezioni["comebacks"]["flops"],
+                           partnerships=sezioni["partnerships"],
+                           ot_metrics=sezioni["overtime"],
+                           shot_metrics=sezioni["shot_metrics"],
+                           pos_by_cups=sezioni["pos_by_cups"],
+                           insights=sezioni["insights"],
+                           comparison=sezioni["comparison"])
 
 # =============================================
 # 3. GRAFICI FORMATI (Heatmaps)
@@ -131,18 +102,62 @@ def grafici_formati():
     if not current_id:
         return redirect(url_for('main.home'))
     
-    dati_grezzi = get_player_stats(current_id)
+    window = StatsWindow.from_args(request.args)
+    engine = get_stats_engine(current_id, page="formati", window=window)
     players = get_valid_players()
     
-    success_by_cups = calculate_success_by_opp_cups(dati_grezzi)
-    format_3d_data = calculate_format_heatmaps(dati_grezzi)
+    sezioni = engine.page("formati")
     
     return render_template('grafici/grafici_formati.html', 
                            player_name=session.get('player_name'),
                            players=players,
-                           stats_data=dati_grezzi["liste"],
-                           success_by_cups=success_by_cups,
-                           format_3d_data=format_3d_data)
+                           player_id=current_id,
+                           window=window,
+                           success_by_cups=sezioni["success_by_cups"],
+                           format_3d_data=sezioni["format_3d"])
+
+# =============================================
+# 3b. CONFRONTO GIOCATORI (Affiancati)
+# =============================================
+# I giocatori scelti vengono estratti insieme (get_stats_engines: una query
+# per tutti quelli non in cache) e mostrati colonna per colonna.
+MAX_CONFRONTO = 8
+
+@bp.route('/grafici/confronto')
+def grafici_confronto():
+    current_id = session.get('player_id')
+    if not current_id:
+        return redirect(url_for('main.home'))
+
+    players = get_valid_players()
+    valid_ids = {p.id for p in players}
+    selected_ids = [pid for pid in dict.fromkeys(request.args.getlist('giocatori', type=int))
+                    if pid in valid_ids or pid == current_id]
+    if not selected_ids:
+        selected_ids = [current_id]
+    if len(selected_ids) > MAX_CONFRONTO:
+        flash(f"Puoi confrontare al massimo {MAX_CONFRONTO} giocatori.", "warning")
+        selected_ids = selected_ids[:MAX_CONFRONTO]
+
+    window = StatsWindow.from_args(request.args)
+    engines = get_stats_engines(selected_ids, page="confronto", window=window)
+
+    names = {p.id: p.name for p in players}
+    if current_id not in names:
+        names[current_id] = session.get('player_name')
+    confronto = [{"player_id": pid,
+                  "name": names.get(pid),
+                  "counts": engine.dati_grezzi["conteggi"],
+                  **engine.page("confronto")}
+                 for pid, engine in engines.items()]
+
+    return render_template('grafici/grafici_confronto.html',
+                           player_name=session.get('player_name'),
+                           players=players,
+                           player_id=current_id,
+                           window=window,
+                           selected_ids=selected_ids,
+                           confronto=confronto)
 
 # =============================================
 # 4. NOTE E DIARIO
@@ -194,4 +209,65 @@ def note_giocatore(player_name):
     return render_template('grafici/note.html', 
                            player_name=player_name, 
                            notes=enriched_notes,
-                           players=players)
\ No newline at end of file
+                           players=players)
+
+# =============================================
+# 5. API DATI GRAFICI (JSON)
+# =============================================
+# Le pagine dei grafici scaricano qui le serie da disegnare, una sezione per
+# richiesta. La risposta ha un ETag legato alla versione dei dati del
+# giocatore: finché non arrivano nuovi tiri il browser riceve 304 senza corpo.
+# Le versioni di stats_cache ripartono da zero a ogni avvio del processo, per
+# questo l'ETag contiene anche un identificativo dell'avvio: dopo un riavvio
+# nessun ETag vecchio è più valido.
+# I parametri dal / al / sessioni limitano la sezione a una finestra temporale.
+
+GZIP_MIN_SIZE = 1024
+BOOT_ID = uuid.uuid4().hex
+
+
+def _section_etag(player_id, section, name_map, window):
+    """ETag della sezione: avvio, versione dei dati e finestra (+ nomi, per le sezioni che li mostrano)."""
+    window_key = window.key() if window is not None else None
+    key = f"{BOOT_ID}:{player_id}:{stats_cache.version(player_id)}:{section}:{window_key}"
+    if name_map is not None:
+        key += ":" + repr(sorted(name_map.items()))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _encode_section(data):
+    """JSON della sezione + versione gzip (solo se conviene comprimere)."""
+    body = current_app.json.dumps(data).encode('utf-8')
+    compressed = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_SIZE else None
+    return body, compressed
+
+
+@bp.route('/api/stats/<int:player_id>/<section>')
+def api_stats_section(player_id, section):
+    if not session.get('player_id'):
+        return jsonify({"error": "Devi effettuare il login."}), 401
+    if section not in SECTION_COLUMNS:
+        return jsonify({"error": f"Sezione '{section}' inesistente."}), 404
+    if db.session.get(Player, player_id) is None:
+        return jsonify({"error": "Giocatore non trovato."}), 404
+
+    name_map = get_name_map() if section in NAME_SECTIONS else None
+    window = StatsWindow.from_args(request.args)
+    etag = _section_etag(player_id, section, name_map, window)
+
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        engine = get_stats_engine(player_id, name_map, sections=[section], window=window)
+        body, compressed = engine.payload(section, _encode_section)
+
+        if compressed is not None and 'gzip' in request.accept_encodings:
+            response = current_app.response_class(compressed, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = current_app.response_class(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
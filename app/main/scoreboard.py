@@ -0,0 +1,223 @@
+from sqlalchemy import func, update
+from app.models import db, Player, ActiveMatch, PlayerRecord
+
+# ==========================================
+#     TABELLONE SALVATO (Punteggi e tiri per slot)
+# ==========================================
+# ActiveMatch tiene score_t1 / score_t2 e i tiri di ogni slot (shots_t1_p1 ...)
+# già calcolati: lobby, storico e card dei tavoli li leggono senza toccare
+# i record. Le scritture sui tiri (add/edit/delete record) raccolgono i delta
+# con ScoreboardChange e li applicano nella loro stessa transazione, come
+# RollupChange per le tabelle aggregate. Quando cambiano i giocatori seduti
+# (slot assegnati o liberati, giocatore eliminato) la partita viene
+# ricalcolata dai record con refresh_scoreboards.
+#
+# Regole (identiche al vecchio calcolo dai record):
+# - punti: solo i centri dall'ultimo start_time, un multihit vale un punto
+#   per bicchiere colpito, assegnati alla squadra dello slot del giocatore
+# - tiri per slot: tutti i tiri della partita del giocatore seduto nello slot
+
+# Posti al tavolo di una partita (colonne di ActiveMatch con il nome del giocatore)
+MATCH_SLOTS = ('t1_p1', 't1_p2', 't2_p1', 't2_p2')
+
+
+def shots_column(slot):
+    return f"shots_{slot}"
+
+
+def score_column(slot):
+    return "score_t1" if slot.startswith("t1") else "score_t2"
+
+
+def hit_points(bicchiere_colpito):
+    """Valore di un centro: 1, oppure il numero di bicchieri se è un multihit."""
+    points = 1 # Default: vale almeno 1
+    if bicchiere_colpito:
+        # Esempio stringa: "3 Cen, 2 Dx" -> Dividiamo per virgola
+        # Esempio lista: ["3 Cen", "2 Dx"] -> Lunghezza 2
+        cups_hit_list = [c for c in bicchiere_colpito.split(',') if c.strip()]
+        if len(cups_hit_list) > 1:
+            points = len(cups_hit_list) # Vale 2, 3, ecc.
+    return points
+
+
+def counts_for_score(record, match):
+    """Il tiro è un centro fatto dopo l'ultimo start_time della partita?"""
+    return (record.centro == 'Sì' and record.timestamp is not None
+            and match.start_time is not None and record.timestamp >= match.start_time)
+
+
+def player_slot(match, player_name):
+    """Primo slot della partita occupato da player_name (None se non è seduto)."""
+    for slot in MATCH_SLOTS:
+        if player_name and getattr(match, slot) == player_name:
+            return slot
+    return None
+
+
+class ScoreboardChange:
+    """
+    Raccoglie le variazioni del tabellone dovute a tiri aggiunti o rimossi
+    e le applica con un UPDATE incrementale per partita (col = col + delta),
+    atomico anche con più richieste contemporanee sullo stesso tavolo.
+    """
+
+    def __init__(self):
+        self._deltas = {}   # match_id -> {colonna: delta}
+
+    def add(self, record):
+        self._collect(record, 1)
+
+    def remove(self, record):
+        self._collect(record, -1)
+
+    def _collect(self, record, sign):
+        if not record.match_id:
+            return
+        match = db.session.get(ActiveMatch, record.match_id)
+        player = db.session.get(Player, record.player_id) if record.player_id else None
+        if match is None or player is None:
+            return
+        slot = player_slot(match, player.name)
+        if slot is None:
+            return
+
+        deltas = self._deltas.setdefault(match.id, {})
+        column = shots_column(slot)
+        deltas[column] = deltas.get(column, 0) + sign
+        if counts_for_score(record, match):
+            column = score_column(slot)
+            deltas[column] = deltas.get(column, 0) + sign * hit_points(record.bicchiere_colpito)
+
+    def apply(self):
+        """Scrive i delta (senza commit: lo fa il chiamante)."""
+        for match_id, deltas in self._deltas.items():
+            values = {col: getattr(ActiveMatch, col) + delta for col, delta in deltas.items() if delta}
+            if values:
+                db.session.execute(update(ActiveMatch).where(ActiveMatch.id == match_id).values(**values))
+        self._deltas = {}
+
+
+# ==========================================
+#     CALCOLO DAI RECORD (ricalcolo e backfill)
+# ==========================================
+
+def get_player_ids_by_name(matches):
+    """Mappa nome -> id di tutti i giocatori seduti nelle partite indicate (una query)."""
+    names = {getattr(m, slot) for m in matches for slot in MATCH_SLOTS} - {None, ''}
+    if not names:
+        return {}
+    return dict(db.session.query(Player.name, Player.id).filter(Player.name.in_(names)).all())
+
+
+def get_scores_for_matches(matches, ids_by_name=None):
+    """
+    Punteggi di più partite calcolati dai record con una sola query sui centri:
+    {match_id: (score_t1, score_t2)}.
+    ids_by_name: mappa nome -> id già caricata (altrimenti viene letta qui).
+    """
+    scores = {m.id: (0, 0) for m in matches}
+    if not matches:
+        return scores
+    try:
+        if ids_by_name is None:
+            ids_by_name = get_player_ids_by_name(matches)
+
+        # 1. Squadra di ogni giocatore, partita per partita
+        teams = {}
+        for m in matches:
+            t1_ids = {ids_by_name[n] for n in (m.t1_p1, m.t1_p2) if n in ids_by_name}
+            t2_ids = {ids_by_name[n] for n in (m.t2_p1, m.t2_p2) if n in ids_by_name}
+            teams[m.id] = (t1_ids, t2_ids)
+
+        # 2. Tutti i centri delle partite, solo dall'ultimo start_time (Reset al Rematch)
+        hits = db.session.query(PlayerRecord.match_id, PlayerRecord.player_id, PlayerRecord.bicchiere_colpito)\
+            .join(ActiveMatch, ActiveMatch.id == PlayerRecord.match_id)\
+            .filter(PlayerRecord.match_id.in_(list(scores)),
+                    PlayerRecord.centro == 'Sì',
+                    PlayerRecord.timestamp >= ActiveMatch.start_time)\
+            .all()
+
+        totals = {match_id: [0, 0] for match_id in scores}
+        for match_id, player_id, bicchiere_colpito in hits:
+            t1_ids, t2_ids = teams[match_id]
+            # --- ASSEGNAZIONE PUNTI ---
+            if player_id in t1_ids:
+                totals[match_id][0] += hit_points(bicchiere_colpito)
+            elif player_id in t2_ids:
+                totals[match_id][1] += hit_points(bicchiere_colpito)
+
+        return {match_id: tuple(total) for match_id, total in totals.items()}
+
+    except Exception as e:
+        print(f"Errore calcolo punteggio avanzato: {e}")
+        return scores
+
+
+def get_shot_counts_for_matches(matches, ids_by_name=None):
+    """
+    Tiri di ogni slot delle partite indicate, dai record, con una sola query
+    GROUP BY: {match_id: {'t1_p1': n, 't1_p2': n, 't2_p1': n, 't2_p2': n}}.
+    """
+    if ids_by_name is None:
+        ids_by_name = get_player_ids_by_name(matches)
+    counts = {}
+    if matches:
+        counts = {(match_id, player_id): n for match_id, player_id, n in
+                  db.session.query(PlayerRecord.match_id, PlayerRecord.player_id, func.count(PlayerRecord.id))
+                  .filter(PlayerRecord.match_id.in_([m.id for m in matches]))
+                  .group_by(PlayerRecord.match_id, PlayerRecord.player_id).all()}
+    return {m.id: {slot: counts.get((m.id, ids_by_name.get(getattr(m, slot))), 0) for slot in MATCH_SLOTS}
+            for m in matches}
+
+
+def refresh_scoreboards(matches):
+    """Ricalcola dai record il tabellone delle partite indicate (senza commit)."""
+    if not matches:
+        return
+    ids_by_name = get_player_ids_by_name(matches)
+    scores = get_scores_for_matches(matches, ids_by_name)
+    shot_counts = get_shot_counts_for_matches(matches, ids_by_name)
+    for m in matches:
+        m.score_t1, m.score_t2 = scores[m.id]
+        for slot in MATCH_SLOTS:
+            setattr(m, shots_column(slot), shot_counts[m.id][slot])
+
+
+def backfill_scoreboards(match_id=None, batch_size=500):
+    """
+    Compila le colonne del tabellone per tutte le partite esistenti (o una sola),
+    a blocchi di batch_size partite. Restituisce il numero di partite aggiornate.
+    """
+    query = ActiveMatch.query.order_by(ActiveMatch.id.asc())
+    if match_id is not None:
+        query = query.filter(ActiveMatch.id == match_id)
+
+    updated = 0
+    last_id = 0
+    while True:
+        matches = query.filter(ActiveMatch.id > last_id).limit(batch_size).all()
+        if not matches:
+            break
+        refresh_scoreboards(matches)
+        db.session.commit()
+        updated += len(matches)
+        last_id = matches[-1].id
+    return updated
+
+
+def check_scoreboards():
+    """Differenze tra il tabellone salvato e il calcolo dai record (lista di stringhe)."""
+    differences = []
+    matches = ActiveMatch.query.order_by(ActiveMatch.id.asc()).all()
+    ids_by_name = get_player_ids_by_name(matches)
+    scores = get_scores_for_matches(matches, ids_by_name)
+    shot_counts = get_shot_counts_for_matches(matches, ids_by_name)
+    for m in matches:
+        if (m.score_t1, m.score_t2) != scores[m.id]:
+            differences.append(f"partita {m.id}: punteggio {m.score_t1}-{m.score_t2}, atteso {scores[m.id][0]}-{scores[m.id][1]}")
+        for slot in MATCH_SLOTS:
+            saved = getattr(m, shots_column(slot))
+            if saved != shot_counts[m.id][slot]:
+                differences.append(f"partita {m.id}: tiri {slot} {saved}, attesi {shot_counts[m.id][slot]}")
+    return differences
@@ -0,0 +1,202 @@
+import threading
+from sqlalchemy import or_
+from app.models import db, ActiveMatch
+from app.main.scoreboard import MATCH_SLOTS
+
+# ==========================================
+#     INDICE DEI GIOCATORI SEDUTI (In memoria)
+# ==========================================
+# Chi è seduto a quale tavolo: nome -> (match_id, team, slot) per tutte le
+# partite non finite. Costruito all'avvio dell'app (create_app) e tenuto
+# allineato dalle scritture che cambiano i posti: assign_slot,
+# remove_player_slot, rematch, finish_match, delete_match, gestione manuale
+# e cambio nome (update_icon), sempre DOPO il commit con sync_match_seats /
+# drop_match_seats. get_match_info lo usa a ogni tiro e a ogni vista del
+# tracker senza scorrere i tavoli attivi. L'indice non è l'unica fonte: se
+# non trova il giocatore (posto scritto fuori dalle rotte, o da un altro
+# processo) find_player_match lo cerca comunque nel DB con la query
+# indicizzata sugli slot e riallinea l'indice.
+# Come le altre cache vive nel processo; check() lo confronta con il DB
+# (flask check-seats) e rebuild() lo ricostruisce.
+
+# Posto "Nessuno": non è un giocatore
+CLOSED_SEAT = 'CLOSED'
+
+
+def match_seats(match):
+    """Posti occupati da giocatori veri: [(nome, team, slot)] (nessuno se la partita è finita)."""
+    if match.status == 'finished':
+        return []
+    return [(getattr(match, slot), slot[:2], slot) for slot in MATCH_SLOTS
+            if getattr(match, slot) and getattr(match, slot) != CLOSED_SEAT]
+
+
+class SeatIndex:
+
+    def __init__(self):
+        self._seats = {}      # nome -> {match_id: (team, slot)}
+        self._by_match = {}   # match_id -> [nomi]
+        self._built = False
+        self._lock = threading.Lock()
+
+    def rebuild(self):
+        """Ricostruisce l'indice da tutte le partite non finite (una query)."""
+        matches = ActiveMatch.query.filter(ActiveMatch.status != 'finished').all()
+        with self._lock:
+            self._seats = {}
+            self._by_match = {}
+            for match in matches:
+                self._add(match.id, match_seats(match))
+            self._built = True
+        return len(matches)
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def _add(self, match_id, seats):
+        names = []
+        for name, team, slot in seats:
+            # Stesso nome due volte nella stessa partita: vale il primo slot, come nella vecchia ricerca
+            self._seats.setdefault(name, {}).setdefault(match_id, (team, slot))
+            names.append(name)
+        if names:
+            self._by_match[match_id] = names
+
+    def _remove(self, match_id):
+        for name in self._by_match.pop(match_id, []):
+            seats = self._seats.get(name)
+            if seats is not None:
+                seats.pop(match_id, None)
+                if not seats:
+                    del self._seats[name]
+
+    def sync_match(self, match):
+        """Riallinea i posti di una partita (appena creata, modificata o finita)."""
+        self._ensure_built()
+        with self._lock:
+            self._remove(match.id)
+            self._add(match.id, match_seats(match))
+
+    def drop_match(self, match_id):
+        """Toglie dall'indice una partita eliminata."""
+        self._ensure_built()
+        with self._lock:
+            self._remove(match_id)
+
+    def lookup(self, player_name):
+        """(match_id, team, slot) del tavolo attivo del giocatore, oppure None."""
+        self._ensure_built()
+        with self._lock:
+            seats = self._seats.get(player_name)
+            if not seats:
+                return None
+            # Seduto a più tavoli (non dovrebbe succedere): il più vecchio, come la vecchia ricerca
+            match_id = min(seats)
+            return (match_id,) + seats[match_id]
+
+    def is_seated(self, player_name):
+        return self.lookup(player_name) is not None
+
+    def seated_names(self):
+        """Nomi di tutti i giocatori seduti a un tavolo attivo."""
+        self._ensure_built()
+        with self._lock:
+            return set(self._seats)
+
+    def check(self):
+        """Differenze tra l'indice e le partite nel DB (lista di stringhe)."""
+        self._ensure_built()
+        expected = {}
+        for match in ActiveMatch.query.filter(ActiveMatch.status != 'finished').all():
+            for name, team, slot in match_seats(match):
+                expected.setdefault(name, {}).setdefault(match.id, (team, slot))
+        with self._lock:
+            actual = {name: dict(seats) for name, seats in self._seats.items()}
+
+        differences = []
+        for name in sorted(set(expected) | set(actual)):
+            if expected.get(name) != actual.get(name):
+                differences.append(f"{name}: indice {actual.get(name)}, DB {expected.get(name)}")
+        return differences
+
+
+seat_index = SeatIndex()
+
+
+# ==========================================
+#     RICERCHE NEL DB (Indici sugli slot)
+# ==========================================
+# Le stesse domande fatte al database, servite dagli indici (slot, status)
+# di ActiveMatch: usate quando l'indice in memoria non basta (partite finite,
+# indice non allineato).
+
+def seated_filter(player_name):
+    """Condizione "player_name è seduto in uno dei quattro slot"."""
+    return or_(*[getattr(ActiveMatch, slot) == player_name for slot in MATCH_SLOTS])
+
+
+def query_player_match(player_name):
+    """Partita non finita del giocatore (la più vecchia, come la vecchia scansione) o None."""
+    if not player_name:
+        return None
+    return ActiveMatch.query.filter(seated_filter(player_name), ActiveMatch.status != 'finished')\
+        .order_by(ActiveMatch.id.asc()).first()
+
+
+def last_finished_match(player_name):
+    """Ultima partita finita giocata da player_name (o None)."""
+    return ActiveMatch.query.filter(seated_filter(player_name), ActiveMatch.status == 'finished')\
+        .order_by(ActiveMatch.id.desc()).first()
+
+
+def match_team(match, player_name):
+    """'t1' o 't2': squadra di player_name nella partita (None se non è seduto)."""
+    for slot in MATCH_SLOTS:
+        if getattr(match, slot) == player_name:
+            return slot[:2]
+    return None
+
+
+def find_player_match(player_name):
+    """
+    Partita attiva del giocatore e sua squadra: (match, 't1'/'t2') o (None, None).
+    Lettura dall'indice + caricamento della partita per chiave primaria; se
+    l'indice non ha il giocatore decide il DB (query indicizzata sugli slot).
+    """
+    seat = seat_index.lookup(player_name)
+    if seat is None:
+        match = query_player_match(player_name)
+        if match is None:
+            return None, None
+        # Seduto ma assente dall'indice: riallineiamo la partita
+        print(f"Indice posti non allineato per {player_name}: riallineamento.")
+        seat_index.sync_match(match)
+        return match, match_team(match, player_name)
+    match_id, team, slot = seat
+    match = db.session.get(ActiveMatch, match_id)
+    if match is None or match.status == 'finished' or getattr(match, slot) != player_name:
+        # Indice non allineato (scrittura fuori dalle rotte): chiediamo al DB
+        # (query indicizzata) e riallineiamo le partite coinvolte
+        print(f"Indice posti non allineato per {player_name}: riallineamento.")
+        if match is None:
+            seat_index.drop_match(match_id)
+        else:
+            seat_index.sync_match(match)
+        match = query_player_match(player_name)
+        if match is None:
+            return None, None
+        seat_index.sync_match(match)
+        team = match_team(match, player_name)
+    return match, team
+
+
+def sync_match_seats(*matches):
+    """Da chiamare DOPO il commit di ogni scrittura che cambia i posti o lo stato delle partite."""
+    for match in matches:
+        seat_index.sync_match(match)
+
+
+def drop_match_seats(match_id):
+    """Da chiamare DOPO il commit dell'eliminazione di una partita."""
+    seat_index.drop_match(match_id)
@@ -0,0 +1,232 @@
+import numpy as np
+
+# ==========================================
+#      SHOT FRAME (Dataset Colonnare NumPy)
+# ==========================================
+
+# Codici esito (int8)
+ESITO_NESSUNO = -1   # Nessun flag valorizzato (record incoerente)
+ESITO_MISS = 0
+ESITO_BORDO = 1
+ESITO_CENTRO = 2
+
+# Codici risultato partita (int8)
+RISULTATO_LOSS = -1
+RISULTATO_NONE = 0
+RISULTATO_WIN = 1
+
+# Sentinelle per i valori mancanti
+CUPS_NONE = -1
+HOUR_NONE = 255
+DAY_NONE = np.iinfo(np.int32).min
+ID_NONE = 0
+
+TRUE_VALUES = frozenset(('Sì', 'Si', 'True', True, 1))
+WIN_VALUES = ('Win', 'Vittoria')
+LOSS_VALUES = ('Loss', 'Sconfitta')
+
+_EPOCH_ORDINAL = np.datetime64('1970-01-01', 'D')
+
+
+def _categorical_column(values):
+    """
+    Codifica una colonna in codici interi + lista categorie.
+    Le categorie sono in ordine di prima apparizione (come i dict dei calcoli originali).
+    """
+    categories = list(dict.fromkeys(values))
+    lookup = {v: i for i, v in enumerate(categories)}
+    codes = np.fromiter(map(lookup.__getitem__, values), dtype=np.int32, count=len(values))
+    return codes, categories
+
+
+def _flag_column(values):
+    """Converte una lista di 'Sì'/'No' (o booleani) in un array bool."""
+    return np.fromiter(map(TRUE_VALUES.__contains__, values), dtype=bool, count=len(values))
+
+
+def _int_column(values, dtype, missing):
+    """Converte una lista di interi (o stringhe numeriche) sostituendo i non validi con la sentinella."""
+    try:
+        # Percorso veloce: None diventa NaN nella conversione a float
+        as_float = np.array(values, dtype=np.float64)
+        result = np.full(len(values), missing, dtype=dtype)
+        valid = ~np.isnan(as_float)
+        result[valid] = as_float[valid].astype(dtype)
+        return result
+    except (ValueError, TypeError):
+        pass
+
+    def _to_int(v):
+        if v is None:
+            return missing
+        try:
+            return int(v)
+        except (ValueError, TypeError):
+            return missing
+    return np.fromiter((_to_int(v) for v in values), dtype=dtype, count=len(values))
+
+
+def _day_column(values):
+    """
+    Converte le date 'YYYY-MM-DD' in ordinali int32 (giorni dal 1970-01-01).
+    Le date mancanti diventano DAY_NONE. Ogni data distinta viene analizzata una sola volta.
+    """
+    codes, categories = _categorical_column(values)
+
+    def _parse(v):
+        try:
+            return np.datetime64(v, 'D') if v else np.datetime64('NaT')
+        except ValueError:
+            return np.datetime64('NaT')
+
+    parsed = np.array([_parse(v) for v in categories], dtype='datetime64[D]')
+    days = (parsed - _EPOCH_ORDINAL).astype(np.int64)
+    days[np.isnat(parsed)] = DAY_NONE
+    return days.astype(np.int32)[codes] if len(values) else np.empty(0, dtype=np.int32)
+
+
+def day_to_str(day, fmt="%Y-%m-%d"):
+    """Riconverte un ordinale di giorno nella stringa data (None se mancante)."""
+    if day == DAY_NONE:
+        return None
+    date_obj = (_EPOCH_ORDINAL + np.timedelta64(int(day), 'D')).astype(object)
+    return date_obj.strftime(fmt)
+
+
+def id_to_key(value):
+    """Ricostruisce la chiave stringa usata dalle name_map (str(None) -> 'None')."""
+    return 'None' if value == ID_NONE else str(value)
+
+
+def _esito_column(lists):
+    centro = _flag_column(lists.get("centro", []))
+    bordo = _flag_column(lists.get("bordo", []))
+    miss = _flag_column(lists.get("miss", []))
+    esito = np.full(len(centro), ESITO_NESSUNO, dtype=np.int8)
+    esito[miss] = ESITO_MISS
+    esito[bordo] = ESITO_BORDO
+    esito[centro] = ESITO_CENTRO
+    return esito
+
+
+def _risultato_column(lists):
+    codes, categories = _categorical_column(lists.get("match_result", []))
+    lookup = np.array(
+        [RISULTATO_WIN if r in WIN_VALUES else RISULTATO_LOSS if r in LOSS_VALUES else RISULTATO_NONE
+         for r in categories] or [RISULTATO_NONE], dtype=np.int8)
+    return lookup[codes]
+
+
+# Colonna del frame -> (chiave nelle liste grezze, funzione di conversione)
+_COLUMNS = {
+    "esito": (None, _esito_column),
+    "cups_own": ("cups_own", lambda v: _int_column(v, np.int8, CUPS_NONE)),
+    "cups_opp": ("cups_opp", lambda v: _int_column(v, np.int8, CUPS_NONE)),
+    "day": ("match_date", _day_column),
+    "hour": ("match_hour", lambda v: _int_column(v, np.uint8, HOUR_NONE)),
+    "shot_number": ("shot_numbers", lambda v: _int_column(v, np.int16, -1)),
+    "match_id": ("match_ids", lambda v: _int_column(v, np.int32, ID_NONE)),
+    "teammate_id": ("teammate_ids", lambda v: _int_column(v, np.int32, ID_NONE)),
+    "opponent1_id": ("opponent1_ids", lambda v: _int_column(v, np.int32, ID_NONE)),
+    "opponent2_id": ("opponent2_ids", lambda v: _int_column(v, np.int32, ID_NONE)),
+    "is_overtime": ("is_overtime", _flag_column),
+    "is_salvezza": ("tiro_salvezza", _flag_column),
+    "risultato": (None, _risultato_column),
+}
+
+# Colonne categoriche: codici in <nome>, categorie in <nome>_cat
+_CATEGORICAL = {
+    "formato": "formato",
+    "postazione": "postazione",
+    "bevanda": "bevanda",
+    "colpiti": "bicchiere_colpito",
+    "multipli": "bicchieri_multipli",
+}
+
+
+class ShotFrame:
+    """
+    Rappresentazione colonnare dei tiri di un giocatore.
+    Ogni attributo è un array NumPy della stessa lunghezza (un elemento per tiro),
+    in ordine cronologico. Le colonne testuali a bassa cardinalità sono codificate
+    come categorie (codici + lista '<colonna>_cat').
+    """
+
+    __slots__ = (
+        "n", "esito", "cups_own", "cups_opp", "day", "hour", "shot_number",
+        "match_id", "teammate_id", "opponent1_id", "opponent2_id",
+        "is_overtime", "is_salvezza", "risultato",
+        "formato", "formato_cat", "postazione", "postazione_cat",
+        "bevanda", "bevanda_cat", "colpiti", "colpiti_cat", "multipli", "multipli_cat",
+        "_lists", "_cache",
+    )
+
+    def __init__(self):
+        # Maschere derivate calcolate una sola volta e condivise tra i calcoli
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @classmethod
+    def from_lists(cls, lists):
+        """
+        Costruisce il frame a partire dalle liste grezze di get_player_stats()['liste'].
+        Le colonne vengono convertite in modo pigro, alla prima lettura: ogni pagina
+        paga solo la conversione delle colonne che usa davvero.
+        """
+        frame = cls()
+        frame._lists = lists
+        frame.n = len(lists.get("ids", []))
+        return frame
+
+    def __getattr__(self, name):
+        # Chiamato solo per gli slot non ancora valorizzati
+        lists = object.__getattribute__(self, "_lists")
+        if name in _COLUMNS:
+            key, convert = _COLUMNS[name]
+            value = convert(lists if key is None else lists.get(key, []))
+            setattr(self, name, value)
+            return value
+
+        base = name[:-4] if name.endswith("_cat") else name
+        if base in _CATEGORICAL:
+            codes, categories = _categorical_column(lists.get(_CATEGORICAL[base], []))
+            setattr(self, base, codes)
+            setattr(self, f"{base}_cat", categories)
+            return getattr(self, name)
+
+        raise AttributeError(name)
+
+    # --- MASCHERE DI COMODO ---
+
+    @property
+    def centro(self):
+        return self._cached("centro", lambda: self.esito == ESITO_CENTRO)
+
+    @property
+    def bordo(self):
+        return self._cached("bordo", lambda: self.esito == ESITO_BORDO)
+
+    @property
+    def miss(self):
+        return self._cached("miss", lambda: self.esito == ESITO_MISS)
+
+    @property
+    def last_day(self):
+        """Ultima giornata di gioco (ordinale) oppure None se non ci sono date."""
+        def _compute():
+            valid = self.day[self.day != DAY_NONE]
+            return int(valid.max()) if valid.size else None
+        return self._cached("last_day", _compute)
+
+    def daily_mask(self):
+        """Maschera dei tiri dell'ultima giornata di gioco."""
+        def _compute():
+            last = self.last_day
+            if last is None:
+                return np.zeros(self.n, dtype=bool)
+            return self.day == last
+        return self._cached("daily_mask", _compute)
@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict
+from app.main.stats_engine import StatsEngine, page_columns, sections_columns
+from app.main.stats_extraction import get_players_stats
+
+# ==========================================
+#     CACHE STATISTICHE (Versionata per giocatore)
+# ==========================================
+# Ogni giocatore ha un numero di versione dei dati, incrementato da tutte le
+# scritture che toccano i suoi tiri (add/edit/delete record, fine partita,
+# eliminazione giocatore). La cache conserva l'estrazione e le sezioni già
+# calcolate sotto la chiave (player_id, versione): finché non cambia nulla,
+# i refresh di /grafici non ripetono né la query né i calcoli.
+# Ogni finestra temporale (StatsWindow) ha la sua voce: la chiave della voce è
+# (player_id, finestra) e una nuova versione del giocatore le invalida tutte.
+# La cache vive nel processo (l'app gira in un solo processo SocketIO).
+
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_SHOTS = 1_000_000
+
+
+class StatsCache:
+    """
+    LRU limitata sia nel numero di giocatori sia nel totale dei tiri in memoria
+    (l'occupazione di una voce è proporzionale ai tiri del giocatore).
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_shots=DEFAULT_MAX_SHOTS):
+        self.max_entries = max_entries
+        self.max_shots = max_shots
+        self._versions = {}
+        self._entries = OrderedDict()   # (player_id, finestra) -> (versione, engine)
+        self._shots = 0
+        self._lock = threading.Lock()
+
+    def version(self, player_id):
+        with self._lock:
+            return self._versions.get(player_id, 0)
+
+    def bump(self, *player_ids):
+        """Nuova versione dei dati: la voce in cache non verrà più usata."""
+        with self._lock:
+            for player_id in set(player_ids):
+                if player_id is None:
+                    continue
+                self._versions[player_id] = self._versions.get(player_id, 0) + 1
+                self._drop(player_id)
+
+    def get(self, player_id, loader, window_key=None):
+        """
+        Restituisce l'engine della versione corrente, creandolo con loader() se manca.
+        window_key: chiave della finestra temporale (None = tutti i tiri).
+        """
+        version, engine = self.lookup(player_id, window_key)
+        if engine is not None:
+            return engine
+
+        # Estrazione fuori dal lock (è la parte lenta)
+        engine = loader()
+        self.store(player_id, version, engine, window_key)
+        return engine
+
+    def lookup(self, player_id, window_key=None):
+        """(versione corrente, engine in cache oppure None)."""
+        key = (player_id, window_key)
+        with self._lock:
+            version = self._versions.get(player_id, 0)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return version, entry[1]
+            return version, None
+
+    def store(self, player_id, version, engine, window_key=None):
+        """Salva un engine caricato alla versione letta con lookup()."""
+        key = (player_id, window_key)
+        with self._lock:
+            # Se nel frattempo qualcuno ha scritto, non salviamo dati già vecchi
+            if self._versions.get(player_id, 0) == version:
+                self._drop_key(key)
+                self._entries[key] = (version, engine)
+                self._shots += engine.frame.n
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._shots = 0
+
+    def _drop(self, player_id):
+        """Scarta tutte le finestre del giocatore."""
+        for key in [k for k in self._entries if k[0] == player_id]:
+            self._drop_key(key)
+
+    def _drop_key(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._shots -= entry[1].frame.n
+
+    def _evict(self):
+        # Teniamo sempre almeno la voce appena inserita
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._shots > self.max_shots):
+            _, (_, engine) = self._entries.popitem(last=False)
+            self._shots -= engine.frame.n
+
+
+stats_cache = StatsCache()
+
+
+def get_stats_engine(player_id, name_map=None, page=None, sections=None, window=None):
+    """
+    StatsEngine del giocatore dalla cache (estrazione + sezioni già calcolate).
+    Con page (o sections) vengono caricate solo le colonne dichiarate; quelle
+    che mancano si aggiungono alla voce in cache alla prima richiesta che le usa.
+    Le sezioni che dipendono dai nomi vengono ricalcolate se name_map è cambiata.
+    window: StatsWindow opzionale (ogni finestra ha la sua voce in cache).
+    """
+    if page:
+        columns = page_columns(page)
+    elif sections:
+        columns = sections_columns(sections)
+    else:
+        columns = None
+    window_key = window.key() if window is not None else None
+    engine = stats_cache.get(player_id, lambda: StatsEngine.for_player(player_id, columns, window=window), window_key)
+    if not engine.load_columns(columns):
+        # Scrittura concorrente: usiamo un'estrazione nuova, fuori cache
+        engine = StatsEngine.for_player(player_id, columns, window=window)
+    engine.set_name_map(name_map)
+    return engine
+
+
+def get_stats_engines(player_ids, name_map=None, page=None, sections=None, window=None):
+    """
+    Come get_stats_engine per più giocatori (es. la pagina di confronto):
+    i giocatori che non sono in cache vengono estratti tutti insieme con
+    get_players_stats (una query invece di una per giocatore).
+    Restituisce {player_id: engine} nell'ordine di player_ids.
+    """
+    if page:
+        columns = page_columns(page)
+    elif sections:
+        columns = sections_columns(sections)
+    else:
+        columns = None
+    window_key = window.key() if window is not None else None
+
+    engines, versions = {}, {}
+    for player_id in player_ids:
+        versions[player_id], engines[player_id] = stats_cache.lookup(player_id, window_key)
+
+    missing = [pid for pid, engine in engines.items() if engine is None]
+    if missing:
+        for player_id, dati_grezzi in get_players_stats(missing, columns, window).items():
+            engine = StatsEngine(dati_grezzi, player_id=player_id, window=window)
+            stats_cache.store(player_id, versions[player_id], engine, window_key)
+            engines[player_id] = engine
+
+    for player_id, engine in engines.items():
+        if not engine.load_columns(columns):
+            engine = engines[player_id] = StatsEngine.for_player(player_id, columns, window=window)
+        engine.set_name_map(name_map)
+    return engines
+
+
+def bump_stats_version(*player_ids):
+    """Da chiamare DOPO il commit di ogni scrittura sui tiri dei giocatori indicati."""
+    stats_cache.bump(*player_ids)
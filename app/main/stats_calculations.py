@@ -695,6 +695,13 @@ def calculate_insights(data, partnerships, shot_metrics):
         "best_day_rate": round(best_day_rate, 1)
     }
 
+# Nomi delle postazioni normalizzati (SX, CEN, DX)
+POSITION_MAP = {
+    "Sinistra": "Sinistra", "SX": "Sinistra", "Sx": "Sinistra",
+    "Destra": "Destra", "DX": "Destra", "Dx": "Destra",
+    "Centrale": "Centrale", "Centro": "Centrale", "CEN": "Centrale"
+}
+
 def calculate_position_by_cups(data):
     """
     Calcola la % di successo per ogni postazione (SX, CEN, DX) 
@@ -706,11 +713,7 @@ def calculate_position_by_cups(data):
     stats = {}
     
     # Mappa per normalizzare i nomi delle postazioni
-    pos_map = {
-        "Sinistra": "Sinistra", "SX": "Sinistra", "Sx": "Sinistra",
-        "Destra": "Destra", "DX": "Destra", "Dx": "Destra",
-        "Centrale": "Centrale", "Centro": "Centrale", "CEN": "Centrale"
-    }
+    pos_map = POSITION_MAP
 
     cups_list = lists.get("cups_opp", [])
     pos_list = lists.get("postazione", [])
@@ -774,44 +777,39 @@ def calculate_position_by_cups(data):
         "dx": data_dx
     }
 
-def calculate_format_heatmaps(data):
-    """
-    Calcola le percentuali per i grafici 3D.
-    - COORDINATE CORRETTE: Y=0 è la parte bassa (vicino al giocatore).
-    - EXCLUDE: Singolo Centrale.
-    - FIX: Alias per Linea Verticale.
-    - ORDER: Piramide, Rombo, Triangolo, Linea Verticale, Linea Orizzontale.
-    """
-    lists = data.get("liste", {})
-    
-    # 1. DEFINIZIONE LAYOUT
-    layout_coords = {
-        "Piramide": {
-            "1 Cen": [1, 0],
-            "2 Sx": [0.5, 1], "2 Dx": [1.5, 1], 
-            "3 Sx": [0, 2], "3 Cen": [1, 2], "3 Dx": [2, 2]
-        },
-        "Rombo": {
-            "R1 Cen": [1, 0], 
-            "R2 Sx": [0, 1], "R2 Dx": [2, 1], 
-            "R3 Cen": [1, 2]
-        },
-        "Triangolo": {
-            "T1 Cen": [1, 0], 
-            "T2 Sx": [0.5, 1], "T2 Dx": [1.5, 1]
-        },
-        "Linea Verticale": { 
-            "LV 1": [0, 0], 
-            "LV 2": [0, 1] 
-        },
-        "Linea Orizzontale": { 
-            "LO Sx": [0, 0], "LO Dx": [1, 0] 
-        }
+# Layout dei bicchieri per i grafici 3D (Y=0 è la parte bassa, vicino al giocatore)
+HEATMAP_LAYOUTS = {
+    "Piramide": {
+        "1 Cen": [1, 0],
+        "2 Sx": [0.5, 1], "2 Dx": [1.5, 1], 
+        "3 Sx": [0, 2], "3 Cen": [1, 2], "3 Dx": [2, 2]
+    },
+    "Rombo": {
+        "R1 Cen": [1, 0], 
+        "R2 Sx": [0, 1], "R2 Dx": [2, 1], 
+        "R3 Cen": [1, 2]
+    },
+    "Triangolo": {
+        "T1 Cen": [1, 0], 
+        "T2 Sx": [0.5, 1], "T2 Dx": [1.5, 1]
+    },
+    "Linea Verticale": { 
+        "LV 1": [0, 0], 
+        "LV 2": [0, 1] 
+    },
+    "Linea Orizzontale": { 
+        "LO Sx": [0, 0], "LO Dx": [1, 0] 
     }
+}
 
-    # 2. NORMALIZZAZIONE
+# Ordine esatto dei formati nell'output
+HEATMAP_ORDER = ["Piramide", "Rombo", "Triangolo", "Linea Verticale", "Linea Orizzontale"]
+
+
+def normalized_heatmap_layouts():
+    """Mappa nome formato normalizzato -> {real_name, cups normalizzati} (con alias)."""
     normalized_layouts = {}
-    for fmt_key, cups_map in layout_coords.items():
+    for fmt_key, cups_map in HEATMAP_LAYOUTS.items():
         fmt_low = fmt_key.lower().strip()
         normalized_layouts[fmt_low] = {
             "real_name": fmt_key,
@@ -828,47 +826,43 @@ def calculate_format_heatmaps(data):
     if "piramide" in normalized_layouts:
         normalized_layouts["piramide"]["cups"]["1"] = "1 Cen"
 
-    # 3. RECUPERO DATI
-    formats_list = lists.get("formato", []) or []
-    hits_list = lists.get("bicchiere_colpito", []) or []
+    return normalized_layouts
 
-    stats = {}
-    format_totals = {}
 
-    # 4. CICLO ELABORAZIONE
-    for fmt, hit_str in zip(formats_list, hits_list):
-        if not fmt or str(fmt) in ['-', 'None', '']: continue
-        if not hit_str or str(hit_str) in ['-', 'None', 'N/A', '', '[]']: continue
+def resolve_heatmap_hits(fmt, hit_str, normalized_layouts):
+    """
+    Traduce una coppia (formato, bicchieri colpiti) nel formato reale e nella lista
+    dei bicchieri riconosciuti. Restituisce (None, []) se la coppia va scartata.
+    """
+    if not fmt or str(fmt) in ['-', 'None', '']: return None, []
+    if not hit_str or str(hit_str) in ['-', 'None', 'N/A', '', '[]']: return None, []
 
-        fmt_clean = str(fmt).lower().strip()
-        if fmt_clean == 'altro':
-            if '1' in str(hit_str) or '2' in str(hit_str): fmt_clean = 'linea verticale'
+    fmt_clean = str(fmt).lower().strip()
+    if fmt_clean == 'altro':
+        if '1' in str(hit_str) or '2' in str(hit_str): fmt_clean = 'linea verticale'
 
-        if fmt_clean in normalized_layouts:
-            real_fmt = normalized_layouts[fmt_clean]["real_name"]
-            cups_hit = [c.strip() for c in str(hit_str).split(',') if c.strip()]
-            
-            for cup in cups_hit:
-                cup_clean = cup.lower().replace(" ", "")
-                target_cups_map = normalized_layouts[fmt_clean]["cups"]
-                
-                if cup_clean in target_cups_map:
-                    real_cup_name = target_cups_map[cup_clean]
-                    if real_fmt not in stats:
-                        stats[real_fmt] = {}; format_totals[real_fmt] = 0
-                    stats[real_fmt][real_cup_name] = stats[real_fmt].get(real_cup_name, 0) + 1
-                    format_totals[real_fmt] += 1
-
-    # 5. OUTPUT ORDINATO
-    # Definiamo l'ordine esatto richiesto
-    desired_order = ["Piramide", "Rombo", "Triangolo", "Linea Verticale", "Linea Orizzontale"]
+    if fmt_clean not in normalized_layouts: return None, []
+
+    real_fmt = normalized_layouts[fmt_clean]["real_name"]
+    target_cups_map = normalized_layouts[fmt_clean]["cups"]
+    cups_hit = [c.strip() for c in str(hit_str).split(',') if c.strip()]
+    real_cups = []
+    for cup in cups_hit:
+        cup_clean = cup.lower().replace(" ", "")
+        if cup_clean in target_cups_map:
+            real_cups.append(target_cups_map[cup_clean])
+    return real_fmt, real_cups
+
+
+def build_heatmap_output(stats, format_totals):
+    """Costruisce l'output ordinato dei grafici 3D dai conteggi per formato/bicchiere."""
     result = {}
 
     # Iteriamo sulla lista ordinata. Se il formato esiste nei dati (stats), lo aggiungiamo.
-    for fmt in desired_order:
+    for fmt in HEATMAP_ORDER:
         if fmt in stats:
             cup_counts = stats[fmt]
-            coords_map = layout_coords.get(fmt)
+            coords_map = HEATMAP_LAYOUTS.get(fmt)
             total_hits = format_totals.get(fmt, 0)
             chart_data = []
             
@@ -884,6 +878,43 @@ def calculate_format_heatmaps(data):
 
     return result
 
+
+def calculate_format_heatmaps(data):
+    """
+    Calcola le percentuali per i grafici 3D.
+    - COORDINATE CORRETTE: Y=0 è la parte bassa (vicino al giocatore).
+    - EXCLUDE: Singolo Centrale.
+    - FIX: Alias per Linea Verticale.
+    - ORDER: Piramide, Rombo, Triangolo, Linea Verticale, Linea Orizzontale.
+    """
+    lists = data.get("liste", {})
+    normalized_layouts = normalized_heatmap_layouts()
+
+    formats_list = lists.get("formato", []) or []
+    hits_list = lists.get("bicchiere_colpito", []) or []
+
+    stats = {}
+    format_totals = {}
+
+    for fmt, hit_str in zip(formats_list, hits_list):
+        real_fmt, real_cups = resolve_heatmap_hits(fmt, hit_str, normalized_layouts)
+        for real_cup_name in real_cups:
+            if real_fmt not in stats:
+                stats[real_fmt] = {}; format_totals[real_fmt] = 0
+            stats[real_fmt][real_cup_name] = stats[real_fmt].get(real_cup_name, 0) + 1
+            format_totals[real_fmt] += 1
+
+    return build_heatmap_output(stats, format_totals)
+
+def clean_format_name(raw_fmt):
+    """Nome del formato per il grafico bicchieri avversari (None se da scartare)."""
+    if not raw_fmt or str(raw_fmt) in ['-', 'None', 'nan', '']:
+        return None
+    fmt_clean = str(raw_fmt).strip()
+    if fmt_clean in ('Altro', 'LineaVerticale'):
+        fmt_clean = 'Linea Verticale'
+    return fmt_clean
+
 def calculate_success_by_opp_cups(data):
     """
     Calcola la % di successo in base al numero di bicchieri avversari presenti (1-6).
@@ -0,0 +1,267 @@
+from app.main.shot_frame import ShotFrame
+from app.main import stats_vectorized as calc
+from app.main import stats_rollup as rollup
+from app.main import stats_queries as queries
+from app.main.stats_extraction import get_player_stats, LIST_COLUMNS
+
+# ==========================================
+#     STATS ENGINE (Un solo passaggio)
+# ==========================================
+
+# Sezioni richieste da ciascuna pagina dei grafici
+PAGE_SECTIONS = {
+    "home": ("historical", "daily", "special", "trend_daily", "trend_hourly", "distribution"),
+    "extra": ("streaks", "partnerships", "shot_metrics", "insights", "pos_by_cups",
+              "comebacks", "overtime", "comparison", "category_success"),
+    "formati": ("success_by_cups", "format_3d", "format_summary"),
+    "confronto": ("historical", "special", "streaks", "distribution"),
+}
+
+# Colonne delle liste grezze lette da ciascuna sezione (oltre a BASE_COLUMNS)
+SECTION_COLUMNS = {
+    "historical": (),
+    "daily": ("match_date", "match_result"),
+    "special": ("match_date", "tiro_salvezza", "bicchieri_multipli"),
+    "trend_daily": ("match_date",),
+    "trend_hourly": ("match_date", "match_hour"),
+    "streaks": ("match_date",),
+    "partnerships": ("teammate_ids", "opponent1_ids", "opponent2_ids", "match_result"),
+    "shot_metrics": ("match_date", "shot_numbers", "cups_own", "cups_opp"),
+    "insights": ("match_date", "bevanda", "postazione"),
+    "pos_by_cups": ("cups_opp", "postazione"),
+    "comebacks": ("match_date", "match_result", "cups_own", "cups_opp",
+                  "teammate_ids", "opponent1_ids", "opponent2_ids"),
+    "overtime": ("is_overtime", "match_result", "shot_numbers"),
+    "comparison": ("match_date", "match_result"),
+    "success_by_cups": ("cups_opp", "formato"),
+    "format_3d": ("formato", "bicchiere_colpito"),
+    "distribution": (),
+    "category_success": ("bevanda", "postazione"),
+    "format_summary": ("formato", "match_result"),
+}
+
+
+def sections_columns(section_names):
+    """Colonne delle liste grezze necessarie a un insieme di sezioni."""
+    columns = set()
+    for name in section_names:
+        columns.update(SECTION_COLUMNS[name])
+    return columns
+
+
+def page_columns(page_name):
+    """Colonne delle liste grezze necessarie a una pagina dei grafici."""
+    return sections_columns(PAGE_SECTIONS[page_name])
+
+# Sezioni che usano i nomi dei giocatori (da ricalcolare se cambia la name_map)
+NAME_SECTIONS = ("partnerships", "insights", "comebacks")
+
+# Sezioni che possono essere lette dalle tabelle di aggregazione (rollup)
+ROLLUP_SECTIONS = ("trend_daily", "trend_hourly", "pos_by_cups", "success_by_cups", "format_3d")
+
+# ...di cui filtrabili per data (solo i bucket dell'andamento hanno la data)
+WINDOWED_ROLLUP_SECTIONS = ("trend_daily", "trend_hourly")
+
+# Con una finestra temporale: sezioni contate dal DB con un GROUP BY filtrato
+# sulla finestra (stats_queries.py); le altre vengono calcolate dai tiri
+WINDOWED_QUERY_SECTIONS = ("pos_by_cups", "success_by_cups")
+
+
+class StatsEngine:
+    """
+    Calcola le metriche dei grafici a partire da un unico ShotFrame.
+    Le liste grezze vengono convertite una sola volta, le maschere condivise
+    (centri, bordi, ultima giornata) sono memorizzate nel frame e ogni sezione
+    viene calcolata al massimo una volta, anche se più sezioni la usano
+    (es. 'historical' e 'daily' servono sia alla home che al confronto di extra).
+    Se viene passato player_id, le sezioni in ROLLUP_SECTIONS sono lette dai
+    bucket aggregati del giocatore invece che dai tiri; con una finestra
+    temporale quelle in WINDOWED_QUERY_SECTIONS sono aggregate dal DB.
+    window (StatsWindow) è la finestra temporale con cui sono stati estratti
+    i tiri: viene applicata anche ai bucket e alle colonne caricate dopo.
+    """
+
+    def __init__(self, dati_grezzi, name_map=None, player_id=None, window=None):
+        self.dati_grezzi = dati_grezzi
+        self.frame = ShotFrame.from_lists(dati_grezzi["liste"])
+        self.counts = dati_grezzi["conteggi"]
+        self.name_map = name_map or {}
+        self.player_id = player_id
+        self.window = window
+        self._sections = {}
+        self._buckets = {}
+        self._payloads = {}
+
+    def section(self, name):
+        """Restituisce una sezione, calcolandola solo alla prima richiesta."""
+        if name not in self._sections:
+            if self._from_rollup(name):
+                self._sections[name] = getattr(self, f"_rollup_{name}")()
+            elif self._from_query(name):
+                self._sections[name] = getattr(self, f"_query_{name}")()
+            else:
+                self._sections[name] = getattr(self, f"_compute_{name}")()
+        return self._sections[name]
+
+    def _from_rollup(self, name):
+        if self.player_id is None or name not in ROLLUP_SECTIONS:
+            return False
+        return self.window is None or name in WINDOWED_ROLLUP_SECTIONS
+
+    def _from_query(self, name):
+        return self.player_id is not None and self.window is not None and name in WINDOWED_QUERY_SECTIONS
+
+    @classmethod
+    def for_player(cls, player_id, columns=None, name_map=None, window=None):
+        """Carica dal DB solo le colonne indicate (None = tutte) nella finestra indicata."""
+        return cls(get_player_stats(player_id, columns, window), name_map, player_id, window)
+
+    def load_columns(self, columns=None):
+        """
+        Aggiunge le colonne mancanti (None = tutte) leggendole dal DB.
+        Restituisce False se i tiri nel frattempo sono cambiati
+        (le nuove colonne non sarebbero allineate alle vecchie).
+        """
+        lists = self.dati_grezzi["liste"]
+        wanted = LIST_COLUMNS.keys() if columns is None else columns
+        missing = [k for k in wanted if k not in lists]
+        if not missing:
+            return True
+        extra = get_player_stats(self.player_id, missing, self.window)["liste"]
+        if extra["ids"] != lists["ids"]:
+            return False
+        for key in missing:
+            lists[key] = extra.get(key, [])
+        return True
+
+    def payload(self, name, encode):
+        """
+        Sezione già serializzata per l'API JSON: encode(dati) viene chiamato una
+        sola volta per sezione e il risultato resta legato a questo engine.
+        """
+        if name not in self._payloads:
+            self._payloads[name] = encode(self.section(name))
+        return self._payloads[name]
+
+    def set_name_map(self, name_map):
+        """Aggiorna la mappa id -> nome, scartando le sezioni che la usavano."""
+        if name_map is None or name_map == self.name_map:
+            return
+        self.name_map = name_map
+        for name in NAME_SECTIONS:
+            self._sections.pop(name, None)
+            self._payloads.pop(name, None)
+
+    def page(self, page_name):
+        """Tutte le sezioni di una pagina, come dizionario {sezione: dati}."""
+        return {name: self.section(name) for name in PAGE_SECTIONS[page_name]}
+
+    # --- SEZIONI HOME ---
+
+    def _compute_historical(self):
+        return calc.calculate_historical_percentages(self.frame)
+
+    def _compute_daily(self):
+        return calc.calculate_daily_percentages(self.frame)
+
+    def _compute_special(self):
+        return calc.calculate_special_metrics(self.frame)
+
+    def _compute_trend_daily(self):
+        return calc.calculate_daily_trend(self.frame)
+
+    def _compute_trend_hourly(self):
+        return calc.calculate_hourly_trend(self.frame)
+
+    def _compute_distribution(self):
+        return calc.calculate_shot_distribution(self.frame)
+
+    # --- SEZIONI EXTRA ---
+
+    def _compute_streaks(self):
+        return calc.calculate_streak_metrics(self.frame)
+
+    def _compute_partnerships(self):
+        partnerships = calc.calculate_partnership_metrics(self.frame, self.name_map)
+        for key in ['None', 'Nessuno', '-', 'CLOSED']:
+            if key in partnerships:
+                del partnerships[key]
+        return partnerships
+
+    def _compute_shot_metrics(self):
+        return calc.calculate_shot_performance_metrics(self.frame)
+
+    def _compute_insights(self):
+        return calc.calculate_insights(self.frame, self.section("partnerships"), self.section("shot_metrics"))
+
+    def _compute_pos_by_cups(self):
+        return calc.calculate_position_by_cups(self.frame)
+
+    def _compute_comebacks(self):
+        return calc.calculate_comeback_and_flops(self.frame, self.name_map)
+
+    def _compute_overtime(self):
+        return calc.calculate_overtime_metrics(self.frame)
+
+    def _compute_category_success(self):
+        return calc.calculate_category_success(self.frame)
+
+    def _compute_comparison(self):
+        hist = self.section("historical")
+        daily = self.section("daily")
+
+        delta_success = daily["daily_success_rate"] - hist["historical_success_rate"] if daily["matches"] > 0 else 0
+        delta_rim = daily["daily_rim_rate"] - hist["historical_rim_rate"] if daily["matches"] > 0 else 0
+
+        return {
+            "delta_success": round(delta_success, 1),
+            "delta_rim": round(delta_rim, 1),
+            "played_today": daily["matches"] > 0
+        }
+
+    # --- SEZIONI FORMATI ---
+
+    def _compute_success_by_cups(self):
+        return calc.calculate_success_by_opp_cups(self.frame)
+
+    def _compute_format_3d(self):
+        return calc.calculate_format_heatmaps(self.frame)
+
+    def _compute_format_summary(self):
+        return calc.calculate_format_summary(self.frame)
+
+    # --- SEZIONI DAI ROLLUP ---
+
+    def _bucket_rows(self, name):
+        if name not in self._buckets:
+            window = self.window if name == "trend" else None
+            self._buckets[name] = rollup.load_buckets(name, self.player_id, window)
+        return self._buckets[name]
+
+    def _cup_buckets(self):
+        if "cup" not in self._buckets:
+            self._buckets["cup"] = rollup.load_cup_buckets(self.player_id)
+        return self._buckets["cup"]
+
+    def _rollup_trend_daily(self):
+        return rollup.calculate_daily_trend(self._bucket_rows("trend"))
+
+    def _rollup_trend_hourly(self):
+        return rollup.calculate_hourly_trend(self._bucket_rows("trend"))
+
+    def _rollup_pos_by_cups(self):
+        return rollup.calculate_position_by_cups(self._bucket_rows("position"))
+
+    def _rollup_success_by_cups(self):
+        return rollup.calculate_success_by_opp_cups(self._bucket_rows("format"))
+
+    def _rollup_format_3d(self):
+        return rollup.calculate_format_heatmaps(self._cup_buckets())
+
+    # --- SEZIONI DAL DB CON FINESTRA (GROUP BY) ---
+
+    def _query_pos_by_cups(self):
+        return queries.calculate_position_by_cups(self.player_id, self.window)
+
+    def _query_success_by_cups(self):
+        return queries.calculate_success_by_opp_cups(self.player_id, self.window)
@@ -1,115 +1,203 @@
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
 from app.models import PlayerRecord, db
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
 
-def get_player_stats(player_id):
+# Chiave nelle liste grezze -> colonna di PlayerRecord
+LIST_COLUMNS = {
+    "ids": "id",
+    "match_ids": "match_id",
+    "teammate_ids": "teammate_id",
+    "opponent1_ids": "opponent1_id",
+    "opponent2_ids": "opponent2_id",
+    "shot_numbers": "shot_number",
+
+    # Esiti
+    "miss": "miss",
+    "bordo": "bordo",
+    "centro": "centro",
+
+    "bicchiere_colpito": "bicchiere_colpito",
+
+    "cups_own": "cups_own",
+    "cups_opp": "cups_opp",
+
+    # Tempo
+    "match_date": "match_date",
+    "match_hour": "match_hour",
+
+    # Contesto
+    "is_overtime": "is_overtime",
+    "match_result": "match_result",
+    "note": "note",
+    "tiro_salvezza": "tiro_salvezza",
+    "bicchieri_multipli": "bicchieri_multipli",
+    "formato": "formato",
+    "postazione": "postazione",
+    "bevanda": "bevanda"
+}
+
+# Sempre caricate: servono per i conteggi e per la lunghezza del dataset
+BASE_COLUMNS = ("ids", "match_ids", "miss", "bordo", "centro")
+
+
+# ==========================================
+#     FINESTRA TEMPORALE
+# ==========================================
+# Le statistiche possono essere limitate a un intervallo di date (dal / al,
+# estremi inclusi) e/o alle ultime N sessioni, dove una sessione è una
+# giornata di gioco (match_date distinta). La finestra diventa un predicato
+# sulla query stessa (indice ix_records_player_date): il database legge solo
+# i tiri nel range invece di filtrare in Python dopo averli caricati tutti.
+
+class StatsWindow:
+    """Intervallo di date e/o ultime N sessioni di un giocatore."""
+
+    def __init__(self, date_from=None, date_to=None, last_sessions=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.last_sessions = last_sessions
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Legge la finestra dai parametri della richiesta: dal, al (YYYY-MM-DD)
+        e sessioni (intero > 0). Valori non validi vengono ignorati.
+        Restituisce None se non c'è nessun limite.
+        """
+        window = cls(_parse_date(args.get("dal")), _parse_date(args.get("al")),
+                     _parse_positive_int(args.get("sessioni")))
+        return window if window.key() != (None, None, None) else None
+
+    def key(self):
+        """Chiave hashable (cache, ETag)."""
+        return (self.date_from, self.date_to, self.last_sessions)
+
+    def query_args(self):
+        """Parametri da riportare nei link / nelle chiamate API."""
+        args = {"dal": self.date_from, "al": self.date_to, "sessioni": self.last_sessions}
+        return {k: v for k, v in args.items() if v is not None}
+
+    def filters(self, player_id, model=PlayerRecord):
+        """
+        Predicati SQLAlchemy sulla colonna match_date di model (PlayerRecord o
+        una tabella di rollup con player_id e match_date).
+        player_id può essere anche la colonna model.player_id (query su più
+        giocatori): le ultime N sessioni sono allora calcolate per ciascuno.
+        """
+        filters = self._range_filters(model)
+        if self.last_sessions:
+            # Data della N-esima giornata più recente (nel range): tutto ciò che
+            # viene da quella data in poi. Con meno di N giornate vale ''
+            # e passano tutte le date.
+            inner = aliased(model)
+            cutoff = select(inner.match_date)\
+                .where(inner.player_id == player_id, inner.match_date.isnot(None), *self._range_filters(inner))\
+                .distinct()\
+                .order_by(inner.match_date.desc())\
+                .limit(1).offset(self.last_sessions - 1)\
+                .scalar_subquery()
+            filters.append(model.match_date >= func.coalesce(cutoff, ''))
+        return filters
+
+    def _range_filters(self, model):
+        filters = []
+        if self.date_from:
+            filters.append(model.match_date >= self.date_from)
+        if self.date_to:
+            filters.append(model.match_date <= self.date_to)
+        return filters
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_positive_int(value):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+def window_filters(player_id, window):
+    return window.filters(player_id) if window is not None else []
+
+
+def get_player_stats(player_id, columns=None, window=None):
     """
     Restituisce i dati grezzi (liste) e i conteggi totali per un giocatore specifico.
+    columns: chiavi delle liste da caricare (None = tutte). Vengono lette solo
+    quelle colonne, come tuple Core (niente oggetti ORM né identity map).
+    window: StatsWindow opzionale, applicata come predicato nella query.
     """
-    
-    # 1. Recuperiamo i record ordinati cronologicamente
-    records = PlayerRecord.query.filter_by(player_id=player_id).order_by(PlayerRecord.id.asc()).all()
-
-    # --- A. INIZIALIZZIAMO LE LISTE (Dati Grezzi) ---
-    lists = {
-        "ids": [],                  
-        "match_ids": [],            
-        "teammate_ids": [],         
-        "opponent1_ids": [],        
-        "opponent2_ids": [],        
-        "shot_numbers": [],         
-        
-        # Esiti
-        "miss": [],                 
-        "bordo": [],                
-        "centro": [],               
-        "esito_label": [],          
-        
-        # --- CORREZIONE QUI SOTTO: DA PLURALE A SINGOLARE ---
-        "bicchiere_colpito": [],    # Prima era "bicchieri_colpiti" -> ORA È CORRETTO
-        
-        "cups_own": [],             
-        "cups_opp": [],             
-        
-        # Tempo
-        "match_date": [],           
-        "match_hour": [],           
-        
-        # Contesto
-        "is_overtime": [],          
-        "match_result": [],         
-        "note": [],                 
-        "tiro_salvezza": [],        
-        "bicchieri_multipli": [],   
-        "formato": [],              
-        "postazione": [],           
-        "bevanda": []               
-    }
+    return get_players_stats([player_id], columns, window)[player_id]
+
+
+def get_players_stats(player_ids, columns=None, window=None):
+    """
+    Come get_player_stats, ma per più giocatori con una sola query sui tiri
+    (player_id IN ...) e una sola per le vittorie: le righe vengono poi
+    divise per giocatore in memoria. Restituisce {player_id: dati_grezzi}.
+    """
+    player_ids = list(dict.fromkeys(player_ids))
+    if columns is None:
+        keys = list(LIST_COLUMNS)
+    else:
+        keys = list(BASE_COLUMNS) + [k for k in LIST_COLUMNS if k in columns and k not in BASE_COLUMNS]
+    # Con un solo giocatore il limite delle sessioni resta un valore costante,
+    # con più giocatori è una subquery correlata sul player_id della riga
+    window_player = player_ids[0] if len(player_ids) == 1 else PlayerRecord.player_id
+    filters = window_filters(window_player, window)
+
+    # 1. Recuperiamo solo le colonne richieste, per giocatore e in ordine cronologico
+    query = select(PlayerRecord.player_id, *[getattr(PlayerRecord, LIST_COLUMNS[k]) for k in keys])\
+        .where(PlayerRecord.player_id.in_(player_ids), *filters)\
+        .order_by(PlayerRecord.player_id.asc(), PlayerRecord.id.asc())
+    rows_by_player = {pid: [row[1:] for row in rows]
+                      for pid, rows in groupby(db.session.execute(query), key=itemgetter(0))}
+
+    # 2. Vittorie (partite distinte vinte) di tutti i giocatori in un GROUP BY
+    wins = dict(db.session.query(PlayerRecord.player_id, func.count(func.distinct(PlayerRecord.match_id)))
+                .filter(PlayerRecord.player_id.in_(player_ids), PlayerRecord.match_result == 'Win', *filters)
+                .group_by(PlayerRecord.player_id).all())
+
+    return {pid: _build_stats(keys, rows_by_player.get(pid, []), columns, wins.get(pid, 0))
+            for pid in player_ids}
+
 
-    # --- B. INIZIALIZZIAMO I CONTEGGI ---
+def _build_stats(keys, rows, columns, vittorie):
+    """Liste grezze e conteggi di un giocatore dalle sue righe (già ordinate per id)."""
+    # --- A. LISTE (Dati Grezzi): una lista per colonna ---
+    if rows:
+        lists = {k: list(values) for k, values in zip(keys, zip(*rows))}
+    else:
+        lists = {k: [] for k in keys}
+
+    # --- B. CONTEGGI ---
+    esito_label = ["Centro" if c == "Sì" else "Bordo" if b == "Sì" else "Miss"
+                   for c, b in zip(lists["centro"], lists["bordo"])]
+    if columns is None or "esito_label" in columns:
+        lists["esito_label"] = esito_label
+
+    centri = esito_label.count("Centro")
+    bordi = esito_label.count("Bordo")
     counts = {
-        "tiri_totali": 0,
-        "centri": 0,
-        "bordi": 0,
-        "miss": 0,
-        "match_giocati_totali": 0,
-        "vittorie_totali": 0       
+        "tiri_totali": len(esito_label),
+        "centri": centri,
+        "bordi": bordi,
+        "miss": len(esito_label) - centri - bordi,
+        "match_giocati_totali": len(set(lists["match_ids"])),
+        "vittorie_totali": vittorie
     }
 
-    unique_match_ids = set()
-
-    # --- C. RIEMPIMENTO LISTE ---
-    for r in records:
-        # Aggiornamento Conteggi
-        counts["tiri_totali"] += 1
-        unique_match_ids.add(r.match_id)
-        
-        if r.centro == "Sì":
-            counts["centri"] += 1
-            lists["esito_label"].append("Centro")
-        elif r.bordo == "Sì":
-            counts["bordi"] += 1
-            lists["esito_label"].append("Bordo")
-        else:
-            counts["miss"] += 1
-            lists["esito_label"].append("Miss")
-
-        # Riempimento Liste
-        lists["ids"].append(r.id)
-        lists["match_ids"].append(r.match_id)
-        lists["teammate_ids"].append(r.teammate_id)
-        lists["opponent1_ids"].append(r.opponent1_id)
-        lists["opponent2_ids"].append(r.opponent2_id)
-        lists["shot_numbers"].append(r.shot_number)
-        
-        lists["miss"].append(r.miss)
-        lists["bordo"].append(r.bordo)
-        lists["centro"].append(r.centro)
-        
-        # --- CORREZIONE ANCHE QUI ---
-        lists["bicchiere_colpito"].append(r.bicchiere_colpito) 
-        
-        lists["cups_own"].append(r.cups_own)    
-        lists["cups_opp"].append(r.cups_opp)
-        
-        lists["match_date"].append(r.match_date)
-        lists["match_hour"].append(r.match_hour)
-        
-        lists["is_overtime"].append(r.is_overtime)
-        lists["match_result"].append(r.match_result)
-        lists["note"].append(r.note)
-        lists["tiro_salvezza"].append(r.tiro_salvezza)
-        lists["bicchieri_multipli"].append(r.bicchieri_multipli)
-        lists["formato"].append(r.formato)
-        lists["postazione"].append(r.postazione)
-        lists["bevanda"].append(r.bevanda)
-
-    # --- D. CALCOLO VITTORIE ---
-    counts["match_giocati_totali"] = len(unique_match_ids)
-    
-    counts["vittorie_totali"] = db.session.query(func.count(func.distinct(PlayerRecord.match_id)))\
-        .filter(PlayerRecord.player_id == player_id, PlayerRecord.match_result == 'Win').scalar() or 0
-
     return {
         "liste": lists,
         "conteggi": counts
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,70 @@
+from sqlalchemy import func, case
+from app.models import db, PlayerRecord
+from app.main import stats_rollup as rollup
+from app.main.stats_extraction import window_filters
+
+# ==========================================
+#   AGGREGAZIONI SQL (GROUP BY nel database)
+# ==========================================
+# I grafici delle percentuali sono solo conteggi raggruppati: invece di
+# portare in Python ogni tiro, il database restituisce una riga per gruppo
+# con tiri / centri / bordi già sommati (SUM(CASE ...)). Le righe hanno gli
+# stessi attributi dei bucket di stats_rollup, quindi l'output dei grafici è
+# costruito dalle stesse funzioni ed è identico a quello di stats_calculations.
+# Chi le usa: StatsEngine per posizione e formati quando c'è una finestra
+# temporale (i bucket di posizione e formato non hanno la data), il
+# ricalcolo dei rollup (rebuild-rollups) e i benchmark.
+
+# Valori "vero" come stringhe nel DB (stessa regola di is_true)
+TRUE_STRINGS = ('Sì', 'Si', 'True')
+
+
+def _is_true(column):
+    return column.in_(TRUE_STRINGS)
+
+
+def count_columns():
+    """Colonne aggregate: tiri, centri e bordi (il bordo conta solo se non è centro)."""
+    return (
+        func.count(PlayerRecord.id).label("tiri"),
+        func.sum(case((_is_true(PlayerRecord.centro), 1), else_=0)).label("centri"),
+        func.sum(case((_is_true(PlayerRecord.centro), 0),
+                      (_is_true(PlayerRecord.bordo), 1), else_=0)).label("bordi"),
+    )
+
+
+def aggregate_rows(group_columns, player_id=None, filters=()):
+    """
+    Righe (dimensioni..., tiri, centri, bordi) raggruppate per group_columns.
+    L'ordine è quello di prima apparizione del gruppo (MIN(id)), come i dict
+    dei calcoli originali.
+    """
+    query = db.session.query(*group_columns, *count_columns())
+    if player_id is not None:
+        query = query.filter(PlayerRecord.player_id == player_id)
+    if filters:
+        query = query.filter(*filters)
+    return query.group_by(*group_columns).order_by(func.min(PlayerRecord.id)).all()
+
+
+# --- GRAFICI (stesso output di stats_calculations) ---
+# window: StatsWindow opzionale, aggiunta come predicato WHERE sulla data.
+
+def calculate_daily_trend(player_id, window=None):
+    rows = aggregate_rows((PlayerRecord.match_date,), player_id, window_filters(player_id, window))
+    return rollup.calculate_daily_trend(rows)
+
+
+def calculate_hourly_trend(player_id, window=None):
+    rows = aggregate_rows((PlayerRecord.match_date, PlayerRecord.match_hour), player_id, window_filters(player_id, window))
+    return rollup.calculate_hourly_trend(rows)
+
+
+def calculate_position_by_cups(player_id, window=None):
+    rows = aggregate_rows((PlayerRecord.cups_opp, PlayerRecord.postazione), player_id, window_filters(player_id, window))
+    return rollup.calculate_position_by_cups(rows)
+
+
+def calculate_success_by_opp_cups(player_id, window=None):
+    rows = aggregate_rows((PlayerRecord.cups_opp, PlayerRecord.formato), player_id, window_filters(player_id, window))
+    return rollup.calculate_success_by_opp_cups(rows)
@@ -0,0 +1,406 @@
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import (
+    db, PlayerRecord, PlayerTrendBucket, PlayerPositionBucket, PlayerFormatBucket, PlayerCupBucket
+)
+from app.main.stats_calculations import (
+    is_true, safe_division, normalized_heatmap_layouts, resolve_heatmap_hits,
+    build_heatmap_output, clean_format_name, POSITION_MAP
+)
+
+# ==========================================
+#   TABELLE DI AGGREGAZIONE (Rollup per giocatore)
+# ==========================================
+# Le tabelle dei bucket contengono i conteggi dei tiri già sommati per
+# combinazione di dimensioni: una tabella per grafico, con le sole dimensioni
+# che quel grafico legge (poche righe per giocatore). Vengono aggiornate con
+# un upsert sulla chiave unica nella stessa transazione che modifica i
+# record, così i grafici delle percentuali leggono poche righe invece di
+# tutto lo storico dei tiri.
+
+# Tabella -> (modello, dimensioni con lo stesso nome delle colonne di PlayerRecord)
+BUCKET_TABLES = {
+    "trend": (PlayerTrendBucket, ("match_date", "match_hour")),         # andamento giornaliero e orario
+    "position": (PlayerPositionBucket, ("cups_opp", "postazione")),     # successo per postazione
+    "format": (PlayerFormatBucket, ("cups_opp", "formato")),            # successo per bicchieri e formato
+}
+
+# Valore salvato al posto di NULL nelle dimensioni: in un indice unico SQLite
+# considera diversi due NULL e l'upsert non troverebbe la riga. In lettura
+# torna NULL (NULLIF); i grafici trattano '' come un valore mancante.
+MISSING = {"match_date": '', "match_hour": -1, "cups_opp": -1, "postazione": '', "formato": ''}
+
+COUNT_COLUMNS = ("tiri", "centri", "bordi", "miss")
+
+
+def _stored(dimension, value):
+    return MISSING[dimension] if value is None else value
+
+
+def _bucket_key(player_id, dims, values):
+    return (player_id,) + tuple(_stored(d, v) for d, v in zip(dims, values))
+
+
+class RollupChange:
+    """
+    Raccoglie le variazioni dei bucket causate da una modifica ai record.
+    Uso: remove(record) PRIMA di modificarlo/cancellarlo, add(record) DOPO,
+    poi apply() prima del commit. Le variazioni che si annullano (es. modifica
+    della sola nota) non generano scritture.
+    """
+
+    def __init__(self):
+        self.stats = {name: {} for name in BUCKET_TABLES}   # tabella -> {(player_id, *dimensioni): [tiri, centri, bordi, miss]}
+        self.cups = {}    # (player_id, formato reale, bicchiere) -> colpi
+        self._layouts = normalized_heatmap_layouts()
+
+    def add(self, record):
+        self._collect(record, 1)
+
+    def remove(self, record):
+        self._collect(record, -1)
+
+    def _collect(self, record, sign):
+        # Stessa classificazione dei calcoli originali: centro > bordo > miss
+        is_c = is_true(record.centro)
+        is_b = not is_c and is_true(record.bordo)
+
+        for name, (model, dims) in BUCKET_TABLES.items():
+            key = _bucket_key(record.player_id, dims, (getattr(record, d) for d in dims))
+            counts = self.stats[name].setdefault(key, [0, 0, 0, 0])
+            counts[0] += sign
+            if is_c: counts[1] += sign
+            elif is_b: counts[2] += sign
+            else: counts[3] += sign
+
+        real_fmt, real_cups = resolve_heatmap_hits(record.formato, record.bicchiere_colpito, self._layouts)
+        for cup in real_cups:
+            key = (record.player_id, real_fmt, cup)
+            self.cups[key] = self.cups.get(key, 0) + sign
+
+    def apply(self):
+        """Scrive le variazioni nella sessione corrente (il commit resta al chiamante)."""
+        for name, (model, dims) in BUCKET_TABLES.items():
+            rows = [dict(zip(("player_id",) + dims, key), **dict(zip(COUNT_COLUMNS, counts)))
+                    for key, counts in self.stats[name].items() if any(counts)]
+            _upsert(model, ("player_id",) + dims, COUNT_COLUMNS, rows)
+
+        rows = [{"player_id": pid, "formato": fmt, "bicchiere": cup, "colpi": colpi}
+                for (pid, fmt, cup), colpi in self.cups.items() if colpi]
+        _upsert(PlayerCupBucket, ("player_id", "formato", "bicchiere"), ("colpi",), rows)
+
+        self.stats = {name: {} for name in BUCKET_TABLES}
+        self.cups = {}
+
+
+def _upsert(model, key_columns, count_columns, rows):
+    """
+    Somma i conteggi di rows alle righe con la stessa chiave (INSERT ... ON
+    CONFLICT DO UPDATE sull'indice unico), poi cancella quelle rimaste vuote.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={c: table.c[c] + stmt.excluded[c] for c in count_columns}
+    )
+    db.session.execute(stmt, rows)
+
+    # Solo una variazione negativa può svuotare un bucket
+    players = {row["player_id"] for row in rows if row[count_columns[0]] < 0}
+    if players:
+        db.session.execute(table.delete().where(table.c.player_id.in_(players),
+                                                table.c[count_columns[0]] <= 0))
+
+
+# ==========================================
+#      RICOSTRUZIONE E CONTROLLO COERENZA
+# ==========================================
+
+def _expected_rollups(player_id=None):
+    """
+    Ricalcola i bucket dai record con GROUP BY nel database
+    (gruppi in ordine di prima apparizione, come l'inserimento).
+    """
+    from app.main.stats_queries import aggregate_rows
+
+    change = RollupChange()
+    for name, (model, dims) in BUCKET_TABLES.items():
+        group_columns = (PlayerRecord.player_id,) + tuple(getattr(PlayerRecord, d) for d in dims)
+        for row in aggregate_rows(group_columns, player_id):
+            # NULL e '' finiscono nello stesso bucket: si sommano
+            key = _bucket_key(row.player_id, dims, (getattr(row, d) for d in dims))
+            counts = change.stats[name].setdefault(key, [0, 0, 0, 0])
+            for i, value in enumerate((row.tiri, row.centri, row.bordi, row.tiri - row.centri - row.bordi)):
+                counts[i] += value
+
+    # Bicchieri: ogni coppia (formato, colpiti) distinta viene analizzata una volta sola
+    cup_query = db.session.query(
+        PlayerRecord.player_id, PlayerRecord.formato, PlayerRecord.bicchiere_colpito,
+        func.count(PlayerRecord.id)
+    )
+    if player_id is not None:
+        cup_query = cup_query.filter(PlayerRecord.player_id == player_id)
+    cup_query = cup_query.group_by(PlayerRecord.player_id, PlayerRecord.formato, PlayerRecord.bicchiere_colpito)
+    for pid, formato, colpiti, weight in cup_query.order_by(func.min(PlayerRecord.id)):
+        real_fmt, real_cups = resolve_heatmap_hits(formato, colpiti, change._layouts)
+        for cup in real_cups:
+            key = (pid, real_fmt, cup)
+            change.cups[key] = change.cups.get(key, 0) + weight
+    return change
+
+
+def _bucket_models():
+    return [model for model, dims in BUCKET_TABLES.values()] + [PlayerCupBucket]
+
+
+def rebuild_rollups(player_id=None):
+    """
+    Rigenera le tabelle di aggregazione a partire da 'records'.
+    Se player_id è indicato ricostruisce solo quel giocatore.
+    Restituisce il numero di bucket scritti.
+    """
+    for model in _bucket_models():
+        query = model.query
+        if player_id is not None:
+            query = query.filter_by(player_id=player_id)
+        query.delete()
+
+    change = _expected_rollups(player_id)
+    written = 0
+    for name, (model, dims) in BUCKET_TABLES.items():
+        rows = [dict(zip(("player_id",) + dims, key), **dict(zip(COUNT_COLUMNS, counts)))
+                for key, counts in change.stats[name].items()]
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+        written += len(rows)
+    cup_rows = [
+        {"player_id": pid, "formato": fmt, "bicchiere": cup, "colpi": colpi}
+        for (pid, fmt, cup), colpi in change.cups.items()
+    ]
+    if cup_rows:
+        db.session.execute(PlayerCupBucket.__table__.insert(), cup_rows)
+    db.session.commit()
+    return written + len(cup_rows)
+
+
+def delete_rollups(player_id):
+    """Cancella i bucket di un giocatore (il commit è del chiamante)."""
+    for model in _bucket_models():
+        model.query.filter_by(player_id=player_id).delete()
+
+
+def check_rollups(player_id=None):
+    """
+    Confronta le tabelle di aggregazione con i conteggi ricalcolati da 'records'.
+    Restituisce la lista delle differenze (vuota se tutto è coerente).
+    """
+    expected = _expected_rollups(player_id)
+    differences = []
+
+    for name, (model, dims) in BUCKET_TABLES.items():
+        query = model.query
+        if player_id is not None:
+            query = query.filter_by(player_id=player_id)
+        actual = {}
+        for row in query:
+            key = (row.player_id,) + tuple(getattr(row, d) for d in dims)
+            actual[key] = [getattr(row, c) or 0 for c in COUNT_COLUMNS]
+        for key in expected.stats[name].keys() | actual.keys():
+            exp = expected.stats[name].get(key, [0, 0, 0, 0])
+            act = actual.get(key, [0, 0, 0, 0])
+            if exp != act:
+                differences.append(f"bucket {name} {key}: atteso {exp}, trovato {act}")
+
+    cup_query = PlayerCupBucket.query
+    if player_id is not None:
+        cup_query = cup_query.filter_by(player_id=player_id)
+    actual_cups = {}
+    for row in cup_query:
+        key = (row.player_id, row.formato, row.bicchiere)
+        actual_cups[key] = actual_cups.get(key, 0) + (row.colpi or 0)
+    for key in expected.cups.keys() | actual_cups.keys():
+        exp = expected.cups.get(key, 0)
+        act = actual_cups.get(key, 0)
+        if exp != act:
+            differences.append(f"bicchiere {key}: atteso {exp}, trovato {act}")
+    return differences
+
+
+# ==========================================
+#     LETTURA GRAFICI DAI BUCKET
+# ==========================================
+# Stesso output dei calculate_* di stats_calculations.py, ma calcolato
+# sui bucket del giocatore (O(numero bucket) invece di O(tiri)).
+# Accettano qualsiasi riga con gli attributi delle dimensioni e i conteggi
+# tiri / centri / bordi (anche le righe GROUP BY di stats_queries).
+
+def load_buckets(name, player_id, window=None):
+    """
+    Righe della tabella `name` di BUCKET_TABLES del giocatore: dimensioni
+    (NULL al posto di MISSING) e conteggi, in ordine di inserimento.
+    window: StatsWindow opzionale, solo per 'trend' (l'unica tabella con la data).
+    """
+    model, dims = BUCKET_TABLES[name]
+    query = db.session.query(
+        *(func.nullif(getattr(model, d), MISSING[d]).label(d) for d in dims),
+        *(getattr(model, c) for c in COUNT_COLUMNS)
+    ).filter(model.player_id == player_id)
+    if window is not None:
+        # Come per i record: un tiro senza data è fuori da qualunque finestra
+        query = query.filter(model.match_date != MISSING["match_date"], *window.filters(player_id, model))
+    return query.order_by(model.id.asc()).all()
+
+
+def load_cup_buckets(player_id):
+    return PlayerCupBucket.query.filter_by(player_id=player_id).order_by(PlayerCupBucket.id.asc()).all()
+
+
+def calculate_daily_trend(trend_buckets):
+    """GRAFICO 1: Evoluzione giornaliera (% successo e % bordi per data)."""
+    daily_agg = {}
+    for b in trend_buckets:
+        if not b.match_date: continue
+        agg = daily_agg.setdefault(b.match_date, [0, 0, 0])
+        agg[0] += b.tiri; agg[1] += b.centri; agg[2] += b.bordi
+
+    labels_x = []
+    dataset_success = []
+    dataset_rim = []
+    for d in sorted(daily_agg):
+        tot, c, bordi = daily_agg[d]
+        labels_x.append(datetime.strptime(d, "%Y-%m-%d").strftime("%y-%m-%d"))
+        dataset_success.append(round(safe_division(c, tot), 2))
+        dataset_rim.append(round(safe_division(bordi, tot - c), 2))
+
+    return {
+        "dates": labels_x,
+        "trend_success": dataset_success,
+        "trend_rim": dataset_rim
+    }
+
+
+def calculate_hourly_trend(trend_buckets):
+    """GRAFICO 2: Analisi oraria (storico vs ultima giornata)."""
+    dates = [b.match_date for b in trend_buckets if b.match_date]
+    last_date = max(dates) if dates else None
+
+    # { ora: [tot, centri, bordi, tot_oggi, centri_oggi, bordi_oggi] }
+    hourly_agg = {}
+    for b in trend_buckets:
+        try:
+            h = int(b.match_hour)
+        except (ValueError, TypeError):
+            continue
+        agg = hourly_agg.setdefault(h, [0, 0, 0, 0, 0, 0])
+        agg[0] += b.tiri; agg[1] += b.centri; agg[2] += b.bordi
+        if last_date and b.match_date == last_date:
+            agg[3] += b.tiri; agg[4] += b.centri; agg[5] += b.bordi
+
+    labels_x = []
+    hist_success = []
+    hist_rim = []
+    today_success = []
+    today_rim = []
+    for h in sorted(hourly_agg):
+        tot, c, bordi, t_tot, t_c, t_b = hourly_agg[h]
+        t_non_centri = t_tot - t_c
+
+        labels_x.append(str(h))
+        hist_success.append(round(safe_division(c, tot), 2))
+        hist_rim.append(round(safe_division(bordi, tot - c), 2))
+        today_success.append(round((t_c / t_tot * 100), 2) if t_tot > 0 else None)
+        today_rim.append(round((t_b / t_non_centri * 100), 2) if t_non_centri > 0 else None)
+
+    return {
+        "hours": labels_x,
+        "hist_success": hist_success,
+        "hist_rim": hist_rim,
+        "today_success": today_success,
+        "today_rim": today_rim
+    }
+
+
+def calculate_position_by_cups(position_buckets):
+    """% di successo per postazione (SX, CEN, DX) in base ai bicchieri avversari (10..1)."""
+    stats = {}
+    for b in position_buckets:
+        if not b.cups_opp or str(b.cups_opp) in ['-', 'None']: continue
+        if not b.postazione or str(b.postazione) in ['-', 'None']: continue
+        try:
+            c_num = int(b.cups_opp)
+        except (ValueError, TypeError):
+            continue
+        if c_num > 10 or c_num < 1: continue
+
+        clean_pos = POSITION_MAP.get(str(b.postazione).strip())
+        if not clean_pos: continue
+
+        row = stats.setdefault(c_num, {"Sinistra": [0, 0], "Centrale": [0, 0], "Destra": [0, 0]})
+        row[clean_pos][0] += b.centri
+        row[clean_pos][1] += b.tiri
+
+    def get_perc(made, total):
+        return round((made / total) * 100, 1) if total > 0 else None
+
+    sorted_cups = sorted(stats.keys(), reverse=True)
+    return {
+        "labels": sorted_cups,
+        "sx": [get_perc(*stats[c]["Sinistra"]) for c in sorted_cups],
+        "cen": [get_perc(*stats[c]["Centrale"]) for c in sorted_cups],
+        "dx": [get_perc(*stats[c]["Destra"]) for c in sorted_cups]
+    }
+
+
+def calculate_success_by_opp_cups(format_buckets):
+    """% di successo per bicchieri avversari (1-6), generale e per formato, ordine 6 -> 1."""
+    general_stats = {i: [0, 0] for i in range(1, 7)}
+    format_stats = {}
+
+    for b in format_buckets:
+        if b.cups_opp is None or str(b.cups_opp) in ['-', 'None', 'nan']: continue
+        try:
+            cups = int(b.cups_opp)
+        except (ValueError, TypeError):
+            continue
+        if cups < 1 or cups > 6: continue
+
+        general_stats[cups][0] += b.centri
+        general_stats[cups][1] += b.tiri
+
+        fmt_clean = clean_format_name(b.formato)
+        if fmt_clean is None: continue
+        fmt_row = format_stats.setdefault(fmt_clean, {k: [0, 0] for k in range(1, 7)})
+        fmt_row[cups][0] += b.centri
+        fmt_row[cups][1] += b.tiri
+
+    labels = list(range(6, 0, -1))
+
+    def get_perc(made, total):
+        return round((made / total) * 100, 1) if total > 0 else None
+
+    formats_data = {}
+    for fmt_name, cup_dict in format_stats.items():
+        series = [get_perc(*cup_dict[c]) for c in labels]
+        if any(v is not None for v in series):
+            formats_data[fmt_name] = series
+
+    return {
+        "labels": labels,
+        "general": [get_perc(*general_stats[c]) for c in labels],
+        "by_format": formats_data
+    }
+
+
+def calculate_format_heatmaps(cup_buckets):
+    """Percentuali per i grafici 3D a partire dai bicchieri colpiti aggregati."""
+    stats = {}
+    format_totals = {}
+    for b in cup_buckets:
+        stats.setdefault(b.formato, {})
+        stats[b.formato][b.bicchiere] = stats[b.formato].get(b.bicchiere, 0) + b.colpi
+        format_totals[b.formato] = format_totals.get(b.formato, 0) + b.colpi
+    return build_heatmap_output(stats, format_totals)
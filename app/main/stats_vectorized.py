@@ -0,0 +1,755 @@
+import numpy as np
+from app.main.shot_frame import (
+    ShotFrame, DAY_NONE, HOUR_NONE, CUPS_NONE, ID_NONE,
+    RISULTATO_WIN, RISULTATO_LOSS, RISULTATO_NONE, day_to_str, id_to_key
+)
+from app.main.stats_calculations import (
+    safe_division, normalized_heatmap_layouts, resolve_heatmap_hits, build_heatmap_output,
+    clean_format_name
+)
+
+# ==========================================
+#   CALCOLI VETTORIALI (Versione NumPy)
+# ==========================================
+# Stesse funzioni di stats_calculations.py (stessi nomi e stesso output),
+# ma lavorano su uno ShotFrame invece che sulle liste di stringhe.
+
+
+def _as_frame(data):
+    """Accetta sia uno ShotFrame che il dizionario di get_player_stats."""
+    if isinstance(data, ShotFrame):
+        return data
+    return ShotFrame.from_lists(data["liste"])
+
+
+def _max_run(mask):
+    """Lunghezza della serie più lunga di True consecutivi."""
+    if mask.size == 0 or not mask.any():
+        return 0
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return int((edges[1::2] - edges[0::2]).max())
+
+
+def _group_counts(keys, hits, minlength=0):
+    """Restituisce (totali, centri) per chiave intera non negativa."""
+    totals = np.bincount(keys, minlength=minlength)
+    made = np.bincount(keys, weights=hits, minlength=minlength).astype(np.int64)
+    return totals.tolist(), made.tolist()
+
+
+def _first_appearance(codes):
+    """Codici unici ordinati per prima apparizione."""
+    if codes.size == 0:
+        return []
+    uniq, first_idx = np.unique(codes, return_index=True)
+    return uniq[np.argsort(first_idx, kind="stable")].tolist()
+
+
+def calculate_historical_percentages(data):
+    """Percentuali storiche (successo e bordi su sbagliati)."""
+    frame = _as_frame(data)
+    centri = int(frame.centro.sum())
+    bordi = int(frame.bordo.sum())
+    miss = frame.n - centri - bordi
+
+    return {
+        "historical_success_rate": round(safe_division(centri, frame.n), 2),
+        "historical_rim_rate": round(safe_division(bordi, miss + bordi), 2)
+    }
+
+
+def calculate_daily_percentages(data):
+    """Statistiche dell'ultima giornata di gioco: tiri, partite, vittorie e win rate."""
+    frame = _as_frame(data)
+    last_day = frame.last_day
+
+    if last_day is None:
+        return {
+            "daily_success_rate": 0.0,
+            "daily_rim_rate": 0.0,
+            "last_date": None,
+            "counts": {"centri": 0, "bordi": 0, "miss": 0, "totali": 0},
+            "matches": 0,
+            "wins": 0,
+            "win_rate": 0.0
+        }
+
+    mask = frame.day == last_day
+    totali = int(mask.sum())
+    centri = int((frame.centro & mask).sum())
+    bordi = int((frame.bordo & mask).sum())
+    daily_stats = {"centri": centri, "bordi": bordi, "miss": totali - centri - bordi, "totali": totali}
+
+    # Partite del giorno: il risultato si legge dal primo tiro di ogni match
+    day_matches, first_idx = np.unique(frame.match_id[mask], return_index=True)
+    daily_matches_played = int(day_matches.size)
+    daily_wins_count = int((frame.risultato[mask][first_idx] == RISULTATO_WIN).sum())
+    daily_win_rate = safe_division(daily_wins_count, daily_matches_played)
+
+    return {
+        "daily_success_rate": round(safe_division(centri, totali), 2),
+        "daily_rim_rate": round(safe_division(bordi, daily_stats["miss"] + bordi), 2),
+        "last_date": day_to_str(last_day),
+        "counts": daily_stats,
+        "matches": daily_matches_played,
+        "wins": daily_wins_count,
+        "win_rate": round(daily_win_rate, 1)
+    }
+
+
+def calculate_special_metrics(data):
+    """Serie (storiche vs oggi), clutch rate e multi-hit."""
+    frame = _as_frame(data)
+    centro = frame.centro
+    daily = frame.daily_mask()
+
+    # --- 1. SERIE ---
+    # La serie giornaliera considera solo i tiri dell'ultima data, in sequenza
+    centro_daily = centro[daily]
+
+    # --- 2. CLUTCH RATE ---
+    clutch_attempts = int(frame.is_salvezza.sum())
+    clutch_made = int((frame.is_salvezza & centro).sum())
+    clutch_rate = safe_division(clutch_made, clutch_attempts)
+
+    # --- 3. MULTI-HIT ---
+    multi_counts = {}
+    plural_map = {
+        "2": "Doppi", "3": "Tripli", "4": "Quadrupli", "5": "Quintupli", "6": "Sestupli",
+        "Doppio": "Doppi", "Triplo": "Tripli", "Quadruplo": "Quadrupli",
+        "Quintuplo": "Quintupli", "Sestuplo": "Sestupli"
+    }
+    per_category = np.bincount(frame.multipli, minlength=len(frame.multipli_cat)).tolist() if frame.n else []
+    for val, count in zip(frame.multipli_cat, per_category):
+        s_val = str(val).strip().capitalize()
+        if s_val in ['-', '1', '0', 'None', '', 'False', 'Nan', 'Singolo']:
+            continue
+
+        final_label = plural_map.get(s_val)
+        if not final_label and s_val.isdigit() and int(s_val) > 1:
+            final_label = f"{s_val}-Hits"
+
+        if final_label:
+            multi_counts[final_label] = multi_counts.get(final_label, 0) + count
+
+    return {
+        "longest_streak_success": _max_run(centro),
+        "daily_streak_success": _max_run(centro_daily),
+        "longest_streak_fail": _max_run(~centro),
+        "daily_streak_fail": _max_run(~centro_daily),
+        "clutch_rate": round(clutch_rate, 1),
+        "clutch_attempts": clutch_attempts,
+        "clutch_made": clutch_made,
+        "multi_hits": multi_counts
+    }
+
+
+def calculate_daily_trend(data):
+    """GRAFICO 1: Evoluzione giornaliera (% successo e % bordi per data)."""
+    frame = _as_frame(data)
+    valid = frame.day != DAY_NONE
+
+    labels_x = []
+    dataset_success = []
+    dataset_rim = []
+
+    if valid.any():
+        days, inverse = np.unique(frame.day[valid], return_inverse=True)
+        totali, centri = _group_counts(inverse, frame.centro[valid])
+        _, bordi = _group_counts(inverse, frame.bordo[valid])
+
+        for day, tot, c, b in zip(days.tolist(), totali, centri, bordi):
+            labels_x.append(day_to_str(day, "%y-%m-%d"))
+            dataset_success.append(round(safe_division(c, tot), 2))
+            dataset_rim.append(round(safe_division(b, tot - c), 2))
+
+    return {
+        "dates": labels_x,
+        "trend_success": dataset_success,
+        "trend_rim": dataset_rim
+    }
+
+
+def calculate_hourly_trend(data):
+    """GRAFICO 2: Analisi oraria (storico vs oggi)."""
+    frame = _as_frame(data)
+    valid = frame.hour != HOUR_NONE
+    hours = frame.hour[valid].astype(np.int64)
+    centro = frame.centro[valid]
+    bordo = frame.bordo[valid]
+    today = frame.daily_mask()[valid]
+
+    size = int(hours.max()) + 1 if hours.size else 0
+    hist_tot, hist_c = _group_counts(hours, centro, size)
+    _, hist_b = _group_counts(hours, bordo, size)
+    today_tot, today_c = _group_counts(hours[today], centro[today], size)
+    _, today_b = _group_counts(hours[today], bordo[today], size)
+
+    labels_x = []
+    hist_success = []
+    hist_rim = []
+    today_success = []
+    today_rim = []
+
+    for h in range(size):
+        if hist_tot[h] == 0:
+            continue
+        h_non_centri = hist_tot[h] - hist_c[h]
+        t_non_centri = today_tot[h] - today_c[h]
+
+        labels_x.append(str(h))
+        hist_success.append(round(safe_division(hist_c[h], hist_tot[h]), 2))
+        hist_rim.append(round(safe_division(hist_b[h], h_non_centri), 2))
+        today_success.append(round((today_c[h] / today_tot[h] * 100), 2) if today_tot[h] > 0 else None)
+        today_rim.append(round((today_b[h] / t_non_centri * 100), 2) if t_non_centri > 0 else None)
+
+    return {
+        "hours": labels_x,
+        "hist_success": hist_success,
+        "hist_rim": hist_rim,
+        "today_success": today_success,
+        "today_rim": today_rim
+    }
+
+
+def calculate_streak_metrics(data):
+    """Serie massime (storiche e giornaliere) per Bordi e Miss."""
+    frame = _as_frame(data)
+    daily = frame.daily_mask()
+    bordo = frame.bordo
+    miss = frame.miss
+
+    return {
+        "rim_streak_hist": _max_run(bordo),
+        "rim_streak_daily": _max_run(bordo & daily),
+        "miss_streak_hist": _max_run(miss),
+        "miss_streak_daily": _max_run(miss & daily)
+    }
+
+
+def _rate_by_player(ids, success, name_map, count_key):
+    """Aggrega totali/successi per nome (in ordine di prima apparizione dell'ID)."""
+    stats = {}
+    valid = ids != ID_NONE
+    if not valid.any():
+        return stats
+
+    valid_ids = ids[valid]
+    uniq, inverse = np.unique(valid_ids, return_inverse=True)
+    totali, made = _group_counts(inverse, success[valid])
+    by_id = {pid: (t, m) for pid, t, m in zip(uniq.tolist(), totali, made)}
+
+    for pid in _first_appearance(valid_ids):
+        nome_reale = name_map.get(str(pid), f"Player {pid}")
+        t, m = by_id[pid]
+        if nome_reale not in stats:
+            stats[nome_reale] = {"totali": 0, count_key: 0}
+        stats[nome_reale]["totali"] += t
+        stats[nome_reale][count_key] += m
+    return stats
+
+
+def calculate_partnership_metrics(data, name_map):
+    frame = _as_frame(data)
+    teammate_stats = _rate_by_player(frame.teammate_id, frame.risultato == RISULTATO_WIN, name_map, "vittorie")
+    opponent_stats = _rate_by_player(frame.opponent1_id, frame.risultato == RISULTATO_LOSS, name_map, "sconfitte")
+
+    win_rate_teammate = sorted(
+        [{"nome": n, "percentuale": round(safe_division(s["vittorie"], s["totali"]), 1)}
+         for n, s in teammate_stats.items()],
+        key=lambda x: x["percentuale"], reverse=True
+    )
+
+    loss_rate_opponent = sorted(
+        [{"nome": n, "percentuale": round(safe_division(s["sconfitte"], s["totali"]), 1)}
+         for n, s in opponent_stats.items()],
+        key=lambda x: x["percentuale"], reverse=True
+    )
+
+    return {
+        "partners": {
+            "labels": [x["nome"] for x in win_rate_teammate],
+            "values": [x["percentuale"] for x in win_rate_teammate]
+        },
+        "enemies": {
+            "labels": [x["nome"] for x in loss_rate_opponent],
+            "values": [x["percentuale"] for x in loss_rate_opponent]
+        }
+    }
+
+
+def calculate_shot_performance_metrics(data):
+    frame = _as_frame(data)
+    last_day = frame.last_day
+    centro = frame.centro
+
+    # --- 1. TIRI PER PARTITA ---
+    max_shots_hist = 0
+    max_shots_daily = 0
+    with_match = frame.match_id != ID_NONE
+    if with_match.any():
+        m_ids, first_idx, shots_per_match = np.unique(
+            frame.match_id[with_match], return_index=True, return_counts=True)
+        max_shots_hist = int(shots_per_match.max())
+        if last_day is not None:
+            # La data della partita è quella del suo primo tiro
+            first_days = frame.day[with_match][first_idx]
+            daily_counts = shots_per_match[first_days == last_day]
+            max_shots_daily = int(daily_counts.max()) if daily_counts.size else 0
+
+    # --- 2. AGGREGAZIONE PER NUMERO TIRO ---
+    sn_valid = (frame.shot_number >= 0) & (frame.shot_number <= 30)
+    sn = frame.shot_number[sn_valid].astype(np.int64)
+    size = int(sn.max()) + 1 if sn.size else 0
+
+    c_sn = centro[sn_valid]
+    opp = frame.cups_opp[sn_valid].astype(np.int64)
+    own = frame.cups_own[sn_valid].astype(np.int64)
+    opp_valid = opp != CUPS_NONE
+    gap_valid = opp_valid & (own != CUPS_NONE)
+    today = (frame.day[sn_valid] == last_day) if last_day is not None else np.zeros(sn.size, dtype=bool)
+
+    h_t, h_c = _group_counts(sn, c_sn, size)
+    t_t, t_c = _group_counts(sn[today], c_sn[today], size)
+    opp_count = np.bincount(sn[opp_valid], minlength=size).tolist()
+    opp_sum = np.bincount(sn[opp_valid], weights=opp[opp_valid], minlength=size).astype(np.int64).tolist()
+    gap_count = np.bincount(sn[gap_valid], minlength=size).tolist()
+    gap_sum = np.bincount(sn[gap_valid], weights=(own - opp)[gap_valid], minlength=size).astype(np.int64).tolist()
+
+    sorted_nums = [n for n in range(size) if h_t[n] > 0]
+    labels = [f"{n}°" for n in sorted_nums]
+    values_hist = [round(safe_division(h_c[n], h_t[n]), 1) for n in sorted_nums]
+    values_today = [round(safe_division(t_c[n], t_t[n]), 1) if t_t[n] > 0 else None for n in sorted_nums]
+
+    # --- 3. FASI DINAMICHE BASATE SULLA MEDIA ---
+    phase_changes = []
+    last_avg_cups = None
+    for n in sorted_nums:
+        if opp_count[n] > 0:
+            current_rounded = round(opp_sum[n] / opp_count[n])
+            if last_avg_cups is not None and current_rounded != last_avg_cups:
+                phase_changes.append({"shot": n, "label": f"{current_rounded} cups"})
+            last_avg_cups = current_rounded
+
+    gap_values = [round(gap_sum[n] / gap_count[n], 2) if gap_count[n] else 0 for n in sorted_nums]
+    unique_m_hist = int(np.unique(frame.match_id).size)
+    avg_hist = round(frame.n / unique_m_hist, 1) if unique_m_hist > 0 else 0
+
+    return {
+        "avg_shots_per_match": avg_hist,
+        "max_shots_match_hist": max_shots_hist,
+        "max_shots_match_daily": max_shots_daily,
+        "shot_number_trend": {
+            "labels": labels,
+            "values_hist": values_hist,
+            "values_today": values_today,
+            "phase_changes": phase_changes,
+            "cup_gap": gap_values
+        }
+    }
+
+
+def _best_category(codes, categories, hits, min_attempts=2):
+    """Categoria (o pareggio di categorie) con la % di centri più alta."""
+    if codes.size == 0:
+        return "-", 0
+    totali, made = _group_counts(codes.astype(np.int64), hits, len(categories))
+
+    max_rate = -1
+    best_names = []
+    for code in _first_appearance(codes):
+        cat = categories[code]
+        if str(cat) in ['-', 'None', 'nan', '']: continue
+        if totali[code] < min_attempts: continue
+        rate = (made[code] / totali[code]) * 100
+
+        if rate > max_rate:
+            max_rate = rate
+            best_names = [cat]
+        elif rate == max_rate:
+            best_names.append(cat)
+
+    if not best_names: return "-", 0
+    return " / ".join(best_names), round(max_rate, 1)
+
+
+def calculate_insights(data, partnerships, shot_metrics):
+    """
+    Calcola i 'Fun Facts' o consigli tattici basati sui dati.
+    Gestisce i pareggi unendo i nomi con ' / '.
+    """
+    frame = _as_frame(data)
+    centro = frame.centro
+
+    best_pos_name, best_pos_rate = _best_category(frame.postazione, frame.postazione_cat, centro)
+    best_drink_name, best_drink_rate = _best_category(frame.bevanda, frame.bevanda_cat, centro)
+
+    best_partner_name = "-"
+    best_partner_rate = 0
+    if partnerships["partners"]["values"]:
+        max_val = max(partnerships["partners"]["values"])
+        best_partner_name = " / ".join(
+            label for label, val in zip(partnerships["partners"]["labels"], partnerships["partners"]["values"])
+            if val == max_val)
+        best_partner_rate = max_val
+
+    worst_enemy_name = "-"
+    worst_enemy_rate = 0
+    if partnerships["enemies"]["values"]:
+        max_val = max(partnerships["enemies"]["values"])
+        worst_enemy_name = " / ".join(
+            label for label, val in zip(partnerships["enemies"]["labels"], partnerships["enemies"]["values"])
+            if val == max_val)
+        worst_enemy_rate = max_val
+
+    best_shot_num = "-"
+    best_shot_rate = 0
+    first_shot_rate = 0
+    trend = shot_metrics.get("shot_number_trend", {})
+    if trend and trend.get("values_hist"):
+        valid_values = [v for v in trend["values_hist"] if v is not None]
+        if valid_values:
+            max_val = max(valid_values)
+            best_shot_num = " / ".join(
+                trend["labels"][i].replace("°", "") for i, val in enumerate(trend["values_hist"]) if val == max_val)
+            best_shot_rate = max_val
+        first_shot_rate = trend["values_hist"][0]
+
+    # --- GIORNATA MIGLIORE (almeno 5 tiri) ---
+    best_day_date = "-"
+    best_day_rate = 0
+    valid = frame.day != DAY_NONE
+    if valid.any():
+        day_values = frame.day[valid]
+        uniq, inverse = np.unique(day_values, return_inverse=True)
+        totali, made = _group_counts(inverse, centro[valid])
+        position = {d: i for i, d in enumerate(uniq.tolist())}
+
+        # Ordine di prima apparizione: a parità vince la giornata incontrata prima
+        for d in _first_appearance(day_values):
+            i = position[d]
+            if totali[i] < 5: continue
+            rate = (made[i] / totali[i]) * 100
+            if rate > best_day_rate:
+                best_day_rate = rate
+                best_day_date = day_to_str(d, "%d/%m/%Y")
+
+    return {
+        "best_pos": best_pos_name,
+        "best_pos_rate": best_pos_rate,
+        "best_drink": best_drink_name,
+        "best_drink_rate": best_drink_rate,
+        "best_partner": best_partner_name,
+        "best_partner_rate": best_partner_rate,
+        "worst_enemy": worst_enemy_name,
+        "worst_enemy_rate": worst_enemy_rate,
+        "best_shot_num": best_shot_num,
+        "best_shot_rate": best_shot_rate,
+        "first_shot_rate": first_shot_rate,
+        "best_day_date": best_day_date,
+        "best_day_rate": round(best_day_rate, 1)
+    }
+
+
+def calculate_position_by_cups(data):
+    """% di successo per postazione (SX, CEN, DX) in base ai bicchieri avversari (10..1)."""
+    frame = _as_frame(data)
+    pos_map = {
+        "Sinistra": 0, "SX": 0, "Sx": 0,
+        "Centrale": 1, "Centro": 1, "CEN": 1,
+        "Destra": 2, "DX": 2, "Dx": 2
+    }
+
+    # Traduzione categoria -> colonna (0 Sx, 1 Cen, 2 Dx, -1 scarta)
+    lookup = np.array(
+        [pos_map.get(str(p).strip(), -1) if p and str(p) not in ['-', 'None'] else -1
+         for p in frame.postazione_cat] or [-1], dtype=np.int64)
+    pos = lookup[frame.postazione] if frame.n else np.empty(0, dtype=np.int64)
+    cups = frame.cups_opp.astype(np.int64)
+
+    valid = (pos >= 0) & (cups >= 1) & (cups <= 10)
+    keys = cups[valid] * 3 + pos[valid]
+    totali, made = _group_counts(keys, frame.centro[valid], 33)
+
+    def get_perc(key):
+        if totali[key] > 0:
+            return round((made[key] / totali[key]) * 100, 1)
+        return None
+
+    sorted_cups = [c for c in range(10, 0, -1) if sum(totali[c * 3:c * 3 + 3]) > 0]
+
+    return {
+        "labels": sorted_cups,
+        "sx": [get_perc(c * 3) for c in sorted_cups],
+        "cen": [get_perc(c * 3 + 1) for c in sorted_cups],
+        "dx": [get_perc(c * 3 + 2) for c in sorted_cups]
+    }
+
+
+def calculate_format_heatmaps(data):
+    """
+    Percentuali per i grafici 3D.
+    Le stringhe dei bicchieri colpiti vengono analizzate una sola volta per
+    coppia (formato, colpiti) distinta, poi pesate con il numero di occorrenze.
+    """
+    frame = _as_frame(data)
+    if frame.n == 0:
+        return {}
+
+    n_hits = len(frame.colpiti_cat)
+    pair_keys = frame.formato.astype(np.int64) * n_hits + frame.colpiti.astype(np.int64)
+    pairs, pair_counts = np.unique(pair_keys, return_counts=True)
+    normalized_layouts = normalized_heatmap_layouts()
+
+    stats = {}
+    format_totals = {}
+    for key, weight in zip(pairs.tolist(), pair_counts.tolist()):
+        fmt = frame.formato_cat[key // n_hits]
+        hit_str = frame.colpiti_cat[key % n_hits]
+        real_fmt, real_cups = resolve_heatmap_hits(fmt, hit_str, normalized_layouts)
+        for real_cup_name in real_cups:
+            if real_fmt not in stats:
+                stats[real_fmt] = {}; format_totals[real_fmt] = 0
+            stats[real_fmt][real_cup_name] = stats[real_fmt].get(real_cup_name, 0) + weight
+            format_totals[real_fmt] += weight
+
+    return build_heatmap_output(stats, format_totals)
+
+
+def calculate_success_by_opp_cups(data):
+    """% di successo per bicchieri avversari (1-6), generale e per formato, ordine 6 -> 1."""
+    frame = _as_frame(data)
+    cups = frame.cups_opp.astype(np.int64)
+    in_range = (cups >= 1) & (cups <= 6)
+    centro = frame.centro
+
+    general_tot, general_made = _group_counts(cups[in_range], centro[in_range], 7)
+    labels = list(range(6, 0, -1))
+
+    general_data = [
+        round((general_made[c] / general_tot[c]) * 100, 1) if general_tot[c] > 0 else None
+        for c in labels
+    ]
+
+    # Nome pulito per ogni categoria di formato (None = scartato)
+    clean_names = [clean_format_name(f) for f in frame.formato_cat]
+    format_stats = {}
+    if frame.n:
+        fmt_codes = frame.formato[in_range].astype(np.int64)
+        keys = fmt_codes * 7 + cups[in_range]
+        n_cat = len(frame.formato_cat)
+        totali, made = _group_counts(keys, centro[in_range], n_cat * 7)
+        for code in _first_appearance(fmt_codes):
+            name = clean_names[code]
+            if name is None:
+                continue
+            bucket = format_stats.setdefault(name, {k: {"m": 0, "t": 0} for k in range(1, 7)})
+            for c in range(1, 7):
+                bucket[c]["t"] += totali[code * 7 + c]
+                bucket[c]["m"] += made[code * 7 + c]
+
+    formats_data = {}
+    for fmt_name, cup_dict in format_stats.items():
+        series = [
+            round((cup_dict[c]["m"] / cup_dict[c]["t"]) * 100, 1) if cup_dict[c]["t"] > 0 else None
+            for c in labels
+        ]
+        if any(v is not None for v in series):
+            formats_data[fmt_name] = series
+
+    return {
+        "labels": labels,
+        "general": general_data,
+        "by_format": formats_data
+    }
+
+
+def calculate_comeback_and_flops(data, name_map):
+    """Partite con la rimonta più grande e i crolli più grandi."""
+    frame = _as_frame(data)
+    with_match = frame.match_id != ID_NONE
+    if not with_match.any():
+        return {"comebacks": [], "flops": []}
+
+    idx_all = np.flatnonzero(with_match)
+    m_all = frame.match_id[idx_all]
+    uniq, first_pos = np.unique(m_all, return_index=True)
+    first_row = dict(zip(uniq.tolist(), idx_all[first_pos].tolist()))
+
+    # Snapshot validi: entrambi i conteggi presenti
+    snap = with_match & (frame.cups_own != CUPS_NONE) & (frame.cups_opp != CUPS_NONE)
+    idx = np.flatnonzero(snap)
+    own = frame.cups_own[idx].astype(np.int64)
+    opp = frame.cups_opp[idx].astype(np.int64)
+    mids = frame.match_id[idx]
+    diff = opp - own
+
+    def _first_of_group(order):
+        """Indice (in idx) del primo elemento di ogni match dopo l'ordinamento."""
+        if order.size == 0:
+            return {}
+        sorted_m = mids[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_m[1:] != sorted_m[:-1])))
+        return dict(zip(sorted_m[starts].tolist(), order[starts].tolist()))
+
+    positions = np.arange(idx.size)
+    # Picco = primo massimo (come max() di Python), finale = ultimo snapshot
+    peak_deficit = _first_of_group(np.lexsort((positions, -diff, mids)))
+    peak_advantage = _first_of_group(np.lexsort((positions, diff, mids)))
+    final_state = _first_of_group(np.lexsort((-positions, mids)))
+
+    result_label = {RISULTATO_WIN: "Win", RISULTATO_LOSS: "Loss"}
+    comebacks = []
+    flops = []
+
+    for mid in _first_appearance(m_all):
+        if mid not in final_state:
+            continue
+        i = first_row[mid]
+        o1 = name_map.get(id_to_key(int(frame.opponent1_id[i])), "Nessuno")
+        o2 = name_map.get(id_to_key(int(frame.opponent2_id[i])), "Nessuno")
+        risultato = int(frame.risultato[i])
+
+        f = final_state[mid]
+        match_base = {
+            "date": day_to_str(int(frame.day[i])),
+            "teammate": name_map.get(id_to_key(int(frame.teammate_id[i])), "Nessuno"),
+            "opponent": f"{o1} & {o2}" if o2 != "Nessuno" else o1,
+            "final_result": result_label.get(risultato),
+            "final_score": f"{own[f]} - {opp[f]}"
+        }
+
+        d = peak_deficit[mid]
+        if risultato == RISULTATO_WIN and diff[d] > 0:
+            cb = match_base.copy()
+            cb["max_diff_val"] = int(diff[d])
+            cb["peak_score"] = f"{own[d]} - {opp[d]}"
+            comebacks.append(cb)
+
+        a = peak_advantage[mid]
+        if risultato == RISULTATO_LOSS and -diff[a] > 0:
+            fl = match_base.copy()
+            fl["max_diff_val"] = int(-diff[a])
+            fl["peak_score"] = f"{own[a]} - {opp[a]}"
+            flops.append(fl)
+
+    top_comebacks = sorted(comebacks, key=lambda x: x["max_diff_val"], reverse=True)[:4]
+    top_flops = sorted(flops, key=lambda x: x["max_diff_val"], reverse=True)[:4]
+
+    return {"comebacks": top_comebacks, "flops": top_flops}
+
+
+def calculate_overtime_metrics(data):
+    """Metriche specifiche per l'overtime."""
+    frame = _as_frame(data)
+    ot = (frame.match_id != ID_NONE) & frame.is_overtime
+    if not ot.any():
+        return None
+
+    mids = frame.match_id[ot]
+    shots = frame.shot_number[ot].astype(np.int64)
+    uniq, first_idx, inverse = np.unique(mids, return_index=True, return_inverse=True)
+    total_ot_matches = int(uniq.size)
+
+    first_shot = np.full(total_ot_matches, np.iinfo(np.int64).max)
+    last_shot = np.full(total_ot_matches, np.iinfo(np.int64).min)
+    np.minimum.at(first_shot, inverse, shots)
+    np.maximum.at(last_shot, inverse, shots)
+
+    ot_wins = int((frame.risultato[ot][first_idx] == RISULTATO_WIN).sum())
+    total_ot_shots = int(mids.size)
+    total_ot_centri = int(frame.centro[ot].sum())
+
+    first_shot_ot_avg = int(first_shot.sum()) / total_ot_matches
+    duration_ot_avg = int((last_shot - first_shot + 1).sum()) / total_ot_matches
+
+    return {
+        "win_rate": round(safe_division(ot_wins, total_ot_matches), 1),
+        "success_rate": round(safe_division(total_ot_centri, total_ot_shots), 1),
+        "avg_start_shot": round(first_shot_ot_avg, 1),
+        "avg_duration": round(duration_ot_avg, 1),
+        "total_matches": total_ot_matches
+    }
+
+
+# ==========================================
+#   SERIE PRIMA CALCOLATE NEL JAVASCRIPT
+# ==========================================
+# Prima queste aggregazioni venivano fatte nel browser sulle liste grezze
+# (rawStats). Ora le pagine ricevono solo il risultato dall'API JSON.
+
+def calculate_shot_distribution(data):
+    """Torta della distribuzione storica dei tiri (centri, bordi, miss)."""
+    frame = _as_frame(data)
+    return {
+        "centri": int(frame.centro.sum()),
+        "bordi": int(frame.bordo.sum()),
+        "miss": int(frame.miss.sum())
+    }
+
+
+def _category_success(codes, categories, hits):
+    """% di successo per categoria, in ordine di prima apparizione (come il JS)."""
+    labels = []
+    values = []
+    if codes.size == 0:
+        return {"labels": labels, "values": values}
+
+    totali, made = _group_counts(codes, hits, len(categories))
+    for code in _first_appearance(codes):
+        cat = categories[code]
+        if not cat or cat in ('-', 'None'):
+            continue
+        labels.append(cat)
+        values.append(f"{made[code] / totali[code] * 100:.1f}")
+    return {"labels": labels, "values": values}
+
+
+def calculate_category_success(data):
+    """Successo per bevanda e per postazione (grafici a barre di extra)."""
+    frame = _as_frame(data)
+    return {
+        "bevanda": _category_success(frame.bevanda, frame.bevanda_cat, frame.centro),
+        "postazione": _category_success(frame.postazione, frame.postazione_cat, frame.centro)
+    }
+
+
+def calculate_format_summary(data):
+    """
+    Riepilogo per formato (partite, vittorie, tiri, centri) per i widget e gli
+    istogrammi della pagina formati. Il risultato di una partita è l'ultimo
+    valorizzato tra i suoi tiri.
+    """
+    frame = _as_frame(data)
+    if frame.n == 0:
+        return {}
+
+    # Esito di ogni partita: ultimo risultato valorizzato
+    has_result = frame.risultato != RISULTATO_NONE
+    match_won = {}
+    for mid, res in zip(frame.match_id[has_result].tolist(), frame.risultato[has_result].tolist()):
+        match_won[mid] = res == RISULTATO_WIN
+
+    def _clean(fmt):
+        if not fmt or fmt in ('-', 'None'):
+            return None
+        return 'Linea Verticale' if fmt in ('Altro', 'LineaVerticale') else fmt
+
+    summary = {}
+    match_sets = {}
+    for code in _first_appearance(frame.formato):
+        name = _clean(frame.formato_cat[code])
+        if name is None:
+            continue
+        mask = frame.formato == code
+        entry = summary.setdefault(name, {"hits": 0, "total_shots": 0})
+        entry["hits"] += int(frame.centro[mask].sum())
+        entry["total_shots"] += int(mask.sum())
+        match_sets.setdefault(name, set()).update(np.unique(frame.match_id[mask]).tolist())
+
+    for name, entry in summary.items():
+        matches = match_sets[name]
+        entry["unique_matches_count"] = len(matches)
+        entry["real_wins"] = sum(1 for mid in matches if match_won.get(mid))
+    return summary
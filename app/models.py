@@ -3,7 +3,7 @@ import json
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash # <--- AGGIUNGI QUESTO IN CIMA
-from sqlalchemy import text
+from sqlalchemy import text, inspect, event
 
 # Inizializza SQLAlchemy
 db = SQLAlchemy()
@@ -26,6 +26,19 @@ CUP_DEFINITIONS = {
     "Singolo Centrale": ["Singolo"]
 }
 
+# Colonne del tabellone salvato su ActiveMatch (vedi app/main/scoreboard.py)
+SCOREBOARD_COLUMNS = ('score_t1', 'score_t2', 'shots_t1_p1', 'shots_t1_p2', 'shots_t2_p1', 'shots_t2_p2')
+
+
+def matchup_key(t1_p1, t1_p2, t2_p1, t2_p2):
+    """
+    Chiave della sfida, uguale per le rivincite a squadre invertite:
+    "Anna & Bea VS Carlo & Dario" (nomi e squadre in ordine alfabetico).
+    """
+    t1 = " & ".join(sorted(p for p in [t1_p1, t1_p2] if p))
+    t2 = " & ".join(sorted(p for p in [t2_p1, t2_p2] if p))
+    return " VS ".join(sorted([t1, t2]))
+
 # ==========================================
 #         FUNZIONE DI INIZIALIZZAZIONE
 # ==========================================
@@ -39,7 +52,8 @@ def init_db(app):
     project_root = os.path.dirname(basedir)
     db_path = os.path.join(project_root, 'instance', 'beerpong.db')
 
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    # Una config può indicare un altro database (es. i benchmark su DB temporaneo)
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', f'sqlite:///{db_path}')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
     db.init_app(app)
@@ -47,6 +61,27 @@ def init_db(app):
     with app.app_context():
         db.create_all()
 
+        # create_all non aggiunge le colonne nuove alle tabelle già esistenti:
+        # le aggiungiamo noi (ALTER TABLE ADD COLUMN)...
+        added_columns = add_missing_columns()
+
+        # --- TABELLE AGGREGATE: prima costruzione se mancano ---
+        # (DB esistenti prima dei rollup, o con la vecchia tabella unica
+        # player_stat_buckets: i bucket vengono generati dai record).
+        # Prima degli indici: l'indice unico nuovo di player_cup_buckets
+        # non si potrebbe creare su una tabella vecchia con chiavi doppie.
+        if PlayerTrendBucket.query.first() is None and PlayerRecord.query.first() is not None:
+            from app.main.stats_rollup import rebuild_rollups
+            print("Costruzione tabelle aggregate dai record...")
+            db.session.execute(text("DROP TABLE IF EXISTS player_stat_buckets"))
+            rebuild_rollups()
+
+        # create_all non crea neanche gli indici nuovi delle tabelle già esistenti
+        # (creati dopo le colonne, che possono servire a un indice nuovo)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+
         # --- SEZIONE AGGIUNTA: CREAZIONE ADMIN ---
         admin_names = ['admin1', 'admin2', 'admin3', 'admin4']
         # La password di default per tutti è "admin" (puoi cambiarla qui sotto)
@@ -66,6 +101,63 @@ def init_db(app):
         if created:
             db.session.commit()
 
+        # --- PUNTEGGI SALVATI: prima compilazione delle colonne appena aggiunte ---
+        if any(f'active_matches.{column}' in added_columns for column in SCOREBOARD_COLUMNS):
+            from app.main.scoreboard import backfill_scoreboards
+            print("Calcolo punteggi e tiri delle partite esistenti...")
+            backfill_scoreboards()
+
+        # --- BICCHIERI A MASCHERA: conversione dalle vecchie colonne JSON ---
+        if 'active_matches.t1_cups' in added_columns:
+            from app.main.cup_state import backfill_cup_masks
+            print("Conversione dello stato dei bicchieri delle partite esistenti...")
+            backfill_cup_masks()
+
+        # --- CHIAVE DELLA SFIDA: prima compilazione della colonna appena aggiunta ---
+        if 'active_matches.matchup_key' in added_columns:
+            print("Calcolo chiave della sfida delle partite esistenti...")
+            backfill_matchup_keys()
+
+
+def backfill_matchup_keys():
+    """Compila matchup_key per tutte le partite (un UPDATE per partita, un commit)."""
+    rows = db.session.query(ActiveMatch.id, ActiveMatch.t1_p1, ActiveMatch.t1_p2,
+                            ActiveMatch.t2_p1, ActiveMatch.t2_p2).all()
+    for match_id, t1_p1, t1_p2, t2_p1, t2_p2 in rows:
+        db.session.execute(ActiveMatch.__table__.update()
+                           .where(ActiveMatch.id == match_id)
+                           .values(matchup_key=matchup_key(t1_p1, t1_p2, t2_p1, t2_p2)))
+    db.session.commit()
+    return len(rows)
+
+
+def add_missing_columns():
+    """
+    Aggiunge alle tabelle esistenti le colonne dei modelli che mancano nel DB
+    (SQLite: ALTER TABLE ... ADD COLUMN, con il default del modello).
+    Restituisce i nomi 'tabella.colonna' aggiunti.
+    """
+    added = []
+    inspector = inspect(db.engine)
+    existing_tables = inspector.get_table_names()
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if default is not None:
+                ddl += f" DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+            with db.engine.begin() as conn:
+                conn.execute(text(ddl))
+            print(f"Aggiunta colonna {table.name}.{column.name}")
+            added.append(f"{table.name}.{column.name}")
+    return added
+
 # ==========================================
 #              MODELLI DATABASE
 # ==========================================
@@ -89,6 +181,21 @@ class ActiveMatch(db.Model):
     Contiene lo stato del gioco, i bicchieri rimasti, ecc.
     """
     __tablename__ = 'active_matches'
+    __table_args__ = (
+        # Storico delle 24 ore (home): range su end_time (valorizzato solo per le partite finite).
+        # Niente indice che inizi con status: con pochi valori diversi il planner di
+        # SQLite lo preferirebbe agli indici sugli slot, leggendo tutte le partite finite.
+        db.Index('ix_matches_end_time', 'end_time'),
+        # Archivio filtrato per sfida: pagine già ordinate per ora di fine
+        db.Index('ix_matches_matchup_end', 'matchup_key', 'end_time'),
+        # "In che partita è seduto X?": un indice per slot. SQLite li usa insieme
+        # per l'OR dei quattro posti (t1_p1 = X OR t1_p2 = X OR ...) e filtra
+        # lo status sull'indice, senza leggere tutta la tabella.
+        db.Index('ix_matches_t1_p1_status', 't1_p1', 'status'),
+        db.Index('ix_matches_t1_p2_status', 't1_p2', 'status'),
+        db.Index('ix_matches_t2_p1_status', 't2_p1', 'status'),
+        db.Index('ix_matches_t2_p2_status', 't2_p2', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     match_name = db.Column(db.String(50), default="Partita")
@@ -105,13 +212,15 @@ class ActiveMatch(db.Model):
     t1_p1 = db.Column(db.String(50)); t1_p2 = db.Column(db.String(50))
     t2_p1 = db.Column(db.String(50)); t2_p2 = db.Column(db.String(50))
 
-    # Stato Bicchieri (Salvato come stringa JSON es: '["3 Cen", "2 Dx"]')
-    t1_cup_state = db.Column(db.Text, default='[]')
-    t2_cup_state = db.Column(db.Text, default='[]')
+    # Stato Bicchieri: maschere di bit sul formato della squadra (vedi app/main/cup_state.py)
+    t1_cups = db.Column(db.Integer, default=0)
+    t2_cups = db.Column(db.Integer, default=0)
     
-    # Bicchieri in attesa di conferma (blu/azzurri)
-    t1_pending_list = db.Column(db.Text, default='[]')
-    t2_pending_list = db.Column(db.Text, default='[]')
+    # Bicchieri in attesa di conferma (blu/azzurri) e colpi senza bicchiere (overkill)
+    t1_pending = db.Column(db.Integer, default=0)
+    t2_pending = db.Column(db.Integer, default=0)
+    t1_overkill = db.Column(db.Integer, default=0)
+    t2_overkill = db.Column(db.Integer, default=0)
 
     # Logica di vittoria
     winning_team = db.Column(db.String(10), nullable=True)
@@ -129,15 +238,45 @@ class ActiveMatch(db.Model):
     t1_format_changed = db.Column(db.Boolean, default=False)
     t2_format_changed = db.Column(db.Boolean, default=False)
 
+    # Revisione dello stato di gioco salvato dal motore in memoria (vedi
+    # app/main/match_engine.py): una scrittura più vecchia non sovrascrive una più nuova
+    state_rev = db.Column(db.Integer, default=0)
+
+    # Tabellone salvato (aggiornato a ogni tiro da app/main/scoreboard.py):
+    # punti per squadra (solo tiri da start_time, multihit = più punti)
+    # e tiri del giocatore seduto in ciascuno slot
+    score_t1 = db.Column(db.Integer, default=0)
+    score_t2 = db.Column(db.Integer, default=0)
+    shots_t1_p1 = db.Column(db.Integer, default=0)
+    shots_t1_p2 = db.Column(db.Integer, default=0)
+    shots_t2_p1 = db.Column(db.Integer, default=0)
+    shots_t2_p2 = db.Column(db.Integer, default=0)
+
+    # Chiave della sfida (vedi matchup_key), ricalcolata a ogni salvataggio:
+    # lo storico raggruppa le rivincite in SQL
+    matchup_key = db.Column(db.String(220))
+
     # Relazione con i record dei tiri
     records = db.relationship('PlayerRecord', backref='match', lazy=True)
 
 
+@event.listens_for(ActiveMatch, 'before_insert')
+@event.listens_for(ActiveMatch, 'before_update')
+def _set_matchup_key(mapper, connection, match):
+    # Gli slot cambiano in molte rotte (assegnazione, rimozione, rematch, cambio nome):
+    # la chiave viene aggiornata qui, una volta sola, prima di ogni INSERT/UPDATE
+    match.matchup_key = matchup_key(match.t1_p1, match.t1_p2, match.t2_p1, match.t2_p2)
+
+
 class PlayerRecord(db.Model):
     """
     Tabella dei Tiri (Records) Ottimizzata per Analisi.
     """
     __tablename__ = 'records'
+    __table_args__ = (
+        # Statistiche per finestra temporale: range scan su (giocatore, data)
+        db.Index('ix_records_player_date', 'player_id', 'match_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -197,6 +336,129 @@ class PlayerRecord(db.Model):
     def giocatore(self):
         return self.player.name if self.player else "Sconosciuto"
 
+class MatchEvent(db.Model):
+    """
+    Log degli eventi di una partita (solo aggiunte, vedi app/main/match_log.py):
+    tiri, cambi formato, gestione manuale, overtime... Lo stato della partita
+    si ricostruisce riapplicando gli eventi dalla fotografia più vicina.
+    """
+    __tablename__ = 'match_events'
+    __table_args__ = (
+        db.UniqueConstraint('match_id', 'seq', name='uq_match_events_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey('active_matches.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)          # 1, 2, 3... per partita
+    kind = db.Column(db.String(20), nullable=False)      # shot, format, force, manual, overtime, undo...
+    timestamp = db.Column(db.DateTime, default=datetime.now)
+    # Il tiro (kind 'shot'): come teammate_id nei record, senza vincolo (il tiro può essere cancellato)
+    record_id = db.Column(db.Integer, nullable=True, index=True)
+    payload = db.Column(db.Text)                         # JSON: i dati per riapplicare l'evento
+
+    record = db.relationship('PlayerRecord', primaryjoin='MatchEvent.record_id == PlayerRecord.id',
+                             foreign_keys='MatchEvent.record_id')
+
+
+class MatchSnapshot(db.Model):
+    """Fotografia dello stato di una partita dopo l'evento `seq` (punto di partenza del replay)."""
+    __tablename__ = 'match_snapshots'
+    __table_args__ = (
+        db.Index('ix_match_snapshots_match_seq', 'match_id', 'seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey('active_matches.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.Text, nullable=False)           # JSON dei campi di match_engine.STATE_FIELDS
+
+
+# --- TABELLE DI AGGREGAZIONE (Rollup per giocatore, vedi app/main/stats_rollup.py) ---
+# Una tabella per grafico, con le sole dimensioni che il grafico legge e i
+# conteggi già sommati. La chiave (player_id + dimensioni) ha un indice unico:
+# gli aggiornamenti sono upsert su quell'indice. Le dimensioni non sono mai
+# NULL (per SQLite due NULL sono diversi anche in un indice unico): un valore
+# mancante è salvato come stats_rollup.MISSING.
+
+class PlayerTrendBucket(db.Model):
+    """Tiri per giocatore x data x ora (andamento giornaliero e orario)."""
+    __tablename__ = 'player_trend_buckets'
+    __table_args__ = (
+        db.Index('ux_player_trend_buckets_key', 'player_id', 'match_date', 'match_hour', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False)
+
+    # --- DIMENSIONI ---
+    match_date = db.Column(db.String(20), nullable=False)
+    match_hour = db.Column(db.Integer, nullable=False)
+
+    # --- CONTEGGI ---
+    tiri = db.Column(db.Integer, default=0)
+    centri = db.Column(db.Integer, default=0)
+    bordi = db.Column(db.Integer, default=0)
+    miss = db.Column(db.Integer, default=0)
+
+
+class PlayerPositionBucket(db.Model):
+    """Tiri per giocatore x bicchieri avversari x postazione (successo per postazione)."""
+    __tablename__ = 'player_position_buckets'
+    __table_args__ = (
+        db.Index('ux_player_position_buckets_key', 'player_id', 'cups_opp', 'postazione', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False)
+
+    # --- DIMENSIONI ---
+    cups_opp = db.Column(db.Integer, nullable=False)
+    postazione = db.Column(db.String(20), nullable=False)
+
+    # --- CONTEGGI ---
+    tiri = db.Column(db.Integer, default=0)
+    centri = db.Column(db.Integer, default=0)
+    bordi = db.Column(db.Integer, default=0)
+    miss = db.Column(db.Integer, default=0)
+
+
+class PlayerFormatBucket(db.Model):
+    """Tiri per giocatore x bicchieri avversari x formato (successo per bicchieri e formato)."""
+    __tablename__ = 'player_format_buckets'
+    __table_args__ = (
+        db.Index('ux_player_format_buckets_key', 'player_id', 'cups_opp', 'formato', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False)
+
+    # --- DIMENSIONI ---
+    cups_opp = db.Column(db.Integer, nullable=False)
+    formato = db.Column(db.String(20), nullable=False)
+
+    # --- CONTEGGI ---
+    tiri = db.Column(db.Integer, default=0)
+    centri = db.Column(db.Integer, default=0)
+    bordi = db.Column(db.Integer, default=0)
+    miss = db.Column(db.Integer, default=0)
+
+
+class PlayerCupBucket(db.Model):
+    """
+    Tabella di Aggregazione dei bicchieri colpiti (per le heatmap dei formati).
+    Una riga per giocatore x formato x bicchiere.
+    """
+    __tablename__ = 'player_cup_buckets'
+    __table_args__ = (
+        db.Index('ux_player_cup_buckets_key', 'player_id', 'formato', 'bicchiere', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('players.id'), nullable=False, index=True)
+    formato = db.Column(db.String(20))
+    bicchiere = db.Column(db.String(20))
+    colpi = db.Column(db.Integer, default=0)
+
 # ==========================================
 #      HELPER FUNCTIONS (Per admin DB)
 # ==========================================
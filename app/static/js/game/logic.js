@@ -521,10 +521,24 @@ document.addEventListener("DOMContentLoaded", function() {
     // 4. WebSocket Auto-Refresh
     if (typeof io !== 'undefined' && typeof myMatchId !== 'undefined') {
         const socket = io();
+        // Riceviamo solo gli eventi del nostro tavolo (stanza "match:<id>"), anche dopo una riconnessione
+        let connectedOnce = false;
+        socket.on('connect', function() {
+            // Riconnessione: il server può essere ripartito, la versione della pagina non conta più
+            if (connectedOnce) myMatchVersion = 0;
+            connectedOnce = true;
+            if (myMatchId) socket.emit('segui_tavolo', { match_id: myMatchId });
+        });
         socket.on('partita_aggiornata', function(data) {
-            if (data.match_id === myMatchId) {
+            if (data.match_id !== myMatchId) return;
+            // Eventi arrivati in ritardo (più vecchi di quello già applicato): li ignoriamo
+            if (typeof data.version === 'number') {
+                if (data.version <= myMatchVersion) return;
+                myMatchVersion = data.version;
+            }
+            if (!applyMatchDelta(data)) {
                 console.log("Aggiornamento ricevuto! Ricarico...");
-                location.reload(); 
+                location.reload();
             }
         });
     }
@@ -572,4 +586,56 @@ document.addEventListener("DOMContentLoaded", function() {
             };
         }
     }
-});
\ No newline at end of file
+});
+
+
+/* ==========================================
+   AGGIORNAMENTO LIVE DEL TAVOLO (Delta SocketIO)
+   ========================================== */
+
+// Sostituisce il contenuto di un array globale (le const della pagina) senza cambiarne il riferimento
+function replaceArray(target, values) {
+    target.splice(0, target.length, ...(values || []));
+}
+
+// Applica lo stato ricevuto con 'partita_aggiornata' (bicchieri, pendenti, banner SCALA).
+// Restituisce false quando serve ricaricare la pagina: cambio di fase (salvezza, overtime,
+// fine partita), cambio di formato, squadre in bilico o un nostro tiro fatto da un altro dispositivo.
+function applyMatchDelta(data) {
+    if (!data.cups || (myTeam !== 't1' && myTeam !== 't2')) return false;
+    if (data.status !== 'running') return false;
+
+    const oppTeam = (myTeam === 't1') ? 't2' : 't1';
+    const mine = data.cups[myTeam];
+    const theirs = data.cups[oppTeam];
+    if (mine.format !== serverMyFormat || theirs.format !== serverOppFormat) return false;
+    if (data.record && data.record.player === window.myPlayerName) return false;
+
+    if (data.mode !== serverMatchMode) return false;
+
+    // Colpi in attesa = bicchieri pendenti + overkill (colpi senza bicchiere)
+    const myDamage = mine.pending.length + (mine.overkill || 0);
+    const theirDamage = theirs.pending.length + (theirs.overkill || 0);
+
+    // Vita "reale" a zero: il server deve decidere la fase successiva (la pagina la mostra al reload)
+    if (mine.active.length - myDamage <= 0 || theirs.active.length - theirDamage <= 0) return false;
+
+    replaceArray(activeCupsMe, mine.active);
+    replaceArray(myPendingCups, mine.pending);
+    replaceArray(activeCupsOpponent, theirs.active);
+    replaceArray(pendingCups, theirs.pending);
+    myOverkill = mine.overkill || 0;
+    oppOverkill = theirs.overkill || 0;
+
+    const banner = document.getElementById('pending-banner');
+    if (banner) {
+        banner.style.display = theirDamage > 0 ? '' : 'none';
+        const count = document.getElementById('pending-banner-count');
+        if (count) count.textContent = theirDamage;
+    }
+
+    if (typeof window.updateCupsVisuals === 'function') window.updateCupsVisuals();
+    console.log(`✅ Tavolo #${data.match_id} aggiornato senza reload (v${data.version}).`);
+    return true;
+}
+
@@ -29,7 +29,8 @@ window.updateAvailableFormats = function() {
     // --- CONDIZIONI DI BLOCCO ---
     
     // A. C'è un bicchiere colpito in sospeso (pending)?
-    const hasPendingOpponent = (typeof pendingCups !== 'undefined' && pendingCups.length > 0);
+    const hasPendingOpponent = (typeof pendingCups !== 'undefined' && pendingCups.length > 0) ||
+                               (typeof oppOverkill !== 'undefined' && oppOverkill > 0);
     
     // B. Il formato è già stato cambiato in precedenza (Server lock)?
     const isServerLocked = (typeof serverOppFormat !== 'undefined' && serverOppFormat && serverOppFormat !== "Piramide");
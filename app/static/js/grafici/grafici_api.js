@@ -0,0 +1,38 @@
+/**
+ * File: static/js/grafici/grafici_api.js
+ * Scarica le serie dei grafici da /api/stats/<player_id>/<sezione>.
+ * Il browser rivalida con l'ETag: se i dati non sono cambiati riceve un 304.
+ * La finestra temporale della pagina (dal / al / sessioni) viene inoltrata all'API.
+ */
+
+const STATS_WINDOW_PARAMS = ['dal', 'al', 'sessioni'];
+
+// Query string della finestra temporale presa dall'URL della pagina ('' se assente)
+function statsWindowQuery() {
+    const pageParams = new URLSearchParams(window.location.search);
+    const params = new URLSearchParams();
+    STATS_WINDOW_PARAMS.forEach(name => {
+        const value = pageParams.get(name);
+        if (value) params.set(name, value);
+    });
+    const query = params.toString();
+    return query ? `?${query}` : '';
+}
+
+function fetchStatsSection(playerId, section) {
+    return fetch(`/api/stats/${playerId}/${section}${statsWindowQuery()}`, { credentials: 'same-origin' })
+        .then(response => {
+            if (!response.ok) throw new Error(`Sezione ${section}: HTTP ${response.status}`);
+            return response.json();
+        });
+}
+
+// Scarica più sezioni in parallelo e restituisce { sezione: dati }
+function fetchStatsSections(playerId, sections) {
+    return Promise.all(sections.map(section => fetchStatsSection(playerId, section)))
+        .then(results => {
+            const data = {};
+            sections.forEach((section, i) => { data[section] = results[i]; });
+            return data;
+        });
+}
@@ -8,8 +8,17 @@ if (typeof ChartAnnotation !== 'undefined') {
 }
 
 document.addEventListener("DOMContentLoaded", function() {
-    if (window.extraData && window.extraData.rawStats) {
-        renderExtraCharts(window.extraData);
+    if (window.extraData && window.extraData.playerId) {
+        fetchStatsSections(window.extraData.playerId, ["partnerships", "shot_metrics", "pos_by_cups", "category_success"])
+            .then(sezioni => {
+                renderExtraCharts({
+                    partnerships: sezioni.partnerships,
+                    shotMetrics: sezioni.shot_metrics,
+                    posByCups: sezioni.pos_by_cups,
+                    categorySuccess: sezioni.category_success
+                });
+            })
+            .catch(err => console.error("Errore caricamento grafici extra:", err));
     } else {
         console.error("Errore: window.extraData non trovato.");
     }
@@ -24,7 +33,7 @@ const drinkColorMap = {
 };
 
 function renderExtraCharts(data) {
-    const raw = data.rawStats;
+    const categories = data.categorySuccess || { bevanda: { labels: [], values: [] }, postazione: { labels: [], values: [] } };
     const parts = data.partnerships || { partners: { labels: [], values: [] }, enemies: { labels: [], values: [] } };
     const shots = data.shotMetrics;
 
@@ -48,14 +57,14 @@ function renderExtraCharts(data) {
     }
 
     // --- 2. ANALISI BEVANDE ---
-    const drinkStats = calculateCategorySuccess(raw.bevanda, raw.centro);
+    const drinkStats = categories.bevanda;
     if (drinkStats.labels.length > 0) {
         const drinkColors = drinkStats.labels.map(label => getDrinkColor(label));
         renderBarChart('chartDrinkSuccess', drinkStats.labels, drinkStats.values, 'Successo %', drinkColors);
     }
 
     // --- 3. ANALISI POSTAZIONI (CON ORDINAMENTO FORZATO) ---
-    const posStats = calculateCategorySuccess(raw.postazione, raw.centro);
+    const posStats = categories.postazione;
     
     // Logica di ordinamento: Sinistra -> Centrale -> Destra
     const order = ["Sinistra", "Centrale", "Destra"];
@@ -112,20 +121,6 @@ function getDrinkColor(label) {
     return 'rgba(149, 165, 166, 0.7)';
 }
 
-function calculateCategorySuccess(categoryList, centerList) {
-    let stats = {};
-    categoryList.forEach((cat, index) => {
-        if (!cat || cat === '-' || cat === 'None') return;
-        if (!stats[cat]) stats[cat] = { total: 0, made: 0 };
-        stats[cat].total += 1;
-        const isCenter = centerList[index] === 'Sì' || centerList[index] === true || centerList[index] === 'True' || centerList[index] === 1;
-        if (isCenter) stats[cat].made += 1;
-    });
-    const labels = Object.keys(stats);
-    const values = labels.map(l => ((stats[l].made / stats[l].total) * 100).toFixed(1));
-    return { labels, values };
-}
-
 // --------------------------------------------------------
 // FUNZIONE PER GRAFICI A BARRE (Assi Dinamici)
 // --------------------------------------------------------
@@ -19,73 +19,34 @@ const formatColors = {
 const defaultColor = "#bdc3c7"; 
 
 document.addEventListener("DOMContentLoaded", function() {
-    if (window.formatData) {
-        // 1. Processa i dati per i grafici 2D
-        const stats = processRawStats(window.formatData.rawStats);
-        
-        // 2. Aggiorna i Widget in alto
-        updateWidgets(stats);
+    if (window.formatData && window.formatData.playerId) {
+        fetchStatsSections(window.formatData.playerId, ["format_summary", "success_by_cups", "format_3d"])
+            .then(sezioni => {
+                // 1. Riepilogo per formato (già aggregato dal server)
+                const stats = sezioni.format_summary || {};
 
-        // 3. Disegna i grafici 2D (Chart.js) con i NUOVI COLORI
-        render2DCharts(stats);
+                // 2. Aggiorna i Widget in alto
+                updateWidgets(stats);
 
-        // 4. Disegna i nuovi grafici lineari (Successo per Bicchieri)
-        if (window.formatData.successByCups) {
-            renderCupsCharts(window.formatData.successByCups);
-        }
+                // 3. Disegna i grafici 2D (Chart.js) con i NUOVI COLORI
+                render2DCharts(stats);
 
-        // 5. Disegna i grafici 3D (ECharts)
-        if (window.formatData.format3D) {
-            render3DCharts(window.formatData.format3D);
-        }
+                // 4. Disegna i nuovi grafici lineari (Successo per Bicchieri)
+                if (sezioni.success_by_cups) {
+                    renderCupsCharts(sezioni.success_by_cups);
+                }
+
+                // 5. Disegna i grafici 3D (ECharts)
+                if (sezioni.format_3d) {
+                    render3DCharts(sezioni.format_3d);
+                }
+            })
+            .catch(err => console.error("Errore caricamento grafici formati:", err));
     } else {
         console.error("Nessun dato trovato in window.formatData");
     }
 });
 
-/* ============================================================
-   SEZIONE 1: ELABORAZIONE DATI (Per Grafici 2D)
-   ============================================================ */
-function processRawStats(raw) {
-    const formats = raw.formato || [];
-    const results = raw.match_result || [];
-    const hits = raw.centro || [];
-    const matchIds = raw.match_ids || [];
-    const agg = {};
-
-    formats.forEach((fmt, i) => {
-        if (!fmt || fmt === '-' || fmt === 'None') return;
-
-        let cleanName = fmt;
-        if (fmt === 'Altro') cleanName = 'Linea Verticale';
-        if (fmt === 'LineaVerticale') cleanName = 'Linea Verticale';
-
-        if (!agg[cleanName]) {
-            agg[cleanName] = { wins: 0, total_matches: new Set(), hits: 0, total_shots: 0 };
-        }
-
-        agg[cleanName].total_matches.add(matchIds[i]);
-        agg[cleanName].total_shots++;
-        
-        const isHit = (hits[i] === 'Sì' || hits[i] === true || hits[i] === 'True' || hits[i] === 1);
-        if (isHit) agg[cleanName].hits++;
-    });
-
-    const matchOutcomeMap = {}; 
-    matchIds.forEach((mid, i) => { if (results[i]) matchOutcomeMap[mid] = results[i]; });
-
-    for (const fmt in agg) {
-        let wins = 0;
-        agg[fmt].total_matches.forEach(mid => {
-            const res = matchOutcomeMap[mid];
-            if (res === 'Win' || res === 'Vittoria') wins++;
-        });
-        agg[fmt].real_wins = wins;
-        agg[fmt].unique_matches_count = agg[fmt].total_matches.size;
-    }
-    return agg;
-}
-
 function updateWidgets(stats) {
     let mostPlayed = { name: '-', count: 0 };
     let bestWinRate = { name: '-', rate: 0 };
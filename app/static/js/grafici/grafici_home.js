@@ -83,7 +83,7 @@ function renderComparisonCharts(data) {
     console.log("--- DEBUG DATI GRAFICI ---");
     console.log("Storico:", data.historical);
     console.log("Giornaliero:", data.daily);
-    console.log("Liste Grezze:", data.rawStats);
+    console.log("Distribuzione:", data.distribution);
     console.log("--------------------------");
 
     // 2. CONFIGURAZIONE ESTETICA COMUNE (Per i grafici a barre)
@@ -172,13 +172,13 @@ function renderComparisonCharts(data) {
     // ============================================================
     const ctxPie = document.getElementById('chartDistribution');
     
-    if (ctxPie && data.rawStats && data.rawStats.centro) {
+    if (ctxPie && data.distribution) {
         if (Chart.getChart(ctxPie)) Chart.getChart(ctxPie).destroy();
 
-        // Filtriamo le liste grezze totali
-        const countCentri = data.rawStats.centro.filter(v => v === 'Sì' || v === true || v === 'True').length;
-        const countBordi  = data.rawStats.bordo.filter(v => v === 'Sì' || v === true || v === 'True').length;
-        const countMiss   = data.rawStats.miss.filter(v => v === 'Sì' || v === true || v === 'True').length;
+        // Conteggi totali già aggregati dal server
+        const countCentri = data.distribution.centri;
+        const countBordi  = data.distribution.bordi;
+        const countMiss   = data.distribution.miss;
 
         if (countCentri + countBordi + countMiss > 0) {
             new Chart(ctxPie, {
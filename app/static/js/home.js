@@ -45,51 +45,99 @@ document.addEventListener('DOMContentLoaded', function() {
     // 4. AGGIORNAMENTO REAL-TIME (SOCKET.IO) - "SURGICAL UPDATE"
     if (typeof io !== 'undefined') {
         const socket = io();
-        
+
+        // Stanza della lobby: eventi di tutti i tavoli (anche dopo una riconnessione)
+        socket.on('connect', function() {
+            // Il server può essere ripartito: le versioni viste finora non contano più
+            for (const matchId in tableVersions) delete tableVersions[matchId];
+            socket.emit('segui_lobby');
+        });
+
         socket.on('partita_aggiornata', function(data) {
             console.log("⚡ Aggiornamento tavolo #" + data.match_id);
-            
-            // 1. Identifichiamo il tavolo che è cambiato
-            const matchId = data.match_id;
+            if (!patchTableScore(data)) refreshTableCard(data.match_id);
+        });
+    }
+});
+
+
+/* ==========================================
+   AGGIORNAMENTO DI UN SINGOLO TAVOLO
+   ========================================== */
+
+// Ultima versione applicata per ogni tavolo: gli eventi arrivati in ritardo vengono ignorati
+const tableVersions = {};
+
+// Classe di stato della card (stesse regole di includes/single_match_card.html)
+function tableStatusClass(data) {
+    if (data.status.includes('redemption')) return 'redemption';
+    if (data.mode === 'overtime') return 'overtime';
+    if (data.slots.t1_p1 && data.slots.t2_p1) return 'live';
+    return 'prep';
+}
+
+// Dopo un tiro cambia solo il punteggio: lo aggiorniamo direttamente dal delta.
+// Restituisce false se serve rifare la card (posti, fase del tavolo, tavolo nuovo o finito).
+function patchTableScore(data) {
+    if (typeof data.version === 'number') {
+        if (data.version <= (tableVersions[data.match_id] || 0)) return true;
+        tableVersions[data.match_id] = data.version;
+    }
+    if (!data.record || !data.score || data.status === 'finished') return false;
+
+    const card = document.getElementById(`table-card-${data.match_id}`);
+    if (!card || !card.classList.contains(tableStatusClass(data))) return false;
+
+    const blue = card.querySelector('.score-number.blue');
+    const red = card.querySelector('.score-number.red');
+    if (!blue || !red) return false;
+
+    blue.textContent = data.score[0];
+    red.textContent = data.score[1];
+    return true;
+}
+
+// Chiede al server SOLO l'HTML del tavolo cambiato e lo sostituisce nella pagina.
+// 200 -> card aggiornata (o aggiunta, se il tavolo è nuovo)
+// 204 -> partita finita: la card esce dai tavoli attivi
+// 404 -> tavolo eliminato
+function refreshTableCard(matchId) {
+    fetch(`/api/render_table/${matchId}`)
+        .then(response => {
+            if (response.status === 204 || response.status === 404) return null;
+            if (!response.ok) throw new Error("Errore network " + response.status);
+            return response.text();
+        })
+        .then(html => {
             const cardElement = document.getElementById(`table-card-${matchId}`);
 
+            if (html === null) {
+                if (cardElement) cardElement.remove();
+                console.log(`✅ Tavolo #${matchId} rimosso dai tavoli attivi.`);
+                return;
+            }
+
             if (cardElement) {
-                // 2. Chiediamo al server SOLO l'HTML aggiornato di questo tavolo
-                // Nota: Devi creare questa rotta in Python (vedi punto 3 sotto)
-                fetch(`/api/render_table/${matchId}`)
-                    .then(response => {
-                        if (!response.ok) throw new Error("Errore network");
-                        return response.text();
-                    })
-                    .then(html => {
-                        // 3. Sostituiamo il vecchio HTML con quello nuovo
-                        cardElement.outerHTML = html;
-                        
-                        // 4. Ri-applichiamo eventuali evidenziazioni (il "mio posto")
-                        if (window.currentUserName) {
-                            // Cerchiamo nel NUOVO elemento appena inserito
-                            const newCard = document.getElementById(`table-card-${matchId}`);
-                            const nameElements = newCard.querySelectorAll('.player-name-text');
-                            nameElements.forEach(el => {
-                                if (el.textContent.trim() === window.currentUserName) {
-                                    el.closest('.slot-box').classList.add('my-seat');
-                                }
-                            });
-                        }
-                        console.log(`✅ Tavolo #${matchId} aggiornato senza reload.`);
-                    })
-                    .catch(err => {
-                        console.error("Errore update parziale, fallback su reload:", err);
-                        // Se qualcosa va storto, ricarichiamo la pagina per sicurezza
-                        location.reload();
-                    });
+                cardElement.outerHTML = html;
             } else {
-                // Se non troviamo il tavolo (es. nuovo tavolo creato), ricarichiamo tutto
-                location.reload();
+                // Tavolo nuovo: lo aggiungiamo in fondo alla griglia (creandola se la sala era vuota)
+                let grid = document.querySelector('.matches-grid');
+                if (!grid) {
+                    grid = document.createElement('div');
+                    grid.className = 'matches-grid';
+                    const emptyState = document.querySelector('.empty-state');
+                    if (emptyState) emptyState.replaceWith(grid);
+                    else return;
+                }
+                grid.insertAdjacentHTML('beforeend', html);
             }
+            console.log(`✅ Tavolo #${matchId} aggiornato senza reload.`);
+        })
+        .catch(err => {
+            // Nessun reload della lobby: il prossimo aggiornamento riproverà
+            console.error(`Errore aggiornamento tavolo #${matchId}:`, err);
         });
-    }
-});
+}
 
 
 /* ==========================================
@@ -0,0 +1,58 @@
+"""
+Benchmark delle statistiche. Suite completa: python -m benchmarks (vedi bench_stats_suite.py).
+
+Parti comuni dei benchmark che passano dalle rotte dell'app: app su un
+database SQLite temporaneo, client già entrato nel sito e tavolo 2 contro 2.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import Config
+from app import create_app
+from app.models import db, ActiveMatch
+from app.main.scoreboard import MATCH_SLOTS
+from app.main.seat_index import seat_index
+from app.main.cup_state import reset_team_cups
+from app.main.match_log import log_event, state_dict
+
+
+@contextmanager
+def temp_app(**settings):
+    """App completa su un database SQLite temporaneo, cancellato all'uscita (settings: config in più)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = type("BenchConfig", (Config,), {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            "TESTING": True,
+            "RATELIMIT_ENABLED": False,
+            **settings,
+        })
+        yield create_app(config)
+
+
+def login(app, player_id, player_name):
+    """Client di prova con il gate del sito superato e il giocatore in sessione."""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['site_access_granted'] = True
+        sess['player_id'] = player_id
+        sess['player_name'] = player_name
+    return client
+
+
+def new_table(names):
+    """
+    Tavolo 2 contro 2 a Piramide con i quattro giocatori indicati, salvato con il
+    suo evento 'start' come create_match_quick. Restituisce l'id della partita.
+    """
+    match = ActiveMatch(match_name="Tavolo bench", status='running', mode='squadre', start_time=datetime.now(),
+                        **dict(zip(MATCH_SLOTS, names)))
+    reset_team_cups(match, 't1', 'Piramide')
+    reset_team_cups(match, 't2', 'Piramide')
+    db.session.add(match)
+    db.session.flush()
+    log_event(match, 'start', state_dict(match))
+    db.session.commit()
+    seat_index.sync_match(match)
+    return match.id
@@ -0,0 +1,3 @@
+from benchmarks.bench_stats_suite import main
+
+main()
@@ -0,0 +1,182 @@
+"""
+Latenza e query di un tiro (POST /add/<giocatore>).
+
+Crea un database SQLite temporaneo con un tavolo 2 contro 2 (più qualche
+altro tavolo attivo), poi registra una serie di tiri a rotazione dei quattro
+giocatori e per ogni tiro:
+1. conta le query eseguite PRIMA della prima scrittura (risoluzione di
+   partita, giocatori e numero del tiro): al massimo MAX_RESOLVE_QUERIES;
+2. conta i commit: esattamente uno, anche per il tiro che avvia l'overtime o
+   chiude la partita (fase, Win/Loss e tiro nella stessa transazione);
+3. controlla che shot_number sia uguale al vecchio COUNT dei tiri del
+   giocatore nella partita e che il tabellone salvato resti coerente;
+4. a fine corsa, per ogni partita finita, controlla che tutti i tiri abbiano
+   match_result (Win/Loss), compreso il tiro che l'ha chiusa.
+Lo stato dei bicchieri resta nel motore in memoria (match_engine.py): il
+salvataggio in background è spento durante la misura (i suoi commit
+finirebbero nel conteggio) e fatto alla fine con flush(), controllando che
+la riga salvata coincida con lo stato vivo.
+Quando una partita finisce se ne apre un'altra con gli stessi giocatori.
+Alla fine stampa la latenza media e il 95° percentile dei tiri.
+
+Uso (dalla cartella del progetto):
+    python benchmarks/bench_add_record.py [tiri]
+Default: 200 tiri.
+"""
+import os
+import sys
+import random
+import time
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import event
+from app.models import db, Player, ActiveMatch, PlayerRecord
+from app.main.scoreboard import check_scoreboards
+from app.main.match_engine import match_engine, STATE_FIELDS
+from benchmarks import temp_app, login, new_table
+
+# Letture prima della prima scrittura e commit attesi per ogni tiro
+MAX_RESOLVE_QUERIES = 3
+EXPECTED_COMMITS = 1
+CUPS = ["3 Sx", "3 Cen", "3 Dx", "2 Sx", "2 Dx", "1 Cen"]
+
+
+def populate(n_other_tables, seed=42):
+    rnd = random.Random(seed)
+    players = [Player(name=f"bench{i}", password="-", is_admin=(i == 1)) for i in range(1, 5 + 4 * n_other_tables)]
+    db.session.add_all(players)
+    db.session.commit()
+    names = [p.name for p in players]
+
+    for i in range(n_other_tables):
+        new_table(names[4 + 4 * i:8 + 4 * i])
+    return new_table(names[:4]), names[:4], players[0].id, rnd
+
+
+class StatementLog:
+    """Statement SQL e commit eseguiti sul motore durante il blocco with."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.commits = 0
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.statements.append(statement.lstrip().split(None, 1)[0].upper())
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(self.engine, "commit", self._on_commit)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        event.remove(self.engine, "commit", self._on_commit)
+
+    def reads_before_first_write(self):
+        reads = 0
+        for kind in self.statements:
+            if kind in ("INSERT", "UPDATE", "DELETE"):
+                break
+            reads += 1
+        return reads
+
+
+def main(n_shots):
+    # Nessun salvataggio in background durante la misura (vedi flush sotto)
+    with temp_app(MATCH_STATE_WRITE_BEHIND=3600) as app:
+        with app.app_context():
+            match_id, names, admin_id, rnd = populate(n_other_tables=5)
+            db.session.remove()
+
+        client = login(app, admin_id, names[0])
+
+        timings = []
+        max_reads = 0
+        phase_shots = 0   # tiri che avviano l'overtime o chiudono la partita
+        match_ids = [match_id]
+        for i in range(n_shots):
+            shooter = names[i % 4]
+            esito = rnd.choice(["Centro", "Miss", "Miss", "Bordo"])
+            form = {'risultato_tiro': esito, 'formato': 'Piramide', 'postazione': 'Centro',
+                    'bevanda': 'Birra', 'bicchieri_multipli': ''}
+            if esito == "Centro":
+                form['bicchiere_colpito'] = [rnd.choice(CUPS)]
+
+            with app.app_context():
+                mode_before = (match_engine.peek(match_id) or db.session.get(ActiveMatch, match_id)).mode
+                with StatementLog(db.engine) as log:
+                    start = time.perf_counter()
+                    response = client.post(f'/add/{shooter}', data=form)
+                    timings.append((time.perf_counter() - start) * 1000)
+                match = db.session.get(ActiveMatch, match_id)
+                finished = match.status == 'finished'
+                overtime = (match_engine.peek(match_id) or match).mode == 'overtime' != mode_before
+                phase_shots += finished or overtime
+                db.session.remove()
+
+            if response.status_code != 302:
+                sys.exit(f"ERRORE: il tiro {i + 1} ha risposto {response.status_code}")
+            reads = log.reads_before_first_write()
+            max_reads = max(max_reads, reads)
+            if reads > MAX_RESOLVE_QUERIES:
+                sys.exit(f"ERRORE: tiro {i + 1}: {reads} query prima della prima scrittura "
+                         f"(massimo {MAX_RESOLVE_QUERIES}): {log.statements}")
+            if log.commits != EXPECTED_COMMITS:
+                sys.exit(f"ERRORE: tiro {i + 1}: {log.commits} commit (attesi {EXPECTED_COMMITS})")
+
+            if finished:
+                # Partita finita: nuovo tavolo con gli stessi giocatori
+                with app.app_context():
+                    match_id = new_table(names)
+                    match_ids.append(match_id)
+                    db.session.remove()
+
+        with app.app_context():
+            if PlayerRecord.query.filter(PlayerRecord.match_id.in_(match_ids)).count() != len(timings):
+                sys.exit("ERRORE: non tutti i tiri sono stati registrati su una partita")
+            # shot_number dal tabellone == vecchio COUNT dei tiri del giocatore nella partita
+            for mid in match_ids:
+                for name in names:
+                    player = Player.query.filter_by(name=name).first()
+                    numbers = [r.shot_number for r in PlayerRecord.query.filter_by(match_id=mid, player_id=player.id)
+                               .order_by(PlayerRecord.id)]
+                    if numbers != list(range(1, len(numbers) + 1)):
+                        sys.exit(f"ERRORE: numeri di tiro non progressivi per {name} nella partita {mid}: {numbers}")
+            # Partite finite: nessun tiro senza risultato, neanche quello di chiusura
+            for mid in match_ids:
+                if db.session.get(ActiveMatch, mid).status != 'finished':
+                    continue
+                missing = PlayerRecord.query.filter_by(match_id=mid, match_result=None).count()
+                if missing:
+                    sys.exit(f"ERRORE: partita {mid} finita con {missing} tiri senza match_result")
+            differences = check_scoreboards()
+            if differences:
+                sys.exit(f"ERRORE: tabellone non coerente con i record: {differences[:3]}")
+
+            # Salvataggio dello stato vivo: la riga deve coincidere con il motore
+            live = match_engine.peek(match_id)
+            match_engine.flush()
+            db.session.remove()
+            if live is not None:
+                row = db.session.get(ActiveMatch, match_id)
+                if tuple(getattr(row, name) for name in STATE_FIELDS) != live.values():
+                    sys.exit(f"ERRORE: stato salvato diverso dallo stato in memoria per la partita {match_id}")
+            db.session.remove()
+
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{'tiri':>6} {'partite':>8} {'cambi di fase':>14} {'query pre-scrittura':>20} {'commit/tiro':>12} "
+          f"{'media ms':>9} {'p95 ms':>8}")
+    print(f"{len(timings):>6} {len(match_ids):>8} {phase_shots:>14} {max_reads:>20} {EXPECTED_COMMITS:>12} "
+          f"{sum(timings) / len(timings):>9.2f} {p95:>8.2f}")
+    print("OK: risoluzione entro il limite di query, un commit per tiro, numeri di tiro, risultati e tabellone coerenti.")
+
+
+if __name__ == "__main__":
+    args = [int(x) for x in sys.argv[1:]]
+    main(args[0] if args else 200)
@@ -0,0 +1,141 @@
+"""
+Benchmark delle tre pagine /grafici: costo dei calcoli per pagina
+PRIMA (funzioni di stats_calculations sulle liste, come facevano le rotte)
+e DOPO (StatsEngine con un solo ShotFrame condiviso).
+
+Uso (dalla cartella del progetto):
+    python benchmarks/bench_grafici_pages.py [numero_tiri ...]
+"""
+import os
+import sys
+import random
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.getcwd())
+
+from app.main import stats_calculations as old
+from app.main.stats_engine import StatsEngine
+
+REPEAT = 5
+
+
+def generate_raw_stats(n_shots, seed=42):
+    """Liste grezze sintetiche (stesso formato di get_player_stats) per n_shots tiri."""
+    rnd = random.Random(seed)
+    keys = ["ids", "match_ids", "teammate_ids", "opponent1_ids", "opponent2_ids", "shot_numbers",
+            "miss", "bordo", "centro", "esito_label", "bicchiere_colpito", "cups_own", "cups_opp",
+            "match_date", "match_hour", "is_overtime", "match_result", "note", "tiro_salvezza",
+            "bicchieri_multipli", "formato", "postazione", "bevanda"]
+    lists = {k: [] for k in keys}
+    counts = {"tiri_totali": 0, "centri": 0, "bordi": 0, "miss": 0}
+
+    start_day = date(2024, 1, 1)
+    match_id = 0
+    shots_left = 0
+    for i in range(n_shots):
+        if shots_left == 0:
+            match_id += 1
+            shots_left = rnd.randint(15, 40)
+            shot_number = 0
+            match_day = (start_day + timedelta(days=match_id // 8)).isoformat()
+            hour = rnd.randint(18, 23)
+            result = rnd.choice(["Win", "Loss"])
+            teammate, opp1, opp2 = rnd.sample(range(2, 30), 3)
+            formato = rnd.choices(["Piramide", "Altro"], [70, 30])[0]
+            overtime = rnd.randint(1, 80) == 1
+        shots_left -= 1
+        shot_number += 1
+
+        esito = rnd.choices(["Miss", "Bordo", "Centro"], [40, 20, 40])[0]
+        counts["tiri_totali"] += 1
+        counts[{"Miss": "miss", "Bordo": "bordi", "Centro": "centri"}[esito]] += 1
+
+        lists["ids"].append(i + 1)
+        lists["match_ids"].append(match_id)
+        lists["teammate_ids"].append(teammate)
+        lists["opponent1_ids"].append(opp1)
+        lists["opponent2_ids"].append(opp2)
+        lists["shot_numbers"].append(shot_number)
+        lists["miss"].append("Sì" if esito == "Miss" else "No")
+        lists["bordo"].append("Sì" if esito == "Bordo" else "No")
+        lists["centro"].append("Sì" if esito == "Centro" else "No")
+        lists["esito_label"].append(esito)
+        lists["bicchiere_colpito"].append(rnd.choice(["3 Cen", "2 Dx", "1 Cen", "LV 1"]) if esito == "Centro" else "N/A")
+        lists["cups_own"].append(rnd.randint(1, 6))
+        lists["cups_opp"].append(rnd.randint(1, 6))
+        lists["match_date"].append(match_day)
+        lists["match_hour"].append(hour)
+        lists["is_overtime"].append(overtime)
+        lists["match_result"].append(result)
+        lists["note"].append("")
+        lists["tiro_salvezza"].append("Sì" if rnd.randint(1, 20) == 1 else "No")
+        lists["bicchieri_multipli"].append("Doppio" if rnd.randint(1, 100) == 1 else "-")
+        lists["formato"].append(formato)
+        lists["postazione"].append(rnd.choices(["Destra", "Sinistra", "Centrale"], [45, 45, 10])[0])
+        lists["bevanda"].append(rnd.choice(["Birra", "Vino", "Spritz"]))
+
+    counts["match_giocati_totali"] = match_id
+    counts["vittorie_totali"] = 0
+    return {"liste": lists, "conteggi": counts}
+
+
+def name_map_for(dati):
+    names = {str(i): f"Giocatore {i}" for i in range(2, 30)}
+    names.update({'0': '-', 'None': 'Nessuno'})
+    return names
+
+
+# --- PERCORSI "PRIMA" (identici alle rotte originali) ---
+
+def old_home(dati, names):
+    old.calculate_historical_percentages(dati)
+    old.calculate_daily_percentages(dati)
+    old.calculate_special_metrics(dati)
+    old.calculate_daily_trend(dati)
+    old.calculate_hourly_trend(dati)
+
+
+def old_extra(dati, names):
+    old.calculate_streak_metrics(dati)
+    partnerships = old.calculate_partnership_metrics(dati, names)
+    shot_metrics = old.calculate_shot_performance_metrics(dati)
+    old.calculate_insights(dati, partnerships, shot_metrics)
+    old.calculate_position_by_cups(dati)
+    old.calculate_comeback_and_flops(dati, names)
+    old.calculate_overtime_metrics(dati)
+    old.calculate_historical_percentages(dati)
+    old.calculate_daily_percentages(dati)
+
+
+def old_formati(dati, names):
+    old.calculate_success_by_opp_cups(dati)
+    old.calculate_format_heatmaps(dati)
+
+
+OLD_PAGES = {"home": old_home, "extra": old_extra, "formati": old_formati}
+
+
+def best_of(fn):
+    best = float("inf")
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main(sizes):
+    print(f"{'tiri':>8} {'pagina':>8} {'prima (ms)':>12} {'dopo (ms)':>12} {'speedup':>8}")
+    for n in sizes:
+        dati = generate_raw_stats(n)
+        names = name_map_for(dati)
+        for page, old_fn in OLD_PAGES.items():
+            before = best_of(lambda: old_fn(dati, names))
+            after = best_of(lambda: StatsEngine(dati, names).page(page))
+            print(f"{n:>8} {page:>8} {before:>12.2f} {after:>12.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [1000, 10000, 50000]
+    main(sizes)
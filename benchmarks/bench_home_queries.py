@@ -0,0 +1,177 @@
+"""
+Numero di query SQL per una visita alla lobby (/home).
+
+Crea un database SQLite temporaneo con N tavoli attivi (4 giocatori e alcuni
+tiri ciascuno) e M partite finite nelle ultime 24 ore, poi:
+1. verifica che punteggi e tiri per slot calcolati in blocco
+   (get_scores_for_matches / get_shot_counts_for_matches) e quelli salvati
+   sulla partita (backfill_scoreboards) siano identici al vecchio calcolo
+   partita per partita;
+2. conta le query eseguite da GET /home e controlla che NON crescano con il
+   numero di partite (nessun N+1) e restino sotto MAX_HOME_QUERIES.
+
+Uso (dalla cartella del progetto):
+    python benchmarks/bench_home_queries.py [tavoli_attivi] [partite_finite]
+Default: 10 tavoli attivi e 40 partite finite.
+"""
+import os
+import sys
+import random
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import event
+from app.models import db, Player, ActiveMatch, PlayerRecord
+from app.main.routes import get_score_points, get_shot_counts
+from app.main.scoreboard import (get_scores_for_matches, get_shot_counts_for_matches,
+                                 get_player_ids_by_name, backfill_scoreboards, MATCH_SLOTS)
+from benchmarks import temp_app, login
+
+# Query attese per /home, indipendenti dal numero di partite
+MAX_HOME_QUERIES = 8
+CUPS = ["1", "2 Sx", "2 Dx", "3 Sx", "3 Cen", "3 Dx", "4 Sx", "4 Dx", "5 Cen", "6"]
+
+
+# --- VECCHIO CALCOLO (una serie di query per ogni partita) ---
+
+def legacy_score_points(match):
+    t1_names = [n for n in [match.t1_p1, match.t1_p2] if n]
+    t2_names = [n for n in [match.t2_p1, match.t2_p2] if n]
+    t1_ids = [p.id for p in Player.query.filter(Player.name.in_(t1_names)).all()]
+    t2_ids = [p.id for p in Player.query.filter(Player.name.in_(t2_names)).all()]
+    hits = PlayerRecord.query.filter(PlayerRecord.match_id == match.id, PlayerRecord.centro == 'Sì',
+                                     PlayerRecord.timestamp >= match.start_time).all()
+    score_t1 = score_t2 = 0
+    for record in hits:
+        points = 1
+        if record.bicchiere_colpito:
+            cups_hit_list = [c for c in record.bicchiere_colpito.split(',') if c.strip()]
+            if len(cups_hit_list) > 1:
+                points = len(cups_hit_list)
+        if record.player_id in t1_ids:
+            score_t1 += points
+        elif record.player_id in t2_ids:
+            score_t2 += points
+    return score_t1, score_t2
+
+
+def legacy_count_shots(player_name, match_id):
+    if not player_name: return 0
+    player = Player.query.filter_by(name=player_name).first()
+    if not player: return 0
+    return PlayerRecord.query.filter_by(match_id=match_id, player_id=player.id).count()
+
+
+# --- DATI ---
+
+def populate(n_active, n_finished, seed=42):
+    rnd = random.Random(seed)
+    players = [Player(name=f"bench{i}", password="-") for i in range(1, 41)]
+    db.session.add_all(players)
+    db.session.commit()
+    names = [p.name for p in players]
+    ids = {p.name: p.id for p in players}
+    now = datetime.now()
+
+    def add_match(status, start, end, seats):
+        match = ActiveMatch(match_name=f"Tavolo {rnd.randint(1, 99)}", status=status,
+                            start_time=start, end_time=end,
+                            winning_team=rnd.choice(["t1", "t2", None]) if status == 'finished' else None,
+                            **dict(zip(MATCH_SLOTS, seats)))
+        db.session.add(match)
+        db.session.flush()
+        for slot, name in zip(MATCH_SLOTS, seats):
+            if not name or name == 'CLOSED':
+                continue
+            for shot in range(rnd.randint(0, 15)):
+                centro = rnd.random() < 0.4
+                # Alcuni tiri prima dello start_time (partita rigiocata): non contano nel punteggio
+                timestamp = start + timedelta(minutes=shot) if rnd.random() < 0.9 else start - timedelta(hours=1)
+                db.session.add(PlayerRecord(
+                    match_id=match.id, player_id=ids[name], shot_number=shot + 1,
+                    centro="Sì" if centro else "No", miss="No" if centro else "Sì", bordo="No",
+                    bicchiere_colpito=", ".join(rnd.sample(CUPS, rnd.choice([1, 1, 1, 2, 3]))) if centro else None,
+                    timestamp=timestamp))
+
+    for _ in range(n_active):
+        seats = rnd.sample(names, 4)
+        # Qualche posto vuoto o chiuso, come nei tavoli veri
+        if rnd.random() < 0.3:
+            seats[rnd.randrange(4)] = rnd.choice([None, 'CLOSED'])
+        add_match('running', now - timedelta(minutes=rnd.randint(5, 60)), None, seats)
+    for _ in range(n_finished):
+        end = now - timedelta(hours=rnd.uniform(0, 23))
+        add_match('finished', end - timedelta(minutes=20), end, rnd.sample(names, 4))
+    db.session.commit()
+    return players[0]
+
+
+def count_queries(fn):
+    queries = []
+    listener = lambda *args: queries.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    return len(queries)
+
+
+def home_queries(n_active, n_finished):
+    """(query di /home, query del vecchio calcolo, ms di /home) su un DB nuovo."""
+    with temp_app() as app:
+        with app.app_context():
+            user = populate(n_active, n_finished)
+            backfill_scoreboards()
+
+            # 1. Stesso risultato del vecchio calcolo
+            matches = ActiveMatch.query.all()
+            ids_by_name = get_player_ids_by_name(matches)
+            scores = get_scores_for_matches(matches, ids_by_name)
+            shots = get_shot_counts_for_matches(matches, ids_by_name)
+            for m in matches:
+                legacy_shots = {slot: legacy_count_shots(getattr(m, slot), m.id) for slot in MATCH_SLOTS}
+                if not (scores[m.id] == get_score_points(m) == legacy_score_points(m)):
+                    sys.exit(f"ERRORE: punteggio diverso per la partita {m.id}")
+                if not (shots[m.id] == get_shot_counts(m) == legacy_shots):
+                    sys.exit(f"ERRORE: tiri per slot diversi per la partita {m.id}")
+
+            legacy = count_queries(lambda: [
+                (legacy_score_points(m), [legacy_count_shots(getattr(m, s), m.id) for s in MATCH_SLOTS])
+                for m in matches if m.status != 'finished'] + [legacy_score_points(m) for m in matches
+                                                               if m.status == 'finished'])
+            user_id, user_name = user.id, user.name
+            db.session.remove()
+
+        client = login(app, user_id, user_name)
+
+        with app.app_context():
+            start = time.perf_counter()
+            result = {}
+            n = count_queries(lambda: result.setdefault("response", client.get('/home')))
+            elapsed = (time.perf_counter() - start) * 1000
+            if result["response"].status_code != 200:
+                sys.exit(f"ERRORE: /home ha risposto {result['response'].status_code}")
+            db.session.remove()
+    return n, legacy, elapsed
+
+
+def main(n_active, n_finished):
+    small = home_queries(1, 1)
+    large = home_queries(n_active, n_finished)
+    print(f"{'partite':>22} {'query /home':>12} {'vecchio calcolo':>16} {'ms':>8}")
+    print(f"{'1 attiva + 1 finita':>22} {small[0]:>12} {small[1]:>16} {small[2]:>8.1f}")
+    print(f"{f'{n_active} attive + {n_finished} finite':>22} {large[0]:>12} {large[1]:>16} {large[2]:>8.1f}")
+
+    if large[0] != small[0]:
+        sys.exit(f"ERRORE: le query di /home crescono con le partite ({small[0]} -> {large[0]})")
+    if large[0] > MAX_HOME_QUERIES:
+        sys.exit(f"ERRORE: /home esegue {large[0]} query (massimo {MAX_HOME_QUERIES})")
+    print("OK: numero di query costante, punteggi e tiri identici al vecchio calcolo.")
+
+
+if __name__ == "__main__":
+    args = [int(x) for x in sys.argv[1:]]
+    main(args[0] if args else 10, args[1] if len(args) > 1 else 40)
@@ -0,0 +1,220 @@
+"""
+Log degli eventi delle partite (match_log.py): replay e annullamento di un tiro.
+
+Crea un database SQLite temporaneo con quattro giocatori e gioca partite
+casuali attraverso le rotte (tiri con bicchieri e multipli, danni forzati,
+cambi di formato; a fine partita se ne apre un'altra), poi controlla che:
+1. per ogni evento lo stato ricostruito dalla fotografia più vicina sia
+   uguale al replay completo dalla prima;
+2. il replay dell'ultimo evento dia lo stato vivo (motore in memoria o riga);
+3. cancellando l'ultimo tiro di una partita in corso (POST /delete/...) lo
+   stato torni quello di prima del tiro;
+4. dopo un riavvio senza salvataggio delle righe (il salvataggio in
+   background è spento: le righe restano indietro), recover() ricostruisca
+   dal log lo stato vivo di prima e riscriva le righe.
+Ogni tanto, durante il gioco, l'ultimo tiro viene cancellato (controllo 3).
+Infine misura l'annullamento dell'ultimo tiro in una partita lunga (solo
+Miss) a diverse lunghezze: con le fotografie ogni SNAPSHOT_EVERY eventi il
+ricalcolo dello stato non cresce con il numero di eventi (la richiesta
+intera sì, di poco: rinumera i tiri rimasti del giocatore).
+
+Uso (dalla cartella del progetto):
+    python benchmarks/bench_match_events.py [tiri]
+Default: 300 tiri.
+"""
+import os
+import sys
+import json
+import random
+import time
+
+sys.path.append(os.getcwd())
+
+from app.models import db, Player, ActiveMatch, PlayerRecord, MatchEvent, CUP_DEFINITIONS
+from app.main.seat_index import seat_index
+from app.main.match_engine import match_engine
+from app.main.match_log import state_at, state_dict, SNAPSHOT_EVERY
+from benchmarks import temp_app, login, new_table
+
+FORMATS = ['Piramide', 'Rombo', 'Triangolo Piccolo', 'Linea']
+MULTIPLI = ['', '', '', 'Doppio', 'Triplo']
+LOG_LENGTHS = (SNAPSHOT_EVERY, 5 * SNAPSHOT_EVERY, 20 * SNAPSHOT_EVERY)
+
+
+def current_state(match_id):
+    """Stato vivo della partita: motore in memoria, o la riga se è finita."""
+    return state_dict(match_engine.peek(match_id) or db.session.get(ActiveMatch, match_id))
+
+
+def play(app, client, names, n_shots, rnd):
+    """
+    Gioca n_shots azioni casuali (ogni tanto cancellando l'ultimo tiro);
+    restituisce gli id delle partite giocate e il numero di tiri annullati.
+    """
+    with app.app_context():
+        match_ids = [new_table(names)]
+        db.session.remove()
+    undone = 0
+    for _ in range(n_shots):
+        shooter = rnd.choice(names)
+        with app.app_context():
+            match = db.session.get(ActiveMatch, match_ids[-1])
+            team = 't1' if shooter in (match.t1_p1, match.t1_p2) else 't2'
+            opp_format = getattr(match_engine.peek(match.id) or match, f"format_target_for_{'t2' if team == 't1' else 't1'}")
+            db.session.remove()
+
+        r = rnd.random()
+        if r < 0.05:
+            client.post(f'/force_update/{shooter}')
+        elif r < 0.1:
+            undone += undo_last_shot(app, client, match_ids[-1]) is not None
+        elif r < 0.15:
+            client.post(f'/add/{shooter}', data={'formato': rnd.choice(FORMATS)})
+        else:
+            cups = CUP_DEFINITIONS.get(opp_format) or ['1 Cen']
+            form = {'risultato_tiro': rnd.choice(['Centro', 'Centro', 'Miss', 'Bordo']), 'formato': opp_format,
+                    'postazione': 'Centro', 'bevanda': 'Birra', 'bicchieri_multipli': rnd.choice(MULTIPLI),
+                    'bicchiere_colpito': rnd.sample(cups, min(len(cups), rnd.choice([1, 1, 2])))}
+            client.post(f'/add/{shooter}', data=form)
+
+        with app.app_context():
+            if db.session.get(ActiveMatch, match_ids[-1]).status == 'finished':
+                match_ids.append(new_table(names))
+            db.session.remove()
+    return match_ids, undone
+
+
+def check_replays(match_ids):
+    """Controlli 1 e 2. Restituisce il numero di eventi controllati."""
+    checked = 0
+    for match_id in match_ids:
+        seqs = [seq for (seq,) in db.session.query(MatchEvent.seq).filter_by(match_id=match_id).order_by(MatchEvent.seq)]
+        for seq in seqs:
+            near = state_dict(state_at(match_id, seq))
+            full = state_dict(state_at(match_id, seq, from_first=True))
+            if near != full:
+                sys.exit(f"ERRORE: partita {match_id}, evento {seq}: fotografia {near} != replay completo {full}")
+            checked += 1
+        if state_dict(state_at(match_id)) != current_state(match_id):
+            sys.exit(f"ERRORE: partita {match_id}: il replay del log non dà lo stato vivo")
+    return checked
+
+
+def check_recover(match_ids):
+    """Controllo 4: riavvio come dopo un crash. Restituisce il numero di righe che erano indietro."""
+    live = {match_id: current_state(match_id) for match_id in match_ids if match_engine.peek(match_id)}
+    behind = sum(state_dict(db.session.get(ActiveMatch, match_id)) != state for match_id, state in live.items())
+    db.session.remove()
+    match_engine.recover()
+    db.session.remove()
+    for match_id, state in live.items():
+        if match_engine.peek(match_id) is None or state_dict(match_engine.peek(match_id)) != state:
+            sys.exit(f"ERRORE: partita {match_id}: dopo il riavvio lo stato non è quello di prima")
+        if state_dict(db.session.get(ActiveMatch, match_id)) != state:
+            sys.exit(f"ERRORE: partita {match_id}: dopo il riavvio la riga non è stata riscritta")
+    return behind
+
+
+def undo_last_shot(app, client, match_id):
+    """
+    Controllo 3: cancella l'ultimo tiro non annullato della partita e verifica lo stato.
+    Restituisce i millisecondi della richiesta (None se dopo quel tiro il log ha altri eventi).
+    """
+    with app.app_context():
+        events = MatchEvent.query.filter_by(match_id=match_id).order_by(MatchEvent.seq.desc()).all()
+        undone = {json.loads(event.payload)['seq'] for event in events if event.kind == 'undo'}
+        later = [event for event in events if event.kind != 'undo' and event.seq not in undone]
+        last = later[0] if later else None
+        if last is None or last.kind != 'shot':
+            db.session.remove()
+            return None
+        expected = state_dict(state_at(match_id, last.seq - 1))
+        record = db.session.get(PlayerRecord, last.record_id)
+        player_name = record.player.name
+        record_id = record.id
+        db.session.remove()
+
+    start = time.perf_counter()
+    response = client.post(f'/delete/{player_name}/{record_id}')
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code != 302:
+        sys.exit(f"ERRORE: cancellazione del tiro {record_id}: risposta {response.status_code}")
+
+    with app.app_context():
+        if current_state(match_id) != expected:
+            sys.exit(f"ERRORE: partita {match_id}: dopo la cancellazione dell'ultimo tiro lo stato non è quello di prima")
+        db.session.remove()
+    return elapsed
+
+
+def main(n_shots):
+    # Nessun salvataggio in background: le righe restano indietro (controllo 4)
+    with temp_app(MATCH_STATE_WRITE_BEHIND=3600) as app:
+        with app.app_context():
+            players = [Player(name=f"bench{i}", password="-", is_admin=(i == 1)) for i in range(1, 5)]
+            db.session.add_all(players)
+            db.session.commit()
+            names = [p.name for p in players]
+            admin_id = players[0].id
+            db.session.remove()
+
+        client = login(app, admin_id, names[0])
+
+        # 1-3: partite casuali
+        rnd = random.Random(42)
+        match_ids, undone = play(app, client, names, n_shots, rnd)
+        with app.app_context():
+            checked = check_replays(match_ids)
+            db.session.remove()
+
+        # 4: riavvio senza aver scritto le righe
+        with app.app_context():
+            behind = check_recover(match_ids)
+            db.session.remove()
+
+        # Annullamento in una partita lunga: il ricalcolo non dipende dalla lunghezza del log
+        with app.app_context():
+            last = db.session.get(ActiveMatch, match_ids[-1])
+            last.status = 'finished'
+            db.session.commit()
+            match_engine.discard(last.id)
+            seat_index.sync_match(last)
+            long_id = new_table(names)
+            db.session.remove()
+        timings = []
+        played = 0
+        for length in LOG_LENGTHS:
+            for _ in range(length - played):
+                client.post(f'/add/{names[played % 4]}',
+                            data={'risultato_tiro': 'Miss', 'formato': 'Piramide', 'postazione': 'Centro',
+                                  'bevanda': 'Birra', 'bicchieri_multipli': ''})
+                played += 1
+            replay = []
+            with app.app_context():
+                last_shot = MatchEvent.query.filter_by(match_id=long_id, kind='shot')\
+                    .order_by(MatchEvent.seq.desc()).first()
+                for _ in range(5):
+                    start = time.perf_counter()
+                    state_at(long_id, undo=last_shot.seq)
+                    replay.append((time.perf_counter() - start) * 1000)
+                db.session.remove()
+            requests = [undo_last_shot(app, client, long_id) for _ in range(5)]
+            played -= len(requests)
+            timings.append((length, sum(replay) / len(replay), sum(requests) / len(requests)))
+        with app.app_context():
+            check_replays([long_id])
+            db.session.remove()
+
+    print(f"{'partite':>8} {'eventi controllati':>19} {'tiri annullati':>15} {'righe riprese dal log':>22}")
+    print(f"{len(match_ids):>8} {checked:>19} {undone:>15} {behind:>22}")
+    print(f"{'tiri nella partita':>19} {'ricalcolo ms':>13} {'POST /delete ms':>16}")
+    for length, replay_ms, request_ms in timings:
+        print(f"{length:>19} {replay_ms:>13.2f} {request_ms:>16.2f}")
+    print("OK: fotografie e replay completo coincidono, il replay dà lo stato vivo, "
+          "l'annullamento dell'ultimo tiro ripristina lo stato precedente, "
+          "il riavvio riprende dal log lo stato non ancora scritto.")
+
+
+if __name__ == "__main__":
+    args = [int(x) for x in sys.argv[1:]]
+    main(args[0] if args else 300)
@@ -0,0 +1,106 @@
+"""
+Benchmark del caricamento dei tiri in get_player_stats: tempo e picco di
+memoria (tracemalloc) per un giocatore con molti tiri.
+
+Confronta:
+- ORM: il vecchio percorso (PlayerRecord.query...all(), tutte le colonne,
+  oggetti ORM con identity map)
+- Core, tutte le colonne: get_player_stats(player_id)
+- Core, colonne della pagina: get_player_stats(player_id, page_columns(pagina))
+
+Uso (dalla cartella del progetto):
+    python benchmarks/bench_projected_loading.py [numero_tiri]
+Default: 50.000 tiri.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.getcwd())
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func
+from app.models import db, PlayerRecord
+from app.main.stats_extraction import get_player_stats, LIST_COLUMNS
+from app.main.stats_engine import PAGE_SECTIONS, page_columns
+from bench_sql_pushdown import make_app, generate_records
+
+REPEAT = 3
+
+
+def orm_get_player_stats(player_id):
+    """Il vecchio caricamento: oggetti ORM completi, liste riempite record per record."""
+    records = PlayerRecord.query.filter_by(player_id=player_id).order_by(PlayerRecord.id.asc()).all()
+    lists = {k: [] for k in list(LIST_COLUMNS) + ["esito_label"]}
+    counts = {"tiri_totali": 0, "centri": 0, "bordi": 0, "miss": 0}
+    unique_match_ids = set()
+    for r in records:
+        counts["tiri_totali"] += 1
+        unique_match_ids.add(r.match_id)
+        if r.centro == "Sì":
+            counts["centri"] += 1; lists["esito_label"].append("Centro")
+        elif r.bordo == "Sì":
+            counts["bordi"] += 1; lists["esito_label"].append("Bordo")
+        else:
+            counts["miss"] += 1; lists["esito_label"].append("Miss")
+        for key, column in LIST_COLUMNS.items():
+            lists[key].append(getattr(r, column))
+    counts["match_giocati_totali"] = len(unique_match_ids)
+    counts["vittorie_totali"] = db.session.query(func.count(func.distinct(PlayerRecord.match_id)))\
+        .filter(PlayerRecord.player_id == player_id, PlayerRecord.match_result == 'Win').scalar() or 0
+    return {"liste": lists, "conteggi": counts}
+
+
+def measure(fn):
+    """(tempo migliore in ms, picco di memoria in MB)."""
+    best = float("inf")
+    for _ in range(REPEAT):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    db.session.expunge_all()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    db.session.expunge_all()
+    return best * 1000, peak / (1024 * 1024)
+
+
+def main(n_shots):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            generate_records(n_shots, 1)
+            player_id = 1
+
+            # Stesso output del vecchio percorso
+            if orm_get_player_stats(player_id) != get_player_stats(player_id):
+                print("ERRORE: get_player_stats diverso dal caricamento ORM")
+                sys.exit(1)
+
+            cases = [("ORM (tutte)", lambda: orm_get_player_stats(player_id)),
+                     ("Core (tutte)", lambda: get_player_stats(player_id))]
+            for page in PAGE_SECTIONS:
+                columns = page_columns(page)
+                cases.append((f"Core ({page})", lambda c=columns: get_player_stats(player_id, c)))
+
+            print(f"{n_shots} tiri per un giocatore")
+            print(f"{'caricamento':>16} {'ms':>10} {'picco MB':>10}")
+            base_ms, base_mb = None, None
+            for label, fn in cases:
+                ms, mb = measure(fn)
+                if base_ms is None:
+                    base_ms, base_mb = ms, mb
+                print(f"{label:>16} {ms:>10.1f} {mb:>10.1f}   ({base_ms / ms:.1f}x tempo, {base_mb / mb:.1f}x memoria)")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    main(n)
@@ -0,0 +1,152 @@
+"""
+Benchmark delle aggregazioni SQL (stats_queries) contro il percorso originale
+(get_player_stats + funzioni di stats_calculations sulle liste).
+
+Crea un database SQLite temporaneo con N record sintetici, verifica che i
+quattro grafici (trend giornaliero, trend orario, postazione per bicchieri,
+successo per bicchieri avversari) siano IDENTICI nei due percorsi e poi
+misura i tempi per un giocatore.
+
+Uso (dalla cartella del progetto):
+    python benchmarks/bench_sql_pushdown.py [numero_record] [numero_giocatori]
+Default: 1.000.000 record divisi su 4 giocatori.
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.getcwd())
+
+from flask import Flask
+from app.models import db, Player, PlayerRecord
+from app.main import stats_calculations as old
+from app.main import stats_queries as pushdown
+from app.main.stats_extraction import get_player_stats
+
+REPEAT = 3
+BATCH = 50_000
+
+# Note di esempio (la colonna 'note' è testo libero, spesso vuota)
+NOTES = ["", "", "", "Tiro al volo dopo il rimbalzo, il bicchiere ha girato due volte",
+         "Distratto dal pubblico", "Gran tiro sotto pressione nel finale di partita"]
+
+CHARTS = {
+    "trend_daily": (old.calculate_daily_trend, pushdown.calculate_daily_trend),
+    "trend_hourly": (old.calculate_hourly_trend, pushdown.calculate_hourly_trend),
+    "pos_by_cups": (old.calculate_position_by_cups, pushdown.calculate_position_by_cups),
+    "success_by_cups": (old.calculate_success_by_opp_cups, pushdown.calculate_success_by_opp_cups),
+}
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def generate_records(n_records, n_players, seed=42):
+    """Genera i record a blocchi (insert Core, senza oggetti ORM)."""
+    rnd = random.Random(seed)
+    db.session.add_all([Player(name=f"bench{i}", password="-") for i in range(1, n_players + 1)])
+    db.session.commit()
+
+    start_day = date(2023, 1, 1)
+    batch = []
+    match_id = 0
+    shots_left = 0
+    for i in range(n_records):
+        if shots_left == 0:
+            match_id += 1
+            shots_left = rnd.randint(40, 120)
+            match_day = (start_day + timedelta(days=match_id // 10)).isoformat()
+            hour = rnd.randint(17, 23)
+            result = rnd.choice(["Win", "Loss", None])
+            formato = rnd.choices(["Piramide", "Rombo", "Triangolo", "Altro", None], [50, 20, 15, 10, 5])[0]
+        shots_left -= 1
+
+        esito = rnd.choices(["Miss", "Bordo", "Centro"], [40, 20, 40])[0]
+        batch.append({
+            "match_id": None,
+            "player_id": rnd.randint(1, n_players),
+            "shot_number": rnd.randint(1, 30),
+            "miss": "Sì" if esito == "Miss" else "No",
+            "bordo": "Sì" if esito == "Bordo" else "No",
+            "centro": "Sì" if esito == "Centro" else "No",
+            "bicchiere_colpito": "N/A",
+            "cups_own": rnd.randint(0, 10),
+            "cups_opp": rnd.choice([None, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]),
+            "match_date": match_day,
+            "match_hour": hour,
+            "is_overtime": False,
+            "match_result": result,
+            "note": rnd.choice(NOTES),
+            "tiro_salvezza": "No",
+            "formato": formato,
+            "postazione": rnd.choice(["Sinistra", "Centrale", "Destra", "SX", "-", None]),
+            "bevanda": rnd.choice(["Birra", "Vino", "Acqua"]),
+        })
+        if len(batch) == BATCH:
+            db.session.execute(PlayerRecord.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(PlayerRecord.__table__.insert(), batch)
+    db.session.commit()
+
+
+def best_of(fn):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(n_records, n_players):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            generate_records(n_records, n_players)
+            print(f"Generati {n_records} record su {n_players} giocatori in {time.perf_counter() - start:.1f}s")
+
+            player_id = 1
+            n_shots = PlayerRecord.query.filter_by(player_id=player_id).count()
+
+            # 1. Verifica: output identici
+            dati = get_player_stats(player_id)
+            for name, (old_fn, new_fn) in CHARTS.items():
+                if old_fn(dati) != new_fn(player_id):
+                    print(f"ERRORE: output diverso per {name}")
+                    sys.exit(1)
+            print(f"Output identici per tutti i grafici ({n_shots} tiri del giocatore {player_id}).")
+
+            # 2. Tempi
+            def old_path():
+                data = get_player_stats(player_id)
+                for old_fn, _ in CHARTS.values():
+                    old_fn(data)
+
+            def new_path():
+                for _, new_fn in CHARTS.values():
+                    new_fn(player_id)
+
+            before = best_of(old_path)
+            after = best_of(new_path)
+            print(f"{'percorso':>10} {'ms':>10}")
+            print(f"{'prima':>10} {before:>10.1f}")
+            print(f"{'SQL':>10} {after:>10.1f}")
+            print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    args = [int(x) for x in sys.argv[1:]]
+    n_records = args[0] if args else 1_000_000
+    n_players = args[1] if len(args) > 1 else 4
+    main(n_records, n_players)
@@ -0,0 +1,237 @@
+"""
+Suite di benchmark per l'estrazione e i calcoli delle statistiche.
+
+Per ogni taglia (default 1k, 10k, 100k e 1M tiri) crea un database SQLite
+temporaneo, lo riempie con la stessa logica di populate_db_users_matches.py
+(seed fisso: i dati sono sempre identici) e misura separatamente:
+- get_player_stats (estrazione)
+- ogni calculate_* di stats_calculations (liste), stats_vectorized (ShotFrame),
+  stats_queries (GROUP BY in SQL) e stats_rollup (bucket aggregati)
+
+Per ciascuna funzione: tempo migliore su REPEAT esecuzioni e picco di memoria
+(tracemalloc, su un'esecuzione separata). I risultati vanno in un file JSON,
+da confrontare con un'esecuzione precedente tramite --compare.
+
+Uso (dalla cartella del progetto):
+    python -m benchmarks
+    python -m benchmarks --sizes 1k,10k --output risultati.json --compare vecchi.json
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+import sqlalchemy
+from faker import Faker
+from flask import Flask
+
+from app.models import db, Player
+from app.main import stats_calculations, stats_vectorized, stats_queries, stats_rollup
+from app.main.shot_frame import ShotFrame
+from app.main.stats_extraction import get_player_stats
+import populate_db_users_matches as populate
+
+DEFAULT_SIZES = "1k,10k,100k,1M"
+DEFAULT_REPEAT = 3
+SEED = 42
+# Data "di oggi" fissa: le date delle partite non dipendono da quando si lancia
+NOW = datetime(2025, 1, 1, 12, 0, 0)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Moduli con funzioni calculate_* e tipo di input che si aspettano
+MODULES = {
+    "stats_calculations": stats_calculations,
+    "stats_vectorized": stats_vectorized,
+    "stats_queries": stats_queries,
+    "stats_rollup": stats_rollup,
+}
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1M' -> 1000000."""
+    text = text.strip()
+    multiplier = {"k": 1_000, "K": 1_000, "m": 1_000_000, "M": 1_000_000}.get(text[-1:], 1)
+    number = text[:-1] if multiplier != 1 else text
+    return int(float(number) * multiplier)
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def populate_dataset(n_shots, seed=SEED):
+    """Giocatori + n_shots tiri per il primo admin, sempre uguali a parità di seed."""
+    Faker.seed(seed)
+    admins, npcs = populate.generate_admins_and_npcs()
+    player = admins[0]
+    populate.generate_stats_for_admin(player, admins + npcs, target_shots=n_shots,
+                                      rng=random.Random(seed), now=NOW)
+    stats_rollup.rebuild_rollups(player.id)
+    return player.id
+
+
+def measure(fn, repeat):
+    """(tempo migliore in ms, picco di memoria in MB)."""
+    best = float("inf")
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    db.session.expunge_all()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"ms": round(best * 1000, 3), "peak_mb": round(peak / (1024 * 1024), 3)}
+
+
+def calculate_functions(module):
+    return [(name, fn) for name, fn in inspect.getmembers(module, inspect.isfunction)
+            if name.startswith("calculate_") and fn.__module__ == module.__name__]
+
+
+def call_with(fn, inputs):
+    """Chiama fn passando per nome i parametri obbligatori presi da inputs."""
+    kwargs = {}
+    for name, param in inspect.signature(fn).parameters.items():
+        if name in inputs:
+            kwargs[name] = inputs[name]
+        elif param.default is inspect.Parameter.empty:
+            raise TypeError(f"{fn.__module__}.{fn.__name__}: parametro '{name}' non previsto dal benchmark")
+    return lambda: fn(**kwargs)
+
+
+def module_inputs(module_name, player_id, dati_grezzi, name_map):
+    """Input dei calculate_* di ciascun modulo (calcolati fuori dalla misura)."""
+    if module_name == "stats_calculations":
+        inputs = {"data": dati_grezzi, "name_map": name_map}
+    elif module_name == "stats_vectorized":
+        inputs = {"data": ShotFrame.from_lists(dati_grezzi["liste"]), "name_map": name_map}
+    elif module_name == "stats_queries":
+        return {"player_id": player_id}
+    else:
+        return {"trend_buckets": stats_rollup.load_buckets("trend", player_id),
+                "position_buckets": stats_rollup.load_buckets("position", player_id),
+                "format_buckets": stats_rollup.load_buckets("format", player_id),
+                "cup_buckets": stats_rollup.load_cup_buckets(player_id)}
+
+    # calculate_insights usa i risultati di altre due sezioni
+    module = MODULES[module_name]
+    inputs["partnerships"] = module.calculate_partnership_metrics(inputs["data"], name_map)
+    inputs["shot_metrics"] = module.calculate_shot_performance_metrics(inputs["data"])
+    return inputs
+
+
+def run_size(n_shots, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            player_id = populate_dataset(n_shots)
+            setup_s = time.perf_counter() - start
+
+            name_map = {str(p.id): p.name for p in Player.query.all()}
+            dati_grezzi = get_player_stats(player_id)
+
+            timings = {
+                "stats_extraction.get_player_stats": measure(lambda: get_player_stats(player_id), repeat),
+                "shot_frame.ShotFrame.from_lists": measure(lambda: ShotFrame.from_lists(dati_grezzi["liste"]), repeat),
+                "stats_rollup.load_buckets": measure(
+                    lambda: [stats_rollup.load_buckets(name, player_id) for name in stats_rollup.BUCKET_TABLES], repeat),
+            }
+            for module_name, module in MODULES.items():
+                inputs = module_inputs(module_name, player_id, dati_grezzi, name_map)
+                for name, fn in calculate_functions(module):
+                    timings[f"{module_name}.{name}"] = measure(call_with(fn, inputs), repeat)
+                    print(f"   {module_name}.{name:<40} {timings[f'{module_name}.{name}']['ms']:>10.1f} ms")
+            db.session.remove()
+
+    return {"n_shots": n_shots, "setup_s": round(setup_s, 2), "timings": timings}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    """Stampa il rapporto dei tempi rispetto a un file di risultati precedente."""
+    with open(previous_path) as f:
+        previous = json.load(f)["results"]
+    print(f"\nConfronto con {previous_path} (tempo precedente / attuale):")
+    for size, current in results.items():
+        old = previous.get(size)
+        if old is None:
+            continue
+        print(f"  {size} tiri")
+        for name, timing in current["timings"].items():
+            old_timing = old["timings"].get(name)
+            if old_timing and timing["ms"] > 0:
+                print(f"    {name:<55} {old_timing['ms']:>10.1f} -> {timing['ms']:>10.1f} ms"
+                      f"  ({old_timing['ms'] / timing['ms']:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark di estrazione e calcolo delle statistiche.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"taglie in tiri (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="esecuzioni per misura")
+    parser.add_argument("--output", help="file JSON dei risultati (default benchmarks/results/stats_<data>.json)")
+    parser.add_argument("--compare", help="file JSON di un'esecuzione precedente")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size_text in args.sizes.split(","):
+        n_shots = parse_size(size_text)
+        print(f"\n📊 {n_shots} tiri")
+        results[str(n_shots)] = run_size(n_shots, args.repeat)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"stats_{datetime.now():%Y%m%d_%H%M%S}.json")
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "seed": SEED,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sqlalchemy": sqlalchemy.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Risultati salvati in {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Il tracker (GET /tracker/<giocatore>) è in sola lettura.
+
+Crea un database SQLite temporaneo con un tavolo 2 contro 2 e lo porta, con
+i tiri, in una situazione con una transizione a catena: un Doppio sull'ultimo
+bicchiere manda l'avversario in redemption e subito dopo (bicchieri a -1)
+chiude la partita. Controlla che:
+1. la catena sia applicata dal tiro stesso (POST /add/...): partita finita
+   e Win/Loss anche sull'ultimo tiro, senza bisogno di aprire il tracker;
+2. in una partita in corso i tracker dei quattro giocatori, aperti da più
+   thread insieme (come i telefoni del tavolo e le due iframe della vista
+   squadre a ogni aggiornamento), non eseguano nessuna scrittura né commit.
+Stampa il numero di pagine servite e le pagine al secondo.
+
+Uso (dalla cartella del progetto):
+    python benchmarks/bench_tracker_view.py [thread] [pagine_per_thread]
+Default: 8 thread, 25 pagine ciascuno.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import event
+from app.models import db, Player, ActiveMatch, PlayerRecord, CUP_DEFINITIONS
+from app.main.match_engine import match_engine
+from benchmarks import temp_app, login, new_table
+
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+def check_chain(app, client, names):
+    """Controllo 1: redemption e fine partita nello stesso tiro."""
+    with app.app_context():
+        match_id = new_table(names)
+        db.session.remove()
+    single = CUP_DEFINITIONS['Singolo Centrale'][0]
+    client.post(f'/add/{names[0]}', data={'formato': 'Singolo Centrale'})
+    client.post(f'/add/{names[0]}', data={'risultato_tiro': 'Centro', 'formato': 'Singolo Centrale',
+                                          'bicchiere_colpito': [single], 'bicchieri_multipli': 'Doppio',
+                                          'postazione': 'Centro', 'bevanda': 'Birra'})
+    with app.app_context():
+        match = db.session.get(ActiveMatch, match_id)
+        results = [r.match_result for r in PlayerRecord.query.filter_by(match_id=match_id)]
+        if match.status != 'finished' or match.winning_team != 't1' or results != ['Win']:
+            sys.exit(f"ERRORE: catena non applicata dal tiro: {match.status}, {match.winning_team}, {results}")
+        db.session.remove()
+
+
+def main(n_threads, pages_per_thread):
+    with temp_app() as app:
+        with app.app_context():
+            players = [Player(name=f"bench{i}", password="-", is_admin=(i == 1)) for i in range(1, 5)]
+            db.session.add_all(players)
+            db.session.commit()
+            names = [p.name for p in players]
+            admin_id = players[0].id
+            db.session.remove()
+
+        client = login(app, admin_id, names[0])
+        check_chain(app, client, names)
+
+        # Partita in corso con qualche tiro, pendenti compresi
+        with app.app_context():
+            match_id = new_table(names)
+            db.session.remove()
+        for i, cup in enumerate(["3 Sx", "3 Cen", "2 Dx"]):
+            client.post(f'/add/{names[i % 4]}', data={'risultato_tiro': 'Centro', 'formato': 'Piramide',
+                                                      'bicchiere_colpito': [cup], 'bicchieri_multipli': '',
+                                                      'postazione': 'Centro', 'bevanda': 'Birra'})
+        with app.app_context():
+            match_engine.flush()
+            db.session.remove()
+
+        # Controllo 2: nessuna scrittura dai tracker aperti insieme
+        writes = []
+        commits = []
+        errors = []
+
+        def on_execute(conn, cursor, statement, *args):
+            if statement.lstrip().split(None, 1)[0].upper() in WRITES:
+                writes.append(statement)
+
+        def on_commit(conn):
+            commits.append(1)
+
+        def viewer(index):
+            viewer_client = login(app, admin_id, names[0])
+            for i in range(pages_per_thread):
+                response = viewer_client.get(f'/tracker/{names[(index + i) % 4]}')
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", on_execute)
+        event.listen(engine, "commit", on_commit)
+        threads = [threading.Thread(target=viewer, args=(i,)) for i in range(n_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        event.remove(engine, "before_cursor_execute", on_execute)
+        event.remove(engine, "commit", on_commit)
+
+        if errors:
+            sys.exit(f"ERRORE: risposte del tracker diverse da 200: {sorted(set(errors))}")
+        if writes or commits:
+            sys.exit(f"ERRORE: il tracker ha scritto nel DB: {len(writes)} scritture, {len(commits)} commit "
+                     f"({writes[:3]})")
+        with app.app_context():
+            if db.session.get(ActiveMatch, match_id).status != 'running':
+                sys.exit("ERRORE: la partita di prova non è più in corso")
+            db.session.remove()
+
+    pages = n_threads * pages_per_thread
+    print(f"{'thread':>7} {'pagine':>7} {'scritture':>10} {'commit':>7} {'pagine/s':>9}")
+    print(f"{n_threads:>7} {pages:>7} {len(writes):>10} {len(commits):>7} {pages / elapsed:>9.1f}")
+    print("OK: la catena di transizioni è applicata dal tiro, il tracker non scrive nel DB.")
+
+
+if __name__ == "__main__":
+    args = [int(x) for x in sys.argv[1:]]
+    main(*(args + [8, 25][len(args):]))
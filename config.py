@@ -8,4 +8,8 @@ class Config:
     
     # Crea il database dentro una cartella chiamata 'instance'
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'instance', 'beerpong.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Secondi tra un salvataggio in background e l'altro dello stato delle
+    # partite in corso (app/main/match_engine.py); 0 = salvataggio a ogni modifica
+    MATCH_STATE_WRITE_BEHIND = 2.0
\ No newline at end of file
@@ -27,6 +27,7 @@ fake = Faker('it_IT')
 ADMINS_CONFIG = ["prova1", "prova2", "prova3", "prova4"]
 COMMON_PASSWORD = "1234"
 TARGET_SHOTS_PER_ADMIN = 1000
+RECORD_BATCH_SIZE = 10_000  # Tiri inseriti per ogni INSERT multiplo
 
 # Definizioni bicchieri per coerenza
 CUPS_BY_FORMAT = {
@@ -49,12 +50,12 @@ def reset_database():
         print(f"   ❌ Errore reset: {e}")
         sys.exit(1)
 
-def get_weighted_choice(options, weights):
-    return random.choices(options, weights=weights, k=1)[0]
+def get_weighted_choice(options, weights, rng=random):
+    return rng.choices(options, weights=weights, k=1)[0]
 
-def boolean_choice(probability):
+def boolean_choice(probability, rng=random):
     """Restituisce True con una probabilità di 1/probability"""
-    return random.randint(1, probability) == 1
+    return rng.randint(1, probability) == 1
 
 def generate_admins_and_npcs():
     print(f"\n👤 STEP 1: Creazione prova e Giocatori NPC...")
@@ -86,40 +87,46 @@ def generate_admins_and_npcs():
     
     return all_admins, all_npcs
 
-def generate_stats_for_admin(admin_player, all_players_pool):
+def generate_stats_for_admin(admin_player, all_players_pool, target_shots=TARGET_SHOTS_PER_ADMIN,
+                             rng=random, now=None):
     """
-    Genera partite e tiri specifici per UN admin finché non arriva a 1000 tiri.
+    Genera partite e tiri specifici per UN admin finché non arriva a target_shots tiri.
+    Con rng = random.Random(seed) e now fisso i dati sono sempre gli stessi
+    (usato anche dai benchmark in benchmarks/). I tiri sono inseriti a blocchi
+    con INSERT multipli, senza creare un oggetto ORM per tiro.
     """
     current_shots = 0
     match_counter = 0
+    now = now or datetime.now()
+    pending_records = []
     
     print(f"   🎲 Generazione statistiche per {admin_player.name}...")
 
-    while current_shots < TARGET_SHOTS_PER_ADMIN:
+    while current_shots < target_shots:
         match_counter += 1
         
         # --- 1. SETUP PARTITA ---
         # Seleziona compagno e avversari casuali
         others = [p for p in all_players_pool if p.id != admin_player.id]
-        participants = random.sample(others, 3)
+        participants = rng.sample(others, 3)
         teammate = participants[0]
         opponent1 = participants[1]
         opponent2 = participants[2]
         
         # Parametri Match
-        match_date_obj = datetime.now() - timedelta(days=random.randint(0, 365)) # Ultimo anno
+        match_date_obj = now - timedelta(days=rng.randint(0, 365)) # Ultimo anno
         match_date_str = match_date_obj.strftime("%Y-%m-%d")
-        match_hour = random.randint(18, 23) # Orario serale verosimile
+        match_hour = rng.randint(18, 23) # Orario serale verosimile
         
         # Formato (70% Piramide, 30% Altro)
-        formato = get_weighted_choice(['Piramide', 'Altro'], [70, 30])
+        formato = get_weighted_choice(['Piramide', 'Altro'], [70, 30], rng)
         initial_cups = 10 if formato == 'Piramide' else 6
         
         # Overtime (1/80)
-        is_overtime = boolean_choice(80)
+        is_overtime = boolean_choice(80, rng)
         
         # Risultato Match (Win/Loss random 50/50 per variare)
-        match_result = random.choice(["Win", "Loss"])
+        match_result = rng.choice(["Win", "Loss"])
         winning_team = "t1" if match_result == "Win" else "t2"
         
         # Creiamo l'oggetto Match nel DB
@@ -141,11 +148,11 @@ def generate_stats_for_admin(admin_player, all_players_pool):
         
         # --- 2. SETUP TIRI ---
         # Tiri random tra 15 e 40
-        shots_in_this_match = random.randint(15, 40)
+        shots_in_this_match = rng.randint(15, 40)
         
-        # Se superiamo i 1000, tronchiamo all'esatto necessario
-        if current_shots + shots_in_this_match > TARGET_SHOTS_PER_ADMIN:
-            shots_in_this_match = TARGET_SHOTS_PER_ADMIN - current_shots
+        # Se superiamo il target, tronchiamo all'esatto necessario
+        if current_shots + shots_in_this_match > target_shots:
+            shots_in_this_match = target_shots - current_shots
 
         # --- 3. GENERAZIONE RECORD TIRI ---
         for shot_idx in range(1, shots_in_this_match + 1):
@@ -153,7 +160,7 @@ def generate_stats_for_admin(admin_player, all_players_pool):
             # -- Logica Esiti (Miss, Bordo, Centro) --
             # Definiamo probabilità base realistiche per variare
             # Es: 40% Miss, 20% Bordo, 40% Centro
-            outcome = get_weighted_choice(['miss', 'bordo', 'centro'], [40, 20, 40])
+            outcome = get_weighted_choice(['miss', 'bordo', 'centro'], [40, 20, 40], rng)
             
             miss_val, bordo_val, centro_val = "No", "No", "No"
             bicchiere_colpito = None
@@ -166,45 +173,47 @@ def generate_stats_for_admin(admin_player, all_players_pool):
                 centro_val = "Sì"
                 # Se è centro, colpisce un bicchiere coerente col formato
                 possible_cups = CUPS_BY_FORMAT.get(formato, ["Generico"])
-                bicchiere_colpito = random.choice(possible_cups)
+                bicchiere_colpito = rng.choice(possible_cups)
 
             # -- Logica Bicchieri Multipli (1/100 Doppio, 1/1000 Triplo) --
             multiplo = "-"
             # Nota: deve essere centro per fare multi hit? Tecnicamente sì nel gioco reale,
             # ma qui seguiamo la statistica pura. Lo mettiamo solo se è centro.
             if centro_val == "Sì":
-                if boolean_choice(1000):
+                if boolean_choice(1000, rng):
                     multiplo = "Triplo" # 3
-                elif boolean_choice(100):
+                elif boolean_choice(100, rng):
                     multiplo = "Doppio" # 2
             
             # -- Tiro Salvezza (1/20) --
-            is_salvezza = boolean_choice(20)
+            is_salvezza = boolean_choice(20, rng)
             salvezza_val = "Sì" if is_salvezza else "No"
 
             # -- Note (1/100) --
             nota_text = ""
-            if boolean_choice(100):
-                nota_text = random.choice(["Tiro fortunato", "Scivolato", "Distratto", "MVP"])
+            if boolean_choice(100, rng):
+                nota_text = rng.choice(["Tiro fortunato", "Scivolato", "Distratto", "MVP"])
             
             # -- Postazione (90% Lati, 10% Centro) --
             postazione = get_weighted_choice(
                 ['Destra', 'Sinistra', 'Centrale'], 
-                [45, 45, 10]
+                [45, 45, 10],
+                rng
             )
 
             # -- Bevanda (50% Birra, altri 10% ciascuno) --
             bevanda = get_weighted_choice(
                 ['Birra', 'Vino', 'Coca', 'Spritz', 'JagerBomb', 'GinTonic'],
-                [50, 10, 10, 10, 10, 10]
+                [50, 10, 10, 10, 10, 10],
+                rng
             )
 
             # -- Cups Own / Opp (Random 1-6) --
-            c_own = random.randint(1, 6)
-            c_opp = random.randint(1, 6)
+            c_own = rng.randint(1, 6)
+            c_opp = rng.randint(1, 6)
 
             # CREAZIONE RECORD
-            record = PlayerRecord(
+            record = dict(
                 match_id=match_db.id,
                 player_id=admin_player.id,
                 
@@ -237,11 +246,17 @@ def generate_stats_for_admin(admin_player, all_players_pool):
                 cups_own=c_own,
                 cups_opp=c_opp,
                 
-                timestamp=datetime.now()
+                timestamp=now
             )
-            db.session.add(record)
+            pending_records.append(record)
             current_shots += 1
 
+            if len(pending_records) >= RECORD_BATCH_SIZE:
+                db.session.execute(PlayerRecord.__table__.insert(), pending_records)
+                pending_records = []
+
+    if pending_records:
+        db.session.execute(PlayerRecord.__table__.insert(), pending_records)
     print(f"   ✅ {admin_player.name}: Raggiunti {current_shots} tiri.")
     db.session.commit()
 
@@ -269,4 +284,8 @@ if __name__ == "__main__":
         for admin in admins_list:
             generate_stats_for_admin(admin, all_players_pool)
 
+        # 4. Tabelle aggregate per i grafici
+        from app.main.stats_rollup import rebuild_rollups
+        rebuild_rollups()
+
         print("\n✨ Finito! Ora hai 4 prova con 1000 tiri esatti e statistiche realistiche.")
\ No newline at end of file